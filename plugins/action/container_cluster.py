@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2023 Illumio, Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+from ansible_collections.illumio.core.plugins.modules import container_cluster  # type: ignore
+from ansible_collections.illumio.core.plugins.plugin_utils.pce_action import PceActionBase  # type: ignore
+
+
+class ActionModule(PceActionBase):
+    MODULE = container_cluster
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2023 Illumio, Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+name: pce_stats
+type: aggregate
+short_description: Summarize Illumio PCE API call metrics
+description:
+  - Aggregates the C(pce_stats) metrics returned by C(illumio.core) modules for each play, host and API endpoint.
+  - Prints a summary table at the end of the playbook run and writes the full aggregate to a JSON file.
+  - Modules only return metrics when C(pce_stats) is set, or the C(ILLUMIO_PCE_STATS) environment variable is C(true).
+  - Task time spent outside of the module's PCE client is shown as overhead, to separate Ansible
+    execution time from time spent connecting to and waiting on the PCE.
+author:
+  - Duncan Sommerville (@dsommerville-illumio)
+version_added: "0.3.0"
+requirements:
+  - enable in configuration
+options:
+  output_path:
+    description:
+      - Path of the JSON file to write aggregated metrics to.
+      - Set to an empty string to disable writing the file.
+    type: path
+    default: pce_stats.json
+    env:
+      - name: ILLUMIO_PCE_STATS_OUTPUT
+    ini:
+      - section: callback_pce_stats
+        key: output_path
+  top_endpoints:
+    description:
+      - Number of API endpoints to show in the summary, ordered by total request time.
+    type: int
+    default: 10
+    env:
+      - name: ILLUMIO_PCE_STATS_TOP_ENDPOINTS
+    ini:
+      - section: callback_pce_stats
+        key: top_endpoints
+'''
+
+EXAMPLES = r'''
+# ansible.cfg
+# [defaults]
+# callbacks_enabled = illumio.core.pce_stats
+#
+# [callback_pce_stats]
+# output_path = /var/log/ansible/pce_stats.json
+
+# ILLUMIO_PCE_STATS=true ansible-playbook -i inventory site.yml
+'''
+
+import json
+import time
+
+from ansible.plugins.callback import CallbackBase
+
+COUNTERS = ['requests', 'retries', 'coalesced', 'bytes_sent', 'bytes_received', 'elapsed_ms', 'connect_ms', 'throttle_ms', 'api_ms']
+
+
+def _new_totals():
+    totals = dict.fromkeys(COUNTERS, 0)
+    totals.update(runs=0, task_ms=0, endpoints={})
+    return totals
+
+
+def _merge(totals, stats, task_ms):
+    for k in COUNTERS:
+        totals[k] += stats.get(k, 0)
+    totals['runs'] += 1
+    totals['task_ms'] += task_ms
+    for endpoint, e in (stats.get('endpoints') or {}).items():
+        t = totals['endpoints'].setdefault(endpoint, {
+            'requests': 0, 'total_ms': 0, 'max_ms': 0, 'histogram': [0] * len(e['histogram'])
+        })
+        t['requests'] += e['requests']
+        t['total_ms'] += e['total_ms']
+        t['max_ms'] = max(t['max_ms'], e['max_ms'])
+        t['histogram'] = [a + b for a, b in zip(t['histogram'], e['histogram'])]
+
+
+class CallbackModule(CallbackBase):
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'illumio.core.pce_stats'
+    CALLBACK_NEEDS_ENABLED = True
+
+    def __init__(self, display=None):
+        super(CallbackModule, self).__init__(display=display)
+        self._plays = []
+        self._play = None
+        self._task_start = {}
+        self._latency_buckets = None
+
+    def v2_playbook_on_play_start(self, play):
+        self._play = dict(name=play.get_name(), totals=_new_totals(), hosts={}, tasks={})
+        self._plays.append(self._play)
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self._task_start[task._uuid] = time.monotonic()
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self._task_start[task._uuid] = time.monotonic()
+
+    def _record(self, result):
+        if self._play is None:
+            return
+        # loop results carry stats for each item
+        items = result._result.get('results')
+        stats = [r['pce_stats'] for r in items if isinstance(r, dict) and r.get('pce_stats')] if items else []
+        if result._result.get('pce_stats'):
+            stats.append(result._result['pce_stats'])
+        if not stats:
+            return
+
+        task = result._task
+        start = self._task_start.get(task._uuid)
+        task_ms = (time.monotonic() - start) * 1000 if start else 0
+        host = result._host.get_name()
+        task_name = task.get_name()
+        for i, s in enumerate(stats):
+            self._latency_buckets = s.get('latency_buckets_ms', self._latency_buckets)
+            # the task time is only counted once for looped tasks
+            t = task_ms if i == 0 else 0
+            _merge(self._play['totals'], s, t)
+            _merge(self._play['hosts'].setdefault(host, _new_totals()), s, t)
+            _merge(self._play['tasks'].setdefault(task_name, _new_totals()), s, t)
+
+    def v2_runner_on_ok(self, result):
+        self._record(result)
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._record(result)
+
+    def v2_playbook_on_stats(self, stats):
+        plays = [p for p in self._plays if p['totals']['runs']]
+        if not plays:
+            return
+
+        self._display.banner('PCE API STATS')
+        top = self.get_option('top_endpoints')
+        for play in plays:
+            self._display.display('PLAY [%s]' % (play['name']))
+            self._display.display(self._table(
+                ['host', 'runs', 'requests', 'retries', 'coalesced', 'sent', 'received', 'connect ms', 'throttle ms', 'api ms', 'overhead ms'],
+                [[host] + self._row(t) for host, t in sorted(play['hosts'].items())]
+            ))
+            self._display.display(self._table(
+                ['task', 'runs', 'requests', 'retries', 'coalesced', 'sent', 'received', 'connect ms', 'throttle ms', 'api ms', 'overhead ms'],
+                [[name] + self._row(t) for name, t in sorted(
+                    play['tasks'].items(), key=lambda i: i[1]['task_ms'], reverse=True
+                )]
+            ))
+            endpoints = sorted(play['totals']['endpoints'].items(), key=lambda i: i[1]['total_ms'], reverse=True)[:top]
+            self._display.display(self._table(
+                ['endpoint', 'requests', 'total ms', 'avg ms', 'max ms'],
+                [[k, e['requests'], '%.1f' % e['total_ms'], '%.1f' % (e['total_ms'] / e['requests']), '%.1f' % e['max_ms']]
+                 for k, e in endpoints]
+            ))
+
+        output_path = self.get_option('output_path')
+        if output_path:
+            with open(output_path, 'w') as f:
+                json.dump(dict(latency_buckets_ms=self._latency_buckets, plays=plays), f, indent=2)
+            self._display.display('PCE API stats written to %s' % (output_path))
+
+    @staticmethod
+    def _row(t):
+        # overhead is the task time spent outside of the module's PCE client,
+        # such as fork scheduling, module transfer and interpreter startup
+        overhead = max(t['task_ms'] - t['elapsed_ms'], 0) if t['task_ms'] else 0
+        return [
+            t['runs'], t['requests'], t['retries'], t['coalesced'], t['bytes_sent'], t['bytes_received'],
+            '%.1f' % t['connect_ms'], '%.1f' % t['throttle_ms'], '%.1f' % t['api_ms'], '%.1f' % overhead
+        ]
+
+    @staticmethod
+    def _table(header, rows):
+        rows = [[str(c) for c in row] for row in [header] + rows]
+        widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+        lines = ['  '.join(c.ljust(w) if i == 0 else c.rjust(w) for i, (c, w) in enumerate(zip(row, widths))) for row in rows]
+        lines.insert(1, '  '.join('-' * w for w in widths))
+        return '\n'.join(lines) + '\n'
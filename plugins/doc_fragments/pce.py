@@ -15,9 +15,9 @@ options:
       - URL or FQDN of Illumio Policy Compute Engine.
         C(pce_url) is an alias for C(pce_hostname).
       - Can be set with the environment variable C(ILLUMIO_PCE_HOST).
+      - Required unless the task runs over an C(illumio.core.pce) httpapi connection.
     type: str
     aliases: [ pce_url ]
-    required: true
   pce_port:
     description:
       - HTTP(S) port used by the PCE.
@@ -34,14 +34,14 @@ options:
     description:
       - Illumio PCE API key username.
       - Can be set with the environment variable C(ILLUMIO_API_KEY_USERNAME).
+      - Required unless the task runs over an C(illumio.core.pce) httpapi connection.
     type: str
-    required: true
   api_key_secret:
     description:
       - Illumio PCE API key secret.
       - Can be set with the environment variable C(ILLUMIO_API_KEY_SECRET).
+      - Required unless the task runs over an C(illumio.core.pce) httpapi connection.
     type: str
-    required: true
   pce_tls_verify:
     description:
       - Flag denoting whether TLS verification should be enabled on the PCE connection.
@@ -68,4 +68,56 @@ options:
       - HTTPS proxy server to use when connecting to the PCE.
       - If not set, it will use the default C(https_proxy) environment variable.
     type: str
+  pce_cache_ttl:
+    description:
+      - Number of seconds to cache name and key/value lookups of PCE objects on the controller.
+      - Cached lookups are shared between tasks and hosts, and are cleared whenever a module in this collection modifies an object of the same type.
+      - Lookups are answered from the cache without sending a request to the PCE, so changes made outside of this collection
+        may not be seen until the cached lookups expire.
+      - Set to C(0) to disable caching.
+      - Can be set with the environment variable C(ILLUMIO_PCE_CACHE_TTL).
+    type: int
+    default: 0
+  pce_cache_dir:
+    description:
+      - Directory on the controller used to store state shared between tasks, such as cached HREF lookups.
+      - Defaults to a user-specific directory under the system temporary directory.
+      - The directory is created if it doesn't exist. Modules fail if it isn't owned by the user running them,
+        or if its mode isn't C(0700), as it can hold cached PCE objects and pairing keys.
+      - Can be set with the environment variable C(ILLUMIO_PCE_CACHE_DIR).
+    type: path
+  pce_rate_limit:
+    description:
+      - Maximum number of requests per second to send to the PCE for each API user.
+      - The limit is shared by all forks on the controller, so large plays stay below the PCE API rate limits.
+      - Set to C(0) to disable rate limiting.
+      - Can be set with the environment variable C(ILLUMIO_PCE_RATE_LIMIT).
+    type: float
+    default: 0
+  pce_max_retries:
+    description:
+      - Number of times to retry a request rejected by the PCE with C(429 Too Many Requests).
+      - Retries wait for the C(Retry-After) time given by the PCE, or back off exponentially with jitter if it isn't set.
+      - Can be set with the environment variable C(ILLUMIO_PCE_MAX_RETRIES).
+    type: int
+    default: 5
+  pce_stats:
+    description:
+      - Flag denoting whether to return PCE API call metrics for the task in C(pce_stats).
+      - Metrics include request, retry and coalesced request counts, bytes sent and received, connection and
+        rate limiting time, and a latency histogram for each API endpoint.
+      - Use the C(illumio.core.pce_stats) callback plugin to summarize metrics for a playbook run.
+      - Can be set with the environment variable C(ILLUMIO_PCE_STATS).
+    type: bool
+    default: false
+  pce_coalesce_requests:
+    description:
+      - Flag denoting whether identical GET requests sent at the same time by different forks share a single request to the PCE.
+      - The first fork to send a request holds a lock on the controller until it completes, and forks sending the same request
+        in the meantime are given its response. Responses are never reused for requests sent after they completed.
+      - Responses are only shared between forks using the same API key for the same PCE and org,
+        and are stored in the C(pce_cache_dir) directory while they can be shared.
+      - Can be set with the environment variable C(ILLUMIO_PCE_COALESCE_REQUESTS).
+    type: bool
+    default: false
 '''
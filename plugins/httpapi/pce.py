@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2023 Illumio, Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+name: pce
+short_description: HttpApi plugin for the Illumio PCE
+description:
+  - Keeps a single authenticated session to the Illumio PCE open for the lifetime of the
+    persistent connection, so TLS handshakes and connection checks happen once per play rather than once per task.
+  - Modules in the C(illumio.core) collection send their API requests through this connection
+    when run against a host with C(ansible_connection=ansible.netcommon.httpapi) and
+    C(ansible_network_os=illumio.core.pce). The C(pce_*) and C(api_key_*) module options are ignored in this case.
+  - The PCE hostname and port are taken from C(ansible_host) and C(ansible_httpapi_port), and the API key
+    username and secret from C(ansible_user) and C(ansible_httpapi_password).
+author:
+  - Duncan Sommerville (@dsommerville-illumio)
+requirements:
+  - "python>=3.8"
+  - "illumio>=1.1.3"
+version_added: "0.3.0"
+
+options:
+  pce_org_id:
+    description:
+      - PCE Organization ID.
+    type: int
+    default: 1
+    env:
+      - name: ILLUMIO_PCE_ORG_ID
+    vars:
+      - name: ansible_httpapi_pce_org_id
+  pce_http_proxy:
+    description:
+      - HTTP proxy server to use when connecting to the PCE.
+      - If not set, it will use the default C(http_proxy) environment variable.
+    type: str
+    vars:
+      - name: ansible_httpapi_pce_http_proxy
+  pce_https_proxy:
+    description:
+      - HTTPS proxy server to use when connecting to the PCE.
+      - If not set, it will use the default C(https_proxy) environment variable.
+    type: str
+    vars:
+      - name: ansible_httpapi_pce_https_proxy
+'''
+
+EXAMPLES = r'''
+# inventory
+# [pce]
+# pce.company.com
+#
+# [pce:vars]
+# ansible_connection=ansible.netcommon.httpapi
+# ansible_network_os=illumio.core.pce
+# ansible_httpapi_use_ssl=true
+# ansible_httpapi_port=8443
+# ansible_httpapi_pce_org_id=1
+# ansible_user=api_1234567890abcdef
+# ansible_httpapi_password=...
+
+- name: "Create pairing profile over the persistent PCE connection"
+  illumio.core.pairing_profile:
+    name: PP-ANSIBLE
+    state: present
+  delegate_to: pce.company.com
+'''
+
+import json
+from urllib.parse import urlsplit, urlunsplit
+
+from ansible.module_utils.connection import ConnectionError
+from ansible.plugins.httpapi import HttpApiBase
+from ansible_collections.illumio.core.plugins.module_utils.pce import credential_digest, mount_retry_adapter  # type: ignore
+
+try:
+    from illumio import PolicyComputeEngine, IllumioApiException
+except ImportError:
+    PolicyComputeEngine = None
+
+
+class HttpApi(HttpApiBase):
+    def __init__(self, connection):
+        super(HttpApi, self).__init__(connection)
+        self._pce = None
+
+    def _connection_option(self, name, default=None):
+        # older versions of ansible.netcommon don't define all TLS options
+        try:
+            value = self.connection.get_option(name)
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def _connect(self):
+        if self._pce is not None:
+            return self._pce
+
+        if not PolicyComputeEngine:
+            raise ConnectionError("The illumio python library is required for the illumio.core.pce httpapi plugin")
+
+        scheme = 'https' if self._connection_option('use_ssl') else 'http'
+        hostname = '%s://%s' % (scheme, self._connection_option('host'))
+        port = self._connection_option('port') or (443 if scheme == 'https' else 80)
+
+        pce = PolicyComputeEngine(hostname, port=port, org_id=self.get_option('pce_org_id'))
+        pce.set_credentials(
+            self._connection_option('remote_user'),
+            self._connection_option('password')
+        )
+
+        client_cert = self._connection_option('client_cert')
+        client_key = self._connection_option('client_key')
+        pce.set_tls_settings(
+            verify=self._connection_option('ca_path') or self._connection_option('validate_certs', True),
+            cert=(client_cert, client_key) if client_cert and client_key else client_cert
+        )
+
+        http_proxy = self.get_option('pce_http_proxy')
+        https_proxy = self.get_option('pce_https_proxy')
+        if http_proxy or https_proxy:
+            pce.set_proxies(http_proxy=http_proxy, https_proxy=https_proxy)
+        if not self._connection_option('use_proxy', True):
+            pce._session.trust_env = False
+
+        # leave 429 responses to the module, which shares its backoff across forks
+        mount_retry_adapter(pce._session)
+
+        try:
+            pce.must_connect()
+        except IllumioApiException as e:
+            raise ConnectionError("Failed to establish a connection to the PCE: %s" % (e))
+
+        self.connection.queue_message('vvvv', 'established PCE session to %s:%s' % (hostname, port))
+        self._pce = pce
+        return pce
+
+    def logout(self):
+        if self._pce is not None:
+            self._pce._session.close()
+            self._pce = None
+
+    def get_pce_settings(self):
+        """Returns the connection values modules need to build request URLs."""
+        pce = self._connect()
+        return dict(
+            hostname='%s://%s' % (pce._scheme, pce._hostname),
+            port=pce._port,
+            org_id=pce.org_id,
+            api_key_username=self._connection_option('remote_user'),
+            # identifies the API key to modules without sending them the secret
+            credential_id=credential_digest(self._connection_option('remote_user'), self._connection_option('password'))
+        )
+
+    def send_pce_request(self, method, url, **kwargs):
+        """Sends a request over the persistent PCE session.
+
+        Only the path and query of the given URL are used, so requests can't
+        be redirected away from the configured PCE.
+
+        Returns:
+            dict: the response status, reason, headers and body text.
+        """
+        pce = self._connect()
+        parts = urlsplit(url)
+        url = urlunsplit((pce._scheme, '%s:%s' % (pce._hostname, pce._port), parts.path, parts.query, ''))
+        kwargs['timeout'] = kwargs.get('timeout', pce._timeout)
+
+        try:
+            response = pce._session.request(method, url, **kwargs)
+        except Exception as e:
+            raise ConnectionError("PCE request failed: %s" % (e))
+
+        self.connection.queue_message('vvvv', '%s %s: %s' % (method, parts.path, response.status_code))
+        return dict(
+            status_code=response.status_code,
+            reason=response.reason,
+            headers=dict(response.headers),
+            content=response.text
+        )
+
+    def handle_httperror(self, exc):
+        # requests are sent with the illumio session rather than
+        # Connection.send, so HTTP errors are returned to the caller
+        return False
+
+    def send_request(self, data, **message_kwargs):
+        method = message_kwargs.get('method', 'GET')
+        path = message_kwargs.get('path', '/')
+        response = self.send_pce_request(method, path, json=json.loads(data) if data else None)
+        return response['content']
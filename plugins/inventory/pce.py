@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2023 Illumio, Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+name: pce
+short_description: Illumio PCE workload inventory source
+description:
+  - Builds an inventory of workloads from the Illumio PCE.
+  - Uses an inventory file ending in C(pce.yml), C(pce.yaml), C(illumio.yml) or C(illumio.yaml).
+  - Workloads are fetched synchronously when the number of results fits within C(max_results),
+    and with a PCE asynchronous collection job otherwise. Async job results are decoded as they are
+    streamed, so memory use stays flat for large collections.
+  - Groups are created for each label assigned to a workload, named C(<key>_<value>).
+  - When the inventory cache is enabled, cached results are revalidated by fetching only workloads
+    updated since the last run. If the workload count no longer matches, for example because workloads
+    were removed, or the last full fetch is older than C(full_refresh_interval), the full inventory is fetched again.
+author:
+  - Duncan Sommerville (@dsommerville-illumio)
+requirements:
+  - "python>=3.8"
+  - "illumio>=1.1.3"
+version_added: "0.3.0"
+
+extends_documentation_fragment:
+  - constructed
+  - inventory_cache
+
+options:
+  plugin:
+    description: Token that ensures this is a source file for the plugin.
+    type: str
+    required: true
+    choices: ['illumio.core.pce']
+  pce_hostname:
+    description:
+      - URL or FQDN of Illumio Policy Compute Engine.
+    type: str
+    required: true
+    aliases: [ pce_url ]
+    env:
+      - name: ILLUMIO_PCE_HOST
+  pce_port:
+    description:
+      - HTTP(S) port used by the PCE.
+    type: int
+    default: 443
+    env:
+      - name: ILLUMIO_PCE_PORT
+  pce_org_id:
+    description:
+      - PCE Organization ID.
+    type: int
+    default: 1
+    env:
+      - name: ILLUMIO_PCE_ORG_ID
+  api_key_username:
+    description:
+      - Illumio PCE API key username.
+    type: str
+    required: true
+    env:
+      - name: ILLUMIO_API_KEY_USERNAME
+  api_key_secret:
+    description:
+      - Illumio PCE API key secret.
+    type: str
+    required: true
+    env:
+      - name: ILLUMIO_API_KEY_SECRET
+  pce_tls_verify:
+    description:
+      - Flag denoting whether TLS verification should be enabled on the PCE connection.
+    type: bool
+    default: true
+  pce_tls_ca:
+    description:
+      - Path to a custom root CA certificate bundle to use for the PCE connection.
+      - If set, overrides C(pce_tls_verify).
+    type: str
+  pce_tls_client_certs:
+    description:
+      - Optional paths to client-side certificate files.
+      - May point to separate cert and private key files or a PEM bundle containing both.
+    type: list
+    elements: str
+  pce_http_proxy:
+    description:
+      - HTTP proxy server to use when connecting to the PCE.
+      - If not set, it will use the default C(http_proxy) environment variable.
+    type: str
+  pce_https_proxy:
+    description:
+      - HTTPS proxy server to use when connecting to the PCE.
+      - If not set, it will use the default C(https_proxy) environment variable.
+    type: str
+  filters:
+    description:
+      - Query parameters used to filter the workloads returned by the PCE.
+      - See the PCE REST API documentation for the parameters supported by the C(/workloads) endpoint.
+    type: dict
+    default: {}
+  hostnames:
+    description:
+      - Ordered list of workload fields used to set the inventory hostname.
+      - The first field with a non-empty value is used.
+    type: list
+    elements: str
+    default: ['hostname', 'name', 'href']
+  label_groups:
+    description:
+      - Flag denoting whether to create a group for each workload label.
+    type: bool
+    default: true
+  max_results:
+    description:
+      - Maximum number of workloads the PCE returns from a synchronous request.
+      - Larger collections are fetched with an asynchronous collection job.
+    type: int
+    default: 500
+  incremental:
+    description:
+      - Flag denoting whether cached inventory is revalidated using the workload C(updated_at) field.
+      - If C(false), cached inventory is used as-is until it expires.
+      - Has no effect unless the inventory cache is enabled.
+    type: bool
+    default: true
+  full_refresh_interval:
+    description:
+      - Maximum age in seconds of the last full fetch before incremental revalidation fetches the full inventory again.
+      - Workload changes that don't update the C(updated_at) field, such as a removed workload being offset by one
+        that starts to match C(filters), can only be detected by a full fetch.
+      - Set to C(0) to fetch the full inventory every time the cached inventory is revalidated.
+      - Has no effect unless C(incremental) is set and the inventory cache is enabled.
+    type: int
+    default: 3600
+'''
+
+EXAMPLES = r'''
+# pce.yml
+plugin: illumio.core.pce
+pce_hostname: pce.company.com
+pce_port: 8443
+filters:
+  managed: true
+keyed_groups:
+  - key: illumio_enforcement_mode
+    prefix: enforcement
+compose:
+  ansible_host: illumio_interfaces[0].address
+
+# pce.yml with caching and incremental revalidation
+plugin: illumio.core.pce
+cache: true
+cache_plugin: ansible.builtin.jsonfile
+cache_connection: ~/.cache/illumio/inventory
+cache_timeout: 86400
+'''
+
+import sys
+import time
+import traceback
+
+from ansible.errors import AnsibleError
+from ansible.module_utils.common.text.converters import to_native
+from ansible.plugins.inventory import BaseInventoryPlugin, Constructable, Cacheable
+from ansible_collections.illumio.core.plugins.module_utils.pce import count_collection, iter_collection  # type: ignore
+
+IMPORT_ERROR_TRACEBACK = ''
+
+try:
+    from illumio import PolicyComputeEngine
+except ImportError:
+    PolicyComputeEngine = None
+    IMPORT_ERROR_TRACEBACK = ''.join(traceback.format_tb(sys.exc_info()[2]))
+
+# workload fields kept in the cache and exposed as host vars with an illumio_ prefix
+WORKLOAD_FIELDS = [
+    'href', 'name', 'hostname', 'description', 'public_ip', 'interfaces', 'online',
+    'enforcement_mode', 'visibility_level', 'os_id', 'os_detail', 'updated_at'
+]
+
+
+class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
+
+    NAME = 'illumio.core.pce'
+
+    def verify_file(self, path):
+        valid_suffixes = ('pce.yml', 'pce.yaml', 'illumio.yml', 'illumio.yaml')
+        return super(InventoryModule, self).verify_file(path) and path.endswith(valid_suffixes)
+
+    def parse(self, inventory, loader, path, cache=True):
+        super(InventoryModule, self).parse(inventory, loader, path, cache=cache)
+
+        if not PolicyComputeEngine:
+            raise AnsibleError(
+                'The illumio python library is required for the illumio.core.pce inventory plugin: %s' % (IMPORT_ERROR_TRACEBACK)
+            )
+
+        self._read_config_data(path)
+        self._pce = self._connect()
+
+        cache_key = self.get_cache_key(path)
+        user_cache_setting = self.get_option('cache')
+        cached = None
+        if user_cache_setting and cache:
+            try:
+                cached = self._cache[cache_key]
+            except KeyError:
+                pass
+
+        if cached is not None and not self.get_option('incremental'):
+            results = cached
+        else:
+            results = self._fetch(cached)
+
+        if user_cache_setting:
+            self._cache[cache_key] = results
+
+        self._populate(results)
+
+    def _connect(self):
+        pce_tls_client_certs = self.get_option('pce_tls_client_certs')
+        if pce_tls_client_certs:
+            # per requests cert formatting, use the str if only one
+            # path is given, otherwise bundle paths as a tuple
+            if len(pce_tls_client_certs) == 1:
+                pce_tls_client_certs = pce_tls_client_certs[0]
+            else:
+                pce_tls_client_certs = tuple(pce_tls_client_certs)
+
+        pce = PolicyComputeEngine(
+            self.get_option('pce_hostname'),
+            port=self.get_option('pce_port'),
+            org_id=self.get_option('pce_org_id')
+        )
+        pce.set_credentials(self.get_option('api_key_username'), self.get_option('api_key_secret'))
+        pce.set_tls_settings(
+            verify=self.get_option('pce_tls_ca') or self.get_option('pce_tls_verify'),
+            cert=pce_tls_client_certs
+        )
+
+        pce_http_proxy = self.get_option('pce_http_proxy')
+        pce_https_proxy = self.get_option('pce_https_proxy')
+        if pce_http_proxy or pce_https_proxy:
+            pce.set_proxies(http_proxy=pce_http_proxy, https_proxy=pce_https_proxy)
+        return pce
+
+    def _fetch(self, cached=None):
+        """Fetches the label catalog and workloads from the PCE. If cached
+        results are given, only workloads updated since the cached results
+        were fetched are requested and merged into them, unless the last
+        full fetch is older than full_refresh_interval."""
+        now = time.time()
+        fetched_at = cached.get('fetched_at') if cached else None
+        if cached and (fetched_at is None or now - fetched_at >= self.get_option('full_refresh_interval')):
+            self.display.vvv('Last full PCE inventory fetch is older than full_refresh_interval, fetching full inventory')
+            cached = None
+        try:
+            labels = {o['href']: {'key': o['key'], 'value': o['value']} for o in self._get_collection('/labels')}
+
+            # the PCE expects lowercase boolean query values
+            filters = {k: str(v).lower() if isinstance(v, bool) else v for k, v in self.get_option('filters').items()}
+            if cached and cached.get('updated_at'):
+                total = count_collection(self._pce, '/workloads', filters)
+                workloads = dict(cached['workloads'])
+                updates = self._get_collection('/workloads', {**filters, 'updated_at[gte]': cached['updated_at']})
+                workloads.update((o['href'], self._reduce_workload(o)) for o in updates)
+                if len(workloads) != total:
+                    # workloads were removed or no longer match the filters,
+                    # which can't be detected from updated_at, so start over
+                    self.display.vvv('PCE workload count changed, fetching full inventory')
+                    workloads = None
+            else:
+                workloads = None
+
+            if workloads is None:
+                workloads = {o['href']: self._reduce_workload(o) for o in self._get_collection('/workloads', filters)}
+                fetched_at = now
+        except Exception as e:
+            raise AnsibleError('Failed to fetch inventory from the PCE: %s' % (to_native(e)))
+
+        updated_at = max((o.get('updated_at') or '' for o in workloads.values()), default='')
+        return dict(fetched_at=fetched_at, updated_at=updated_at, labels=labels, workloads=workloads)
+
+    def _get_collection(self, endpoint, params=None):
+        return iter_collection(self._pce, endpoint, params, threshold=self.get_option('max_results'))
+
+    def _reduce_workload(self, workload):
+        o = {k: workload.get(k) for k in WORKLOAD_FIELDS}
+        o['label_hrefs'] = [label['href'] for label in workload.get('labels') or []]
+        o['managed'] = bool(workload.get('ven') or workload.get('agent'))
+        return o
+
+    def _hostname(self, workload):
+        for field in self.get_option('hostnames'):
+            if workload.get(field):
+                return workload[field]
+        return None
+
+    def _populate(self, results):
+        strict = self.get_option('strict')
+        labels = results['labels']
+
+        for workload in results['workloads'].values():
+            hostname = self._hostname(workload)
+            if not hostname:
+                continue
+            self.inventory.add_host(hostname)
+
+            host_vars = {'illumio_%s' % k: v for k, v in workload.items() if k != 'label_hrefs'}
+            host_vars['illumio_labels'] = {
+                labels[href]['key']: labels[href]['value'] for href in workload['label_hrefs'] if href in labels
+            }
+            for k, v in host_vars.items():
+                self.inventory.set_variable(hostname, k, v)
+
+            if self.get_option('label_groups'):
+                for key, value in host_vars['illumio_labels'].items():
+                    group = self.inventory.add_group(self._sanitize_group_name('%s_%s' % (key, value)))
+                    self.inventory.add_child(group, hostname)
+
+            self._set_composite_vars(self.get_option('compose'), host_vars, hostname, strict=strict)
+            self._add_host_to_composed_groups(self.get_option('groups'), host_vars, hostname, strict=strict)
+            self._add_host_to_keyed_groups(self.get_option('keyed_groups'), host_vars, hostname, strict=strict)
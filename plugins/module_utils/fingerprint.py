@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2023 Illumio, Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import hashlib
+import json
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from ansible_collections.illumio.core.plugins.module_utils.ip_ranges import normalize, to_strings  # type: ignore
+
+
+def _as_int(value: Any) -> Any:
+    """Converts numeric strings to integers, leaving other values as-is.
+
+    Used for fields such as allowed_uses_per_key that are either a count
+    or the string 'unlimited', as module parameters are always strings.
+    """
+    if isinstance(value, str) and value.isnumeric():
+        return int(value)
+    return value
+
+
+def _interfaces(value: Any) -> Any:
+    """Reduces workload interfaces to the fields that can be set on
+    unmanaged workloads, dropping those the PCE fills in such as link_state."""
+    if value is None:
+        return None
+    return [{'name': i.get('name'), 'address': i.get('address')} for i in value]
+
+
+def _ip_ranges(value: Any) -> Any:
+    """Reduces IP ranges to their merged canonical strings, so that lists
+    covering the same addresses match however the ranges are split up.
+    Range descriptions are dropped."""
+    return to_strings(*normalize(value or []))
+
+
+def _fqdns(value: Any) -> Any:
+    """Reduces FQDN entries to a sorted list of unique names."""
+    return sorted({f.get('fqdn') if isinstance(f, dict) else f for f in value or []})
+
+
+def _scopes(value: Any) -> Any:
+    """Reduces rule set scopes to sorted lists of label HREFs. Scope order
+    and the order of labels within each scope are not significant."""
+    if value is None:
+        return None
+    return sorted(sorted(_ref_key(entry.get('label') or entry.get('label_group') or entry) for entry in scope)
+                  for scope in value)
+
+
+def _actors(value: Any) -> Any:
+    """Reduces rule providers or consumers to the references they contain."""
+    if value is None:
+        return None
+    actors = []
+    for actor in value:
+        refs = [v for v in actor.values() if v is not None]
+        # actors is set to 'ams' for all workloads, other fields are references
+        actors.append(actor.get('actors') or _ref_key(refs[0] if refs else None))
+    return actors
+
+
+def _services(value: Any) -> Any:
+    """Reduces rule ingress services to service HREFs or proto/port ranges."""
+    if value is None:
+        return None
+    services = []
+    for service in value:
+        if service.get('href'):
+            services.append(service['href'])
+        else:
+            port_range = '-'.join(str(service[k]) for k in ('port', 'to_port') if service.get(k) is not None)
+            services.append('%s/%s' % (service.get('proto'), port_range))
+    return services
+
+
+def _resolve_labels_as(value: Any) -> Any:
+    value = value or {}
+    return {k: sorted(value.get(k) or ['workloads']) for k in ('providers', 'consumers')}
+
+
+def _ref_key(ref: Any) -> str:
+    """Returns a sortable identity for an object reference. References are
+    compared by HREF, falling back to their full content if they don't
+    have one yet, such as labels that would be created in check mode."""
+    if isinstance(ref, dict):
+        return ref.get('href') or json.dumps(ref, sort_keys=True)
+    return str(ref)
+
+
+def ven_version_matches(ven_version: Optional[str], agent_software_release: Optional[str]) -> bool:
+    """Returns true if a pairing profile's VEN release matches the given
+    version, or if no version is given.
+
+    The PCE reports the default release as "Default (<version>)".
+    """
+    if not ven_version:  # if no version is specified in the module, skip
+        return True
+    match = re.match('^(?:Default \\()?([a-zA-Z0-9\\.-]+)\\)?$', agent_software_release or '')
+    # if a version is specified in the module, check if it matches the remote
+    return not match or match.group(1) == ven_version
+
+
+class Fingerprint(object):
+    """Canonical form of a PCE object type used to detect drift.
+
+    Objects are reduced to the given fields only, so server-computed fields
+    such as href, created_at and caps are ignored. Missing and null fields
+    are replaced with their defaults, set fields are compared regardless of
+    order, and normalizers map equivalent values to a single form. The
+    canonical form is hashed so that the state of many objects can be
+    compared as digests.
+
+    Args:
+        fields: the object fields that can be set by modules.
+        defaults: values the PCE uses for fields that are missing or null.
+        sets: fields containing lists of object references in no particular order.
+        normalizers: functions mapping a field value to its canonical form.
+    """
+
+    def __init__(self, fields: Iterable[str], defaults: Optional[Dict[str, Any]] = None,
+                 sets: Iterable[str] = (), normalizers: Optional[Dict[str, Callable[[Any], Any]]] = None):
+        self.fields = list(fields)
+        self._defaults = defaults or {}
+        self._sets = set(sets)
+        self._normalizers = normalizers or {}
+
+    def canonical(self, o: dict, fields: Optional[Iterable[str]] = None) -> dict:
+        """Returns the canonical form of the given object's fields.
+
+        Args:
+            o: the object as a dict, such as the JSON representation of an SDK object.
+            fields: optional subset of fields to include. Defaults to all fields.
+        """
+        result = {}
+        for k in self.fields if fields is None else fields:
+            value = o.get(k)
+            if value is None:
+                value = self._defaults.get(k)
+            if k in self._normalizers:
+                value = self._normalizers[k](value)
+            if k in self._sets:
+                value = sorted(_ref_key(ref) for ref in value or [])
+            result[k] = value
+        return result
+
+    def digest(self, o: dict, fields: Optional[Iterable[str]] = None) -> str:
+        """Returns a hash of the object's canonical form."""
+        canonical = json.dumps(self.canonical(o, fields), sort_keys=True, separators=(',', ':'))
+        return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+    def set_fields(self, desired: dict) -> List[str]:
+        """Returns the fields the desired state sets. Fields that are null and
+        have no default are left unmanaged rather than compared as null."""
+        return [k for k in self.fields if desired.get(k) is not None or k in self._defaults]
+
+    def diff(self, desired: dict, remote: dict) -> List[str]:
+        """Returns the names of the fields set in the desired state that differ on the remote object."""
+        fields = self.set_fields(desired)
+        d, r = self.canonical(desired, fields), self.canonical(remote, fields)
+        return [k for k in fields if d[k] != r[k]]
+
+    def matches(self, desired: dict, remote: dict) -> bool:
+        """Returns true if the remote object matches the fields set in the desired state."""
+        fields = self.set_fields(desired)
+        return self.digest(desired, fields) == self.digest(remote, fields)
+
+
+LABEL_FINGERPRINT = Fingerprint(
+    fields=['key', 'value', 'external_data_set', 'external_data_reference']
+)
+
+PAIRING_PROFILE_FINGERPRINT = Fingerprint(
+    fields=[
+        'name', 'description', 'enabled', 'enforcement_mode', 'enforcement_mode_lock', 'visibility_level',
+        'visibility_level_lock', 'allowed_uses_per_key', 'key_lifespan', 'labels', 'role_label_lock',
+        'app_label_lock', 'env_label_lock', 'loc_label_lock', 'external_data_set', 'external_data_reference'
+    ],
+    defaults={'description': '', 'allowed_uses_per_key': 'unlimited', 'key_lifespan': 'unlimited'},
+    sets=['labels'],
+    normalizers={'allowed_uses_per_key': _as_int, 'key_lifespan': _as_int}
+)
+
+CONTAINER_CLUSTER_FINGERPRINT = Fingerprint(
+    fields=['name', 'description'],
+    defaults={'description': ''}
+)
+
+WORKLOAD_FINGERPRINT = Fingerprint(
+    fields=[
+        'name', 'hostname', 'description', 'public_ip', 'interfaces', 'labels',
+        'enforcement_mode', 'external_data_set', 'external_data_reference'
+    ],
+    sets=['interfaces', 'labels'],
+    normalizers={'interfaces': _interfaces}
+)
+
+IP_LIST_FINGERPRINT = Fingerprint(
+    fields=['name', 'description', 'ip_ranges', 'fqdns', 'external_data_set', 'external_data_reference'],
+    defaults={'description': ''},
+    normalizers={'ip_ranges': _ip_ranges, 'fqdns': _fqdns}
+)
+
+RULE_SET_FINGERPRINT = Fingerprint(
+    fields=['name', 'description', 'enabled', 'scopes', 'external_data_set', 'external_data_reference'],
+    defaults={'description': '', 'enabled': True},
+    normalizers={'scopes': _scopes}
+)
+
+RULE_FINGERPRINT = Fingerprint(
+    fields=[
+        'description', 'enabled', 'providers', 'consumers', 'ingress_services', 'resolve_labels_as',
+        'unscoped_consumers', 'external_data_set', 'external_data_reference'
+    ],
+    defaults={'description': '', 'enabled': True, 'unscoped_consumers': False},
+    sets=['providers', 'consumers', 'ingress_services'],
+    normalizers={
+        'providers': _actors, 'consumers': _actors, 'ingress_services': _services,
+        'resolve_labels_as': _resolve_labels_as
+    }
+)
+
+# fields that identify a rule within its rule set when it isn't referenced by HREF
+RULE_IDENTITY_FIELDS = ['providers', 'consumers', 'ingress_services']
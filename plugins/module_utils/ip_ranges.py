@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2023 Illumio, Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import ipaddress
+from typing import Any, Iterable, List, Tuple
+
+# an inclusive range of addresses as (IP version, first address, last address)
+Interval = Tuple[int, int, int]
+
+
+def parse_range(value: Any) -> Tuple[Interval, bool]:
+    """Parses an IP range into an interval and its exclusion flag.
+
+    Ranges can be given as strings, either a single address, a CIDR block
+    or a hyphenated address range, prefixed with ! for exclusions. PCE IP
+    range objects with from_ip, to_ip and exclusion fields are also accepted.
+
+    Raises:
+        ValueError: if the range is not valid.
+    """
+    if isinstance(value, dict):
+        from_ip, to_ip, exclusion = value.get('from_ip'), value.get('to_ip'), bool(value.get('exclusion'))
+    else:
+        value = str(value).strip()
+        exclusion = value.startswith('!')
+        from_ip, _, to_ip = value.lstrip('!').strip().partition('-')
+    if not from_ip:
+        raise ValueError("Invalid IP range: %s" % (value))
+
+    network = ipaddress.ip_network(from_ip.strip(), strict=False)
+    start, end = int(network.network_address), int(network.broadcast_address)
+    if to_ip:
+        last = ipaddress.ip_address(to_ip.strip())
+        if last.version != network.version or int(last) < start:
+            raise ValueError("Invalid IP range: %s" % (value))
+        end = int(last)
+    return (network.version, start, end), exclusion
+
+
+def merge(intervals: Iterable[Interval]) -> List[Interval]:
+    """Sorts intervals and merges those that overlap or are adjacent."""
+    merged = []
+    for version, start, end in sorted(intervals):
+        if merged and merged[-1][0] == version and start <= merged[-1][2] + 1:
+            if end > merged[-1][2]:
+                merged[-1] = (version, merged[-1][1], end)
+        else:
+            merged.append((version, start, end))
+    return merged
+
+
+def normalize(ranges: Iterable[Any]) -> Tuple[List[Interval], List[Interval]]:
+    """Returns the merged included and excluded intervals of a list of IP ranges.
+
+    Raises:
+        ValueError: if any range is not valid.
+    """
+    included, excluded = [], []
+    for value in ranges or []:
+        interval, exclusion = parse_range(value)
+        (excluded if exclusion else included).append(interval)
+    return merge(included), merge(excluded)
+
+
+def subtract(a: List[Interval], b: List[Interval]) -> List[Interval]:
+    """Returns the parts of the merged intervals in a that are not in the
+    merged intervals in b, with a single pass over both lists."""
+    result = []
+    j = 0
+    for version, start, end in a:
+        # skip intervals in b that end before this one starts
+        while j < len(b) and (b[j][0], b[j][2]) < (version, start):
+            j += 1
+        k = j
+        while start <= end and k < len(b) and b[k][0] == version and b[k][1] <= end:
+            if b[k][1] > start:
+                result.append((version, start, b[k][1] - 1))
+            start = max(start, b[k][2] + 1)
+            k += 1
+        if start <= end:
+            result.append((version, start, end))
+    return result
+
+
+def format_interval(interval: Interval) -> str:
+    """Formats an interval as a single address, a CIDR block or an address range."""
+    version, start, end = interval
+    address = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+    if start == end:
+        return str(address(start))
+    size = end - start + 1
+    if size & (size - 1) == 0 and start % size == 0:
+        max_prefix = 32 if version == 4 else 128
+        return '%s/%d' % (address(start), max_prefix - size.bit_length() + 1)
+    return '%s-%s' % (address(start), address(end))
+
+
+def to_strings(included: List[Interval], excluded: List[Interval]) -> List[str]:
+    """Returns the canonical string form of merged included and excluded intervals."""
+    return [format_interval(i) for i in included] + ['!' + format_interval(i) for i in excluded]
+
+
+def to_ip_ranges(included: List[Interval], excluded: List[Interval]) -> List[dict]:
+    """Returns merged intervals as PCE IP range objects."""
+    ip_ranges = []
+    for intervals, exclusion in ((included, False), (excluded, True)):
+        for interval in intervals:
+            from_ip, _, to_ip = format_interval(interval).partition('-')
+            ip_range = {'from_ip': from_ip, 'exclusion': exclusion}
+            if to_ip:
+                ip_range['to_ip'] = to_ip
+            ip_ranges.append(ip_range)
+    return ip_ranges
@@ -5,24 +5,47 @@
 from __future__ import absolute_import, division, print_function
 __metaclass__ = type
 
+import base64
+import fcntl
+import hashlib
 import json
+import os
+import random
 import sys
+import re
+import stat
+import tempfile
+import threading
+import time
 import traceback
-from abc import ABCMeta, abstractmethod
-from typing import Any
+from abc import ABCMeta
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
 
 from ansible.module_utils.basic import AnsibleModule, missing_required_lib, env_fallback
+from ansible_collections.illumio.core.plugins.module_utils.fingerprint import Fingerprint  # type: ignore
 
 IMPORT_ERROR_TRACEBACK = ''
 
 try:
     from illumio import PolicyComputeEngine, IllumioApiException, IllumioEncoder
+    from requests import Response
+    from requests.adapters import HTTPAdapter
+    from requests.structures import CaseInsensitiveDict
+    from urllib3.util.retry import Retry
 except ImportError:
     PolicyComputeEngine = None
     # replicate the traceback formatting from AnsibleModule.fail_json
     IMPORT_ERROR_TRACEBACK = ''.join(traceback.format_tb(sys.exc_info()[2]))
 
 
+# sessions for verified PCE connections, keyed by connection parameters.
+# Modules normally run in a new process for each task, so these are only
+# reused when modules are run in-process by the collection's action plugins
+_SESSION_POOL = {}
+
+
 class PceApiBase(object):
     """Base class for modules interacting with the PCE API."""
     def __init__(self, module: AnsibleModule):
@@ -34,6 +57,99 @@ class PceApiBase(object):
                 exception=IMPORT_ERROR_TRACEBACK
             )
 
+        self._stats = None
+        if module.params.get('pce_stats'):
+            self._stats = attach_pce_stats(module)
+
+        start = time.monotonic()
+        socket_path = getattr(module, '_socket_path', None)
+        if socket_path:
+            self._pce = self._persistent_connection(socket_path)
+        else:
+            self._pce = self._direct_connection()
+        if self._stats is not None:
+            self._stats.add_connect_time(time.monotonic() - start)
+
+    def href_cache(self, api_name: str) -> Optional['HrefCache']:
+        """Returns the controller-side HREF cache for the given object type,
+        or None if caching is disabled."""
+        ttl = self._module.params.get('pce_cache_ttl')
+        if not ttl:
+            return None
+        return HrefCache(pce_cache_dir(self._module), self._connection_id(), api_name, ttl)
+
+    def draft_changeset(self) -> 'DraftChangeset':
+        """Returns the controller-side record of unprovisioned draft changes."""
+        return DraftChangeset(pce_cache_dir(self._module), self._connection_id())
+
+    def _connection_id(self) -> str:
+        return '%s:%s/%s' % (self._pce._hostname, self._pce._port, self._pce.org_id)
+
+    def cached_href(self, api_name: str, params: dict, fetch: Callable[[], Optional[str]]) -> Optional[str]:
+        """Looks up the HREF for the given query params in the cache, calling
+        fetch to resolve and store it on a miss."""
+        cache = self.href_cache(api_name)
+        if cache is None:
+            return fetch()
+        return cache.get_or_fetch(params, fetch)
+
+    def resolve_label_refs(self, *label_lists: List[dict]) -> Tuple[List[List[Tuple[str, str]]], dict]:
+        """Resolves lists of label references, given by href or by key and
+        value, to (href, key) pairs with a single label catalog query.
+
+        Fails the module if any label doesn't exist.
+
+        Returns:
+            Tuple[List[List[Tuple[str, str]]], dict]: the resolved lists, and
+                the key of every label in the catalog by HREF.
+        """
+        try:
+            catalog = list(iter_collection(self._pce, '/labels'))
+        except IllumioApiException as e:
+            self._module.fail_json(msg="Failed to get labels: %s" % (str(e)))
+        label_keys = {o['href']: o['key'] for o in catalog}
+        hrefs = {(o['key'], o['value']): o['href'] for o in catalog}
+
+        resolved, missing = [], []
+        for labels in label_lists:
+            pairs = []
+            for label in labels or []:
+                href = label.get('href') or hrefs.get((label['key'], label['value']))
+                if href not in label_keys:
+                    missing.append(label.get('href') or '%s=%s' % (label['key'], label['value']))
+                    continue
+                pairs.append((href, label_keys[href]))
+            resolved.append(pairs)
+        if missing:
+            self._module.fail_json(msg="Labels not found: %s" % (', '.join(missing)))
+        return resolved, label_keys
+
+    def _persistent_connection(self, socket_path: str) -> Any:
+        """Builds a PCE client that sends requests through the illumio.core.pce
+        httpapi plugin, reusing the session it holds open for the play."""
+        # only needed with the httpapi plugin, so not imported for direct connections
+        from ansible.module_utils.connection import Connection, ConnectionError
+
+        connection = Connection(socket_path)
+        try:
+            settings = connection.get_pce_settings()
+        except ConnectionError as e:
+            self._module.fail_json(msg="Failed to establish a connection to the PCE: %s" % (str(e)))
+
+        pce = PolicyComputeEngine(settings['hostname'], port=settings['port'], org_id=settings['org_id'])
+        pce._session = self._wrap_session(
+            _PersistentSession(connection), pce, settings.get('api_key_username'), settings.get('credential_id')
+        )
+        return pce
+
+    def _direct_connection(self) -> Any:
+        module = self._module
+
+        # connection parameters are only required when not using the httpapi plugin
+        missing = [k for k in ['pce_hostname', 'api_key_username', 'api_key_secret'] if not module.params.get(k)]
+        if missing:
+            module.fail_json(msg="missing required arguments: %s" % (', '.join(missing)))
+
         hostname = module.params.get('pce_hostname')
         port = module.params.get('pce_port')
         org_id = module.params.get('pce_org_id')
@@ -54,27 +170,166 @@ class PceApiBase(object):
             else:
                 pce_tls_client_certs = tuple(pce_tls_client_certs)
 
-        self._pce = PolicyComputeEngine(hostname, port=port, org_id=org_id)
-        self._pce.set_credentials(api_key_username, api_key_secret)
-        self._pce.set_tls_settings(
+        pce = PolicyComputeEngine(hostname, port=port, org_id=org_id)
+        credential_id = credential_digest(api_key_username, api_key_secret)
+
+        pool_key = (
+            hostname, port, org_id, api_key_username, api_key_secret, pce_tls_verify,
+            pce_tls_ca, pce_tls_client_certs or None, pce_http_proxy, pce_https_proxy
+        )
+        session = _SESSION_POOL.get(pool_key)
+        if session is not None:
+            # the connection was verified by an earlier run in this process
+            pce._session = self._wrap_session(session, pce, api_key_username, credential_id)
+            return pce
+
+        pce.set_credentials(api_key_username, api_key_secret)
+        pce.set_tls_settings(
             verify=pce_tls_ca or pce_tls_verify,
             cert=pce_tls_client_certs
         )
 
         if pce_http_proxy or pce_https_proxy:
-            self._pce.set_proxies(
+            pce.set_proxies(
                 http_proxy=pce_http_proxy,
                 https_proxy=pce_https_proxy
             )
 
+        session = pce._session
+        mount_retry_adapter(session)
+        pce._session = self._wrap_session(session, pce, api_key_username, credential_id)
+
         try:
-            self._pce.must_connect()
+            pce.must_connect()
         except Exception as e:
             module.fail_json("Failed to establish a connection to the PCE: %s" % (str(e)))
+        _SESSION_POOL[pool_key] = session
+        return pce
+
+    def _wrap_session(self, session: Any, pce: Any, api_key_username: Optional[str], credential_id: Optional[str]) -> Any:
+        """Wraps the PCE client session with the shared rate limiter and, if
+        enabled, with single-flight coalescing of identical GET requests."""
+        module = self._module
+        limiter = None
+        rate = module.params.get('pce_rate_limit')
+        if rate:
+            # the PCE applies rate limits per user, so forks using the same API key share a bucket
+            limiter_id = '%s:%s/%s' % (pce._hostname, pce._port, api_key_username)
+            limiter = RateLimiter(pce_cache_dir(module), limiter_id, rate)
+        session = _RateLimitedSession(session, limiter, module.params.get('pce_max_retries'), self._stats)
+        if module.params.get('pce_coalesce_requests') and credential_id:
+            # responses are only shared between forks using the same credentials for the same org
+            coalescer_id = '%s:%s/%s/%s' % (pce._hostname, pce._port, pce.org_id, credential_id)
+            session = _CoalescingSession(session, RequestCoalescer(pce_cache_dir(module), coalescer_id), self._stats)
+        return session
+
+
+class _RateLimitedSession(object):
+    """Wraps the session used by PolicyComputeEngine, taking a token from the
+    shared rate limiter before each request and retrying requests rejected
+    with 429 Too Many Requests. Request metrics are recorded if stats are
+    being collected for the task."""
+    def __init__(self, session: Any, limiter: Optional['RateLimiter'], max_retries: int,
+                 stats: Optional['PceStats'] = None):
+        self._session = session
+        self._limiter = limiter
+        self._max_retries = max_retries or 0
+        self._stats = stats
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._session, name)
+
+    def request(self, method: str, url: str, **kwargs) -> Any:
+        attempt = 0
+        while True:
+            if self._limiter is not None:
+                start = time.monotonic()
+                self._limiter.acquire()
+                if self._stats is not None:
+                    self._stats.add_throttle_time(time.monotonic() - start)
+            start = time.monotonic()
+            response = self._session.request(method, url, **kwargs)
+            if self._stats is not None:
+                self._stats.record(method, url, time.monotonic() - start, kwargs, response)
+            if response.status_code != 429 or attempt >= self._max_retries:
+                return response
+            response.close()
+            if self._stats is not None:
+                self._stats.add_retry()
+
+            delay = _retry_after(response, None)
+            if delay is None:
+                # full jitter keeps forks that were throttled together from retrying in lockstep
+                delay = random.uniform(0, min(RETRY_MAX_BACKOFF, RETRY_BACKOFF_BASE * 2 ** attempt))
+            else:
+                delay += random.uniform(0, RETRY_JITTER)
+            if self._limiter is not None:
+                self._limiter.pause(delay)
+            time.sleep(delay)
+            attempt += 1
+
+
+class _PersistentSession(object):
+    """Stands in for the requests.Session used by PolicyComputeEngine,
+    forwarding each request to the httpapi connection plugin."""
+    def __init__(self, connection: Any):
+        self._connection = connection
+
+    def request(self, method: str, url: str, **kwargs) -> Any:
+        # connection errors are raised to the module as IllumioApiExceptions by PolicyComputeEngine._request
+        result = self._connection.send_pce_request(method, url, **kwargs)
+        response = Response()
+        response.status_code = result['status_code']
+        response.reason = result['reason']
+        response.headers = CaseInsensitiveDict(result['headers'])
+        response.encoding = 'utf-8'
+        response._content = result['content'].encode('utf-8')
+        # the body has already been read by the connection plugin, so
+        # mark it consumed for iter_content to slice it rather than stream it
+        response._content_consumed = True
+        response.url = url
+        return response
+
+
+class _CoalescingSession(object):
+    """Wraps the session used by PolicyComputeEngine, sharing the responses
+    to identical GET requests sent concurrently by other forks.
+
+    Responses are only shared if the request that fetched them was sent
+    after the last write made through this session, so a module always
+    reads its own changes.
+    """
+    def __init__(self, session: Any, coalescer: 'RequestCoalescer', stats: Optional['PceStats'] = None):
+        self._session = session
+        self._coalescer = coalescer
+        self._stats = stats
+        self._last_write = 0.0
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._session, name)
+
+    def request(self, method: str, url: str, **kwargs) -> Any:
+        # streamed responses are too large to share, and are only used for async job results
+        if method.upper() != 'GET' or kwargs.get('stream'):
+            try:
+                return self._session.request(method, url, **kwargs)
+            finally:
+                self._last_write = time.time()
+
+        response, coalesced = self._coalescer.request(
+            lambda: self._session.request(method, url, **kwargs),
+            [url, kwargs.get('params'), kwargs.get('headers')],
+            self._last_write
+        )
+        if coalesced and self._stats is not None:
+            self._stats.add_coalesced()
+        return response
 
 
 class PceObjectApi(PceApiBase, metaclass=ABCMeta):
     _api: object
+    # canonical form of the object type, used by params_match to detect drift
+    fingerprint: Optional[Fingerprint] = None
 
     def get(self, **kwargs) -> Any:
         try:
@@ -82,7 +337,37 @@ class PceObjectApi(PceApiBase, metaclass=ABCMeta):
         except IllumioApiException as e:
             self._module.fail_json(msg="Failed to get PCE objects: %s" % (e))
 
+    def get_all(self, params: dict = None, **kwargs) -> List[Any]:
+        try:
+            return list(self.iter_all(params, **kwargs))
+        except IllumioApiException as e:
+            self._module.fail_json(msg="Failed to get PCE objects: %s" % (e))
+
+    def iter_all(self, params: dict = None, policy_version: str = 'draft', parent: Any = None) -> Iterator[Any]:
+        """Yields every object matching the given params, switching to an
+        async collection job for collections larger than the synchronous limit.
+
+        Raises:
+            IllumioApiException: if any request fails or the collection can't be decoded.
+        """
+        endpoint = self._api._build_endpoint(policy_version, parent)
+        for o in iter_collection(self._pce, endpoint, params):
+            yield self._api.object_cls.from_json(o)
+
     def get_one(self, params: dict) -> Any:
+        cache = self.href_cache(self._api.name)
+        if cache is None:
+            return self._get_one(params)
+
+        def fetch():
+            o = self._get_one(params)
+            return self.json_output(o) if o else None
+
+        # the whole object is cached, so hits don't send any requests
+        o = cache.get_or_fetch_object(params, fetch)
+        return self._api.object_cls.from_json(o) if o else None
+
+    def _get_one(self, params: dict) -> Any:
         try:
             params = {**(params or {}), 'max_results': 1}
             objects = self._api.get(params=params)
@@ -101,9 +386,12 @@ class PceObjectApi(PceApiBase, metaclass=ABCMeta):
     def get_by_name(self, name: str) -> Any:
         return self.get_one({'name': name})
 
-    def create(self, o: Any) -> Any:
+    def create(self, o: Any, parent: Any = None) -> Any:
         try:
-            return self._api.create(o)
+            o = self._api.create(o, parent=parent)
+            self.invalidate_cache()
+            self.record_draft_change(o.href)
+            return o
         except IllumioApiException as e:
             self._module.fail_json(msg="Failed to create PCE object: %s" % (e))
 
@@ -114,40 +402,936 @@ class PceObjectApi(PceApiBase, metaclass=ABCMeta):
             return False
         try:
             self._api.update(remote_object.href, o)
+            self.invalidate_cache()
+            self.record_draft_change(remote_object.href)
             return True
         except IllumioApiException as e:
             self._module.fail_json(msg="Failed to update PCE object: %s" % (e))
 
+    def update_and_get(self, remote_object: Any, o: Any, refetch: bool = False) -> Tuple[bool, Any]:
+        """Updates the remote object if its parameters don't match, and returns
+        the changed flag along with the object's state after the update.
+
+        By default the updated state is built by merging the sent fields into
+        the remote object, saving a read-after-write request. Server-computed
+        fields such as updated_at aren't refreshed by the merge, so callers
+        that need them should set refetch to get the object from the PCE.
+        """
+        changed = self.update(remote_object, o)
+        if not changed:
+            return False, remote_object
+        if refetch:
+            return True, self.get_by_href(remote_object.href)
+        return True, self.merge(remote_object, o)
+
+    def merge(self, remote_object: Any, o: Any) -> Any:
+        """Returns a copy of the remote object with the fields set on o applied.
+
+        Null fields are omitted when objects are encoded for a request, so
+        only the fields that would be sent in an update are applied.
+        """
+        return self._api.object_cls.from_json({**self.json_output(remote_object), **self.json_output(o)})
+
     def delete(self, o: Any) -> bool:
         if not o or not o.href:
             return False
         try:
             self._api.delete(o.href)
+            self.invalidate_cache()
+            self.record_draft_change(o.href)
             return True
         except IllumioApiException as e:
             self._module.fail_json(msg="Failed to delete PCE object: %s" % (e))
 
-    @abstractmethod
+    def invalidate_cache(self) -> None:
+        """Drops cached HREF lookups for this object type.
+
+        Called after every write so that forks never resolve
+        a name to an object that has been renamed or removed.
+        """
+        cache = self.href_cache(self._api.name)
+        if cache is not None:
+            cache.invalidate()
+
+    def record_draft_change(self, href: str) -> None:
+        """Records a change to a draft policy object to be provisioned later.
+
+        Does nothing for objects that aren't part of the policy, such as labels.
+        """
+        href = draft_policy_href(href)
+        if href:
+            self.draft_changeset().add([href])
+
+    def desired_state(self) -> dict:
+        """Returns the object fields set by the Ansible module inputs.
+
+        Fields left unset are null and aren't compared unless the object's
+        fingerprint has a default for them.
+        """
+        return {k: self._module.params.get(k) for k in self.fingerprint.fields}
+
     def params_match(self, o: Any) -> bool:
         """Returns true if the parameters of the remote object match the Ansible
         module inputs.
 
-        Used to determine whether an update is required.
+        Used to determine whether an update is required. Compares the
+        fingerprint digests of the desired state and the remote object, so
+        subclasses must set fingerprint or override this method.
 
         Args:
             o (Any): the decoded remote object
         """
+        if self.fingerprint is None:
+            raise NotImplementedError('%s does not define a fingerprint' % (type(self).__name__))
+        return self.fingerprint.matches(self.desired_state(), self.json_output(o))
 
     def json_output(self, o: Any) -> Any:
         return json.loads(json.dumps(o, cls=IllumioEncoder))
 
 
+class HrefCache(object):
+    """Controller-side cache of name and key/value lookups to object HREFs,
+    or to the objects themselves.
+
+    Entries for each PCE connection and object type are stored in a single
+    JSON file, which is only read and written while holding an exclusive
+    lock on it. The lock isn't held while a missing entry is fetched, so
+    lookups of different names don't wait for each other. Instead, forks
+    fetching the same entry take a lock for its key, so that parallel forks
+    resolving the same name only send one request to the PCE.
+    """
+    def __init__(self, cache_dir: str, connection_id: str, api_name: str, ttl: int):
+        namespace = hashlib.sha256(connection_id.encode('utf-8')).hexdigest()[:16]
+        self._path = os.path.join(cache_dir, 'hrefs-%s-%s.json' % (namespace, api_name))
+        self._lock_path = self._path + '.lock'
+        self._key_lock_path = self._path + '.keys.lock'
+        self._ttl = ttl
+
+    @contextmanager
+    def _locked(self):
+        with _open_private(self._lock_path) as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _key_locked(self, key: str):
+        # record locks on a single byte of the key lock file chosen by the key,
+        # so there is no lock file per key. Record locks don't exclude threads
+        # of the same process, which at worst causes a redundant fetch
+        offset = int(hashlib.sha256(key.encode('utf-8')).hexdigest()[:8], 16)
+        with _open_private(self._key_lock_path) as lock_file:
+            fcntl.lockf(lock_file, fcntl.LOCK_EX, 1, offset)
+            try:
+                yield
+            finally:
+                fcntl.lockf(lock_file, fcntl.LOCK_UN, 1, offset)
+
+    def _read(self) -> dict:
+        try:
+            with open(self._path) as f:
+                state = json.load(f)
+        except (IOError, ValueError):
+            state = {}
+        if not isinstance(state.get('entries'), dict):
+            state = {}
+        return {'invalidated': state.get('invalidated', 0), 'entries': state.get('entries', {})}
+
+    def _write(self, state: dict) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self._path))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._path)
+
+    def get_or_fetch(self, params: dict, fetch: Callable[[], Optional[str]]) -> Optional[str]:
+        """Returns the cached HREF for the given query params, calling fetch
+        to resolve and store it on a miss."""
+        def fetch_entry():
+            href = fetch()
+            return {'href': href} if href else None
+
+        entry = self._get_or_fetch(params, fetch_entry, 'href')
+        return entry['href'] if entry else None
+
+    def get_or_fetch_object(self, params: dict, fetch: Callable[[], Optional[dict]]) -> Optional[dict]:
+        """Returns the cached object for the given query params as decoded
+        JSON, calling fetch to get and store it on a miss."""
+        def fetch_entry():
+            o = fetch()
+            return {'href': o['href'], 'object': o} if o else None
+
+        entry = self._get_or_fetch(params, fetch_entry, 'object')
+        return entry['object'] if entry else None
+
+    def _get_or_fetch(self, params: dict, fetch: Callable[[], Optional[dict]], field: str) -> Optional[dict]:
+        key = json.dumps(params, sort_keys=True)
+        with self._key_locked(key):
+            # a fork that fetched the entry while this one waited has stored it
+            with self._locked():
+                entry = self._read()['entries'].get(key)
+            if entry and entry['expires'] > time.time() and field in entry:
+                return entry
+
+            started = time.time()
+            entry = fetch()
+            # misses aren't cached as the object may be created later in the play
+            if entry:
+                with self._locked():
+                    state = self._read()
+                    # don't store a result fetched before the cache was invalidated
+                    if state['invalidated'] < started:
+                        now = time.time()
+                        entries = {k: v for k, v in state['entries'].items() if v['expires'] > now}
+                        entries[key] = dict(entry, expires=now + self._ttl)
+                        self._write({'invalidated': state['invalidated'], 'entries': entries})
+            return entry
+
+    def invalidate(self) -> None:
+        with self._locked():
+            self._write({'invalidated': time.time(), 'entries': {}})
+
+
+# set by the collection's action plugins to scope recorded draft changes to
+# a single ansible-playbook run, and inherited by modules run on the controller
+DRAFT_RUN_ID_ENV = 'ILLUMIO_PCE_RUN_ID'
+
+
+class DraftChangeset(object):
+    """Controller-side record of draft policy objects changed by modules
+    and not yet provisioned.
+
+    Modules that write draft policy add the HREFs they change, and the
+    provision module reads them back so that every change made during a
+    play is provisioned as a single policy version. Changes are scoped to
+    the run that recorded them, so changes left behind by a run that never
+    provisioned them, such as a play that failed, are discarded when the
+    next run records a change rather than provisioned with it. The HREFs
+    for each PCE connection are kept in a JSON file that is only read and
+    written while holding an exclusive lock on it.
+    """
+    def __init__(self, cache_dir: str, connection_id: str):
+        namespace = hashlib.sha256(connection_id.encode('utf-8')).hexdigest()[:16]
+        self._path = os.path.join(cache_dir, 'draft-%s.json' % (namespace))
+        self._run_id = os.environ.get(DRAFT_RUN_ID_ENV)
+
+    @contextmanager
+    def _state(self):
+        with _open_private(self._path) as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read())
+                except ValueError:
+                    state = {}
+                if not isinstance(state, dict):
+                    # recorded before changes were scoped to a run
+                    state = {'hrefs': state}
+                state.setdefault('run', None)
+                state.setdefault('hrefs', [])
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _current(self, state: dict) -> bool:
+        # changes recorded outside of a run, such as by modules run without
+        # the action plugins, can't be told apart and are always current
+        return self._run_id is None or state['run'] == self._run_id
+
+    def hrefs(self) -> List[str]:
+        """Returns the HREFs recorded by the current run."""
+        with self._state() as state:
+            return list(state['hrefs']) if self._current(state) else []
+
+    def add(self, new_hrefs: Iterable[str]) -> None:
+        with self._state() as state:
+            if not self._current(state):
+                state['hrefs'] = []
+            state['run'] = self._run_id
+            state['hrefs'].extend(href for href in new_hrefs if href not in state['hrefs'])
+
+    def remove(self, provisioned_hrefs: Iterable[str]) -> None:
+        """Removes provisioned HREFs, keeping any recorded since they were read."""
+        provisioned_hrefs = set(provisioned_hrefs)
+        with self._state() as state:
+            state['hrefs'] = [href for href in state['hrefs'] if href not in provisioned_hrefs]
+
+
+class PairingKeyPool(object):
+    """Controller-side pool of multi-use pairing keys for a pairing profile.
+
+    Keys are handed out round-robin, and the number of times each key has
+    been handed out is counted against the allowed uses and lifespan the
+    profile gave it when it was generated. Keys that are used up or about
+    to expire are dropped from the pool and replaced on demand, so the
+    number of keys generated grows with the number of pairing waves rather
+    than the number of hosts. The pool for each PCE connection and profile
+    is kept in a JSON file that is only read and written while holding an
+    exclusive lock on it, and is only readable by the controller user.
+    """
+    def __init__(self, cache_dir: str, connection_id: str, profile_href: str):
+        namespace = hashlib.sha256(connection_id.encode('utf-8')).hexdigest()[:16]
+        profile = hashlib.sha256(profile_href.encode('utf-8')).hexdigest()[:16]
+        self._path = os.path.join(cache_dir, 'keypool-%s-%s.json' % (namespace, profile))
+
+    @contextmanager
+    def _state(self):
+        with _open_private(self._path) as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                try:
+                    state = json.loads(f.read())
+                except ValueError:
+                    state = {}
+                state.setdefault('keys', [])
+                state.setdefault('hosts', {})
+                state.setdefault('next', 0)
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _expired(key: dict, now: float) -> bool:
+        return key['retire'] is not None and key['retire'] <= now
+
+    @staticmethod
+    def _available(key: dict) -> bool:
+        return key['allowed_uses'] is None or key['uses'] < key['allowed_uses']
+
+    def checkout(self, hosts: List[Optional[str]], size: int, generate: Callable[[int], List[str]],
+                 allowed_uses: Optional[int], lifespan: Optional[int]) -> Tuple[List[str], int]:
+        """Hands out a pairing key for each of the given hosts.
+
+        Hosts that were given a key that hasn't expired get the same key
+        again without using it up further. The pool is refilled to size
+        keys with uses left, and grown further if their remaining uses
+        can't cover the hosts.
+
+        Args:
+            hosts (List[Optional[str]]): host names, or None for handouts not tied to a host.
+            size (int): the number of keys with uses left to keep in the pool.
+            generate (Callable[[int], List[str]]): generates the given number of new keys.
+            allowed_uses (Optional[int]): uses allowed for each new key, or None if unlimited.
+            lifespan (Optional[int]): seconds each new key is valid for, or None if unlimited.
+
+        Returns:
+            Tuple[List[str], int]: the key for each host, and the number of keys generated.
+
+        Raises:
+            ValueError: if the pool runs out of keys with uses left.
+        """
+        with self._state() as state:
+            now = time.time()
+            keys = [key for key in state['keys'] if not self._expired(key, now)]
+            valid = {key['key'] for key in keys}
+            assigned = {host: key for host, key in state['hosts'].items() if key in valid}
+            available = [key for key in keys if self._available(key)]
+
+            pending = [host for host in hosts if host is None or host not in assigned]
+            remaining = sum(key['allowed_uses'] - key['uses'] for key in available if key['allowed_uses'] is not None)
+            unlimited = any(key['allowed_uses'] is None for key in available)
+            # keys are only generated when there are hosts to hand them out to
+            needed = max(size - len(available), 0) if pending else 0
+            if not unlimited and allowed_uses is None:
+                if remaining < len(pending):
+                    needed = max(needed, 1)
+            elif not unlimited and allowed_uses:
+                shortfall = len(pending) - remaining - needed * allowed_uses
+                if shortfall > 0:
+                    needed += -(-shortfall // allowed_uses)
+
+            # keys are retired before they expire, leaving hosts time to pair with them
+            retire = now + lifespan - min(PAIRING_KEY_EXPIRY_MARGIN, lifespan / 2) if lifespan is not None else None
+            new_keys = [dict(key=key, uses=0, allowed_uses=allowed_uses, retire=retire) for key in generate(needed)] if needed else []
+            keys.extend(new_keys)
+            available.extend(new_keys)
+
+            result = []
+            for host in hosts:
+                if host is not None and host in assigned:
+                    result.append(assigned[host])
+                    continue
+                # round-robin over keys with uses left, so they are used up evenly
+                for _ in range(len(available)):
+                    key = available[state['next'] % len(available)]
+                    state['next'] = (state['next'] + 1) % len(available)
+                    if self._available(key):
+                        break
+                else:
+                    raise ValueError("No pairing keys with uses left in the pool for %d of %d host(s)" % (
+                        len(hosts) - len(result), len(hosts)
+                    ))
+                key['uses'] += 1
+                if host is not None:
+                    assigned[host] = key['key']
+                result.append(key['key'])
+
+            # used up keys are kept while hosts given them may ask for them again
+            in_use = set(assigned.values())
+            state['keys'] = [key for key in keys if self._available(key) or key['key'] in in_use]
+            state['hosts'] = assigned
+            return result, len(new_keys)
+
+
+# matches the HREF of a draft policy object, and the HREF of the object
+# provisioned with it for child objects such as rules in a rule set
+DRAFT_HREF_REGEX = re.compile(r'^(/orgs/\d+/sec_policy/draft/\w+/[^/]+)(?:/.*)?$')
+
+
+def draft_policy_href(href: str) -> Optional[str]:
+    """Returns the HREF to provision for a changed draft policy object,
+    or None if the HREF isn't a draft policy object."""
+    m = DRAFT_HREF_REGEX.match(href or '')
+    return m.group(1) if m else None
+
+
+ASYNC_JOB_THRESHOLD = 500
+ASYNC_JOB_TIMEOUT = 3600
+ASYNC_JOB_MAX_POLL_INTERVAL = 30
+
+
+def count_collection(pce: Any, endpoint: str, params: dict = None) -> int:
+    """Returns the number of objects in a PCE collection from the
+    X-Total-Count header of a request with max_results set to 0."""
+    response = pce.get(endpoint, params={**(params or {}), 'max_results': 0})
+    return int(response.headers.get('X-Total-Count', 0))
+
+
+def iter_collection(pce: Any, endpoint: str, params: dict = None,
+                    threshold: int = ASYNC_JOB_THRESHOLD, timeout: int = ASYNC_JOB_TIMEOUT) -> Iterator[Any]:
+    """Yields every object in a PCE collection as decoded JSON.
+
+    The first threshold objects are requested synchronously, so collections
+    with at most threshold objects are fetched with a single request. Larger
+    collections are then fetched with an async job, and the result document
+    is decoded as it is streamed so memory use doesn't grow with the size of
+    the collection.
+
+    Raises:
+        IllumioApiException: if any request fails or the collection can't be decoded.
+    """
+    params = params or {}
+    response = pce.get(endpoint, params={**params, 'max_results': threshold})
+    objects = response.json()
+    # endpoints that don't support max_results return the full collection without a count
+    total = int(response.headers.get('X-Total-Count', len(objects)))
+    if total <= len(objects):
+        yield from objects
+        return
+
+    collection_href = _run_async_job(pce, endpoint, params, timeout)
+    response = pce.get(collection_href, stream=True)
+    response.encoding = response.encoding or 'utf-8'
+    try:
+        yield from iter_json_array(response.iter_content(chunk_size=65536, decode_unicode=True))
+    except ValueError as e:
+        raise IllumioApiException("Failed to decode collection %s: %s" % (collection_href, e))
+    finally:
+        response.close()
+
+
+def _run_async_job(pce: Any, endpoint: str, params: dict, timeout: int) -> str:
+    """Submits an async collection job and polls it until it completes.
+
+    The poll interval starts at the Retry-After time given by the PCE and
+    backs off by 1.5x up to ASYNC_JOB_MAX_POLL_INTERVAL, but a Retry-After
+    header on a poll response always takes precedence.
+
+    Returns:
+        str: the HREF of the job's result document.
+    """
+    response = pce.get(endpoint, params=params, headers={'Prefer': 'respond-async'})
+    location = response.headers.get('Location')
+    if not location:
+        raise IllumioApiException("PCE did not return a job location for async request to %s" % (endpoint))
+
+    deadline = time.monotonic() + timeout
+    interval = _retry_after(response, 1)
+    while True:
+        time.sleep(interval)
+        response = pce.get(location)
+        job = response.json()
+        status = job.get('status')
+        if status == 'done':
+            return job['result']['href']
+        if status == 'completed':
+            # traffic flow jobs return the result HREF directly
+            return job['result']
+        if status == 'failed':
+            raise IllumioApiException("Async collection job failed: %s" % ((job.get('result') or {}).get('message')))
+        if time.monotonic() >= deadline:
+            raise IllumioApiException("Timed out waiting for async collection job %s" % (location))
+        interval = _retry_after(response, min(interval * 1.5 or 1, ASYNC_JOB_MAX_POLL_INTERVAL))
+
+
+def _retry_after(response: Any, default: float) -> float:
+    try:
+        return max(float(response.headers['Retry-After']), 0)
+    except (KeyError, TypeError, ValueError):
+        return default
+
+
+def iter_json_array(chunks: Iterable[str]) -> Iterator[Any]:
+    """Incrementally decodes a JSON array from an iterable of text chunks,
+    yielding each element as soon as it has been fully received.
+
+    Raises:
+        ValueError: if the document isn't a well-formed JSON array.
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    started = False
+    for chunk in chunks:
+        buf = buf[pos:] + chunk
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos == len(buf):
+                break
+            if not started:
+                if buf[pos] != '[':
+                    raise ValueError("expected a JSON array")
+                started = True
+                pos += 1
+            elif buf[pos] == ']':
+                return
+            elif buf[pos] == ',':
+                pos += 1
+            else:
+                try:
+                    o, end = decoder.raw_decode(buf, pos)
+                except ValueError:
+                    break  # wait for the rest of the element
+                if not isinstance(o, (dict, list)) and buf[end:].lstrip()[:1] not in (',', ']'):
+                    break  # scalars may be truncated until a delimiter is received
+                yield o
+                pos = end
+    raise ValueError("unexpected end of JSON array")
+
+
+# seconds before a pooled pairing key expires that it stops being handed out,
+# capped at half the key's lifespan
+PAIRING_KEY_EXPIRY_MARGIN = 300
+
+# stored responses are removed once no fork can still be waiting for them
+COALESCE_FILE_EXPIRY = 300
+
+RETRY_BACKOFF_BASE = 1
+RETRY_MAX_BACKOFF = 30
+RETRY_JITTER = 1
+
+
+def mount_retry_adapter(session: Any, retries: int = 5) -> None:
+    """Mounts a retry adapter on the session for transient server errors.
+
+    Unlike the illumio library default, 429 responses aren't retried by the
+    adapter so that they're returned to the rate limiting session, which
+    honours Retry-After and shares the backoff with other forks.
+    """
+    adapter = HTTPAdapter(max_retries=Retry(
+        total=retries,
+        backoff_factor=2,
+        status_forcelist=[500, 502, 503, 504],
+        # urllib3 otherwise retries any 429 with a Retry-After header itself
+        respect_retry_after_header=False
+    ))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+
+class RateLimiter(object):
+    """Token bucket rate limiter shared by all forks on the controller.
+
+    The bucket state is kept in a small JSON file that is only read and
+    written while holding an exclusive lock on it. Each request reserves a
+    token, and callers sleep outside of the lock until their reservation is
+    due, so waiting forks are served in the order they arrived.
+    """
+    def __init__(self, cache_dir: str, limiter_id: str, rate: float, burst: Optional[float] = None):
+        namespace = hashlib.sha256(limiter_id.encode('utf-8')).hexdigest()[:16]
+        self._path = os.path.join(cache_dir, 'ratelimit-%s.json' % (namespace))
+        self._rate = float(rate)
+        self._burst = float(burst or max(rate, 1))
+
+    @contextmanager
+    def _state(self):
+        with _open_private(self._path) as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read())
+                except ValueError:
+                    state = {}
+                now = time.time()
+                tokens = state.get('tokens', self._burst)
+                updated = state.get('updated', now)
+                # refill for the time elapsed since the last reservation
+                state['tokens'] = min(self._burst, tokens + max(now - updated, 0) * self._rate)
+                state['updated'] = now
+                yield state
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def acquire(self) -> None:
+        """Reserves a token, sleeping until it is available."""
+        with self._state() as state:
+            state['tokens'] -= 1
+            # reservations made during a pause are queued behind it at the sustained rate
+            paused = max(state.get('paused_until', 0) - state['updated'], 0)
+            wait = paused + max(-state['tokens'] / self._rate, 0)
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Holds back requests from all forks for the given number of seconds,
+        used when the PCE has asked clients to back off."""
+        with self._state() as state:
+            state['paused_until'] = max(state.get('paused_until', 0), state['updated'] + seconds)
+            # drain the bucket so requests resume at the sustained rate
+            state['tokens'] = min(state['tokens'], 0)
+
+
+class RequestCoalescer(object):
+    """Controller-side single-flight for identical GET requests.
+
+    The first fork to send a request takes an exclusive lock on a file
+    named for it, and writes the response to the file once it completes.
+    Forks sending the same request in the meantime wait for the lock and
+    then use the stored response rather than sending their own. Responses
+    are never reused for requests sent after they completed, so this isn't
+    a cache, and files are namespaced by PCE, org and credentials so that
+    responses are never shared between API users.
+    """
+    def __init__(self, cache_dir: str, coalescer_id: str):
+        self._cache_dir = cache_dir
+        self._prefix = 'coalesce-%s-' % (hashlib.sha256(coalescer_id.encode('utf-8')).hexdigest()[:16])
+
+    def request(self, send: Callable[[], Any], request_key: list, not_before: float = 0) -> Tuple[Any, bool]:
+        """Sends the request with send, or waits for the same request in
+        flight from another fork and returns its response.
+
+        Args:
+            send (Callable[[], Any]): sends the request and returns the response.
+            request_key (list): JSON-serializable values identifying the request.
+            not_before (float): only share responses to requests sent after this time.
+
+        Returns:
+            Tuple[Any, bool]: the response, and whether it was shared by another fork.
+        """
+        key = hashlib.sha256(json.dumps(request_key, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        path = os.path.join(self._cache_dir, '%s%s.json' % (self._prefix, key[:32]))
+        started = time.time()
+        with _open_private(path) as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                try:
+                    stored = json.loads(f.read())
+                except ValueError:
+                    stored = {}
+                # only share a response that was in flight when this request started
+                if stored.get('completed', 0) >= started and stored.get('sent', 0) >= not_before:
+                    return self._response(stored), True
+
+                sent = time.time()
+                response = send()
+                if not 200 <= response.status_code < 300:
+                    return response, False
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(dict(
+                    sent=sent,
+                    completed=time.time(),
+                    url=response.url,
+                    status_code=response.status_code,
+                    reason=response.reason,
+                    headers=dict(response.headers),
+                    encoding=response.encoding,
+                    content=base64.b64encode(response.content or b'').decode('ascii')
+                )))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        self._expire()
+        return response, False
+
+    def _response(self, stored: dict) -> Any:
+        response = Response()
+        response.status_code = stored['status_code']
+        response.reason = stored['reason']
+        response.headers = CaseInsensitiveDict(stored['headers'])
+        response.encoding = stored['encoding']
+        response._content = base64.b64decode(stored['content'])
+        response._content_consumed = True
+        response.url = stored['url']
+        return response
+
+    def _expire(self) -> None:
+        """Removes stored responses that are too old to be shared. A fork
+        waiting on a removed file may send its own request, but will never
+        be given a stale response."""
+        expired = time.time() - COALESCE_FILE_EXPIRY
+        try:
+            entries = list(os.scandir(self._cache_dir))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.name.startswith(self._prefix) and entry.stat().st_mtime < expired:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+
+class PceStats(object):
+    """Collects API call metrics for a single module run, which are returned
+    in the module result as pce_stats.
+
+    Latencies are counted in a histogram for each method and endpoint, with
+    numeric and UUID path segments replaced by * so that requests for
+    different objects of the same type are grouped together.
+    """
+    LATENCY_BUCKETS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+    _ID_SEGMENT = re.compile(r'/(?:\d+|[0-9a-f]{8}-[0-9a-f-]{27}|[0-9a-f]{32})(?=/|$)')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._connect_time = 0.0
+        self._throttle_time = 0.0
+        self._requests = 0
+        self._retries = 0
+        self._coalesced = 0
+        self._bytes_sent = 0
+        self._bytes_received = 0
+        self._endpoints = {}
+
+    def add_connect_time(self, seconds: float) -> None:
+        with self._lock:
+            self._connect_time += seconds
+
+    def add_throttle_time(self, seconds: float) -> None:
+        with self._lock:
+            self._throttle_time += seconds
+
+    def add_retry(self) -> None:
+        with self._lock:
+            self._retries += 1
+
+    def add_coalesced(self) -> None:
+        with self._lock:
+            self._coalesced += 1
+
+    def record(self, method: str, url: str, seconds: float, request_kwargs: dict, response: Any) -> None:
+        path = re.sub(r'^/api/v\d+', '', urlsplit(url).path)
+        endpoint = '%s %s' % (method.upper(), self._ID_SEGMENT.sub('/*', path))
+        elapsed_ms = seconds * 1000
+        bucket = len([b for b in self.LATENCY_BUCKETS_MS if elapsed_ms > b])
+
+        body = request_kwargs.get('data') or request_kwargs.get('json')
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        elif body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        received = response.headers.get('Content-Length')
+        if received is None and not request_kwargs.get('stream'):
+            received = len(response.content or b'')
+        # count transient errors retried by the requests adapter
+        retry_history = getattr(getattr(getattr(response, 'raw', None), 'retries', None), 'history', None) or ()
+
+        with self._lock:
+            self._requests += 1
+            self._retries += len(retry_history)
+            self._bytes_sent += len(body or b'')
+            self._bytes_received += int(received or 0)
+            stats = self._endpoints.setdefault(endpoint, {
+                'requests': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'histogram': [0] * (len(self.LATENCY_BUCKETS_MS) + 1)
+            })
+            stats['requests'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            stats['histogram'][bucket] += 1
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return dict(
+                requests=self._requests,
+                retries=self._retries,
+                coalesced=self._coalesced,
+                bytes_sent=self._bytes_sent,
+                bytes_received=self._bytes_received,
+                elapsed_ms=round((time.monotonic() - self._start) * 1000, 3),
+                connect_ms=round(self._connect_time * 1000, 3),
+                throttle_ms=round(self._throttle_time * 1000, 3),
+                api_ms=round(sum(e['total_ms'] for e in self._endpoints.values()), 3),
+                latency_buckets_ms=self.LATENCY_BUCKETS_MS,
+                endpoints={
+                    k: dict(v, total_ms=round(v['total_ms'], 3), max_ms=round(v['max_ms'], 3))
+                    for k, v in self._endpoints.items()
+                }
+            )
+
+
+def attach_pce_stats(module: AnsibleModule) -> PceStats:
+    """Creates the stats collector for a module run and wraps the module's
+    exit_json and fail_json to add it to the result.
+
+    Modules that create several API objects share a single collector.
+    """
+    stats = getattr(module, '_pce_stats', None)
+    if stats is not None:
+        return stats
+    stats = module._pce_stats = PceStats()
+
+    def with_stats(fn):
+        def wrapper(*args, **kwargs):
+            kwargs['pce_stats'] = stats.to_dict()
+            return fn(*args, **kwargs)
+        return wrapper
+
+    module.exit_json = with_stats(module.exit_json)
+    module.fail_json = with_stats(module.fail_json)
+    return stats
+
+
+def pce_cache_dir(module: AnsibleModule) -> str:
+    """Returns the controller directory used for state shared between module runs.
+
+    The directory holds cached PCE objects, recorded draft changes and
+    pooled pairing keys, and the default path is predictable, so the module
+    fails unless it is owned by the current user and only accessible to them.
+    """
+    cache_dir = module.params.get('pce_cache_dir')
+    if not cache_dir:
+        cache_dir = os.path.join(tempfile.gettempdir(), 'illumio-core-%d' % os.getuid())
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        st = os.lstat(cache_dir)
+    except OSError as e:
+        module.fail_json(msg="Failed to create PCE cache directory %s: %s" % (cache_dir, e))
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or stat.S_IMODE(st.st_mode) != 0o700:
+        module.fail_json(
+            msg="PCE cache directory %s must be a directory owned by the current user with mode 0700" % (cache_dir)
+        )
+    return cache_dir
+
+
+def _open_private(path: str) -> Any:
+    """Opens a file in the cache directory for reading and writing,
+    creating it if needed, with access restricted to the current user."""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    # files created before the mode was enforced keep their old mode
+    os.fchmod(fd, 0o600)
+    return os.fdopen(fd, 'r+')
+
+
+def credential_digest(api_key_username: Optional[str], api_key_secret: Optional[str]) -> Optional[str]:
+    """Returns a digest identifying an API key, used to keep state shared
+    between forks separate for each API user without storing the secret."""
+    if not api_key_username or not api_key_secret:
+        return None
+    return hashlib.sha256(('%s:%s' % (api_key_username, api_key_secret)).encode('utf-8')).hexdigest()
+
+
+def run_concurrently(fn: Callable, items: List[Any], max_workers: int = 1) -> List[Any]:
+    """Calls fn for each item using a bounded pool of worker threads.
+
+    Results are returned in the same order as the given items.
+    """
+    if max_workers <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(fn, items))
+
+
+# the maximum number of objects the PCE accepts in a bulk request
+BULK_CHANGE_LIMIT = 1000
+
+
+def bulk_change(pce: Any, endpoint: str, objects: List[dict], success_status: Optional[str] = None,
+                batch_size: int = BULK_CHANGE_LIMIT, max_workers: int = 1) -> List[Tuple[Optional[str], Optional[str]]]:
+    """Sends objects to a PCE bulk endpoint such as /workloads/bulk_update.
+
+    Objects are split into batches of at most batch_size, and up to
+    max_workers batches are sent concurrently. Errors don't raise, as each
+    object can fail on its own. A batch that fails as a whole is reported
+    against every object in it.
+
+    Returns:
+        List[Tuple[Optional[str], Optional[str]]]: an (href, error) pair for
+            each object, in the same order as the given objects.
+    """
+    batches = [objects[i:i + batch_size] for i in range(0, len(objects), batch_size)]
+
+    def send(batch):
+        try:
+            results = pce.put(endpoint, json=batch).json()
+        except (IllumioApiException, ValueError) as e:
+            return [(None, str(e))] * len(batch)
+        pairs = [(result.get('href'), _bulk_error(result, success_status)) for result in results]
+        if len(pairs) == len(batch):
+            # one result for each object, in request order
+            return pairs
+        if success_status is None and all(o.get('href') for o in batch):
+            # bulk_delete only returns results for the objects it failed to delete
+            errors = dict(pairs)
+            return [(None, errors.get(o['href'])) for o in batch]
+        return [(None, "Unexpected response from %s: expected %d results, got %d" % (endpoint, len(batch), len(pairs)))] * len(batch)
+
+    return [pair for pairs in run_concurrently(send, batches, max_workers) for pair in pairs]
+
+
+def _bulk_error(result: dict, success_status: Optional[str]) -> Optional[str]:
+    errors = list(result.get('errors') or [])
+    if success_status and result.get('status') != success_status:
+        errors.append(result)
+    return '; '.join(e.get('message') or e.get('token') or 'unknown error' for e in errors) or None
+
+
+def label_ref_spec(required: bool = False) -> dict:
+    """Returns the specification for a list option of label references,
+    each given by href or by key and value."""
+    return dict(
+        type='list',
+        elements='dict',
+        required=required,
+        options=dict(
+            href=dict(type='str'),
+            # explicitly set no_log to false to avoid ansible-lint false positive
+            # see https://docs.ansible.com/ansible-core/devel/dev_guide/testing/sanity/validate-modules.html
+            key=dict(type='str', no_log=False),
+            value=dict(type='str')
+        ),
+        required_one_of=[['href', 'key']],
+        required_together=[['key', 'value']],
+        mutually_exclusive=[['href', 'key'], ['href', 'value']]
+    )
+
+
 def pce_connection_spec() -> dict:
     """Modules interacting with the PCE APIs extend this specification."""
     return dict(
         pce_hostname=dict(
             type='str',
-            required=True,
             aliases=['pce_url'],
             fallback=(env_fallback, ['ILLUMIO_PCE_HOST'])
         ),
@@ -163,13 +1347,11 @@ def pce_connection_spec() -> dict:
         ),
         api_key_username=dict(
             type='str',
-            required=True,
             no_log=True,
             fallback=(env_fallback, ['ILLUMIO_API_KEY_USERNAME'])
         ),
         api_key_secret=dict(
             type='str',
-            required=True,
             no_log=True,
             fallback=(env_fallback, ['ILLUMIO_API_KEY_SECRET'])
         ),
@@ -178,4 +1360,33 @@ def pce_connection_spec() -> dict:
         pce_tls_client_certs=dict(type='list', elements='str'),
         pce_http_proxy=dict(type='str'),
         pce_https_proxy=dict(type='str'),
+        pce_cache_ttl=dict(
+            type='int',
+            default=0,
+            fallback=(env_fallback, ['ILLUMIO_PCE_CACHE_TTL'])
+        ),
+        pce_cache_dir=dict(
+            type='path',
+            fallback=(env_fallback, ['ILLUMIO_PCE_CACHE_DIR'])
+        ),
+        pce_rate_limit=dict(
+            type='float',
+            default=0,
+            fallback=(env_fallback, ['ILLUMIO_PCE_RATE_LIMIT'])
+        ),
+        pce_max_retries=dict(
+            type='int',
+            default=5,
+            fallback=(env_fallback, ['ILLUMIO_PCE_MAX_RETRIES'])
+        ),
+        pce_stats=dict(
+            type='bool',
+            default=False,
+            fallback=(env_fallback, ['ILLUMIO_PCE_STATS'])
+        ),
+        pce_coalesce_requests=dict(
+            type='bool',
+            default=False,
+            fallback=(env_fallback, ['ILLUMIO_PCE_COALESCE_REQUESTS'])
+        ),
     )
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2023 Illumio, Inc. All Rights Reserved.
+
+"""Object specifications shared by the modules that manage a single object
+and the modules that manage objects of several types in one task."""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+from ansible_collections.illumio.core.plugins.module_utils.pce import label_ref_spec  # type: ignore
+
+
+def label_spec() -> dict:
+    """Returns the specification for a label, as used by the label module."""
+    return dict(
+        href=dict(type='str'),
+        # explicitly set no_log to false to avoid ansible-lint false positive
+        # see https://docs.ansible.com/ansible-core/devel/dev_guide/testing/sanity/validate-modules.html
+        key=dict(type='str', no_log=False),
+        value=dict(type='str'),
+        state=dict(
+            type='str',
+            choices=['present', 'absent'],
+            default='present'
+        ),
+        external_data_set=dict(type='str'),
+        external_data_reference=dict(type='str')
+    )
+
+
+def pairing_profile_spec() -> dict:
+    """Returns the specification for a pairing profile, as used by the pairing_profile module."""
+    labels = label_ref_spec()
+    labels['default'] = []
+    return dict(
+        href=dict(type='str'),
+        name=dict(type='str'),
+        # if no description is provided when creating a profile, the PCE will
+        # set the description to an empty string rather than a null value.
+        # defaulting to an empty string ensures that comparisons behave as
+        # expected when determining whether an update is needed.
+        description=dict(type='str', default=''),
+        state=dict(
+            type='str',
+            choices=['present', 'absent'],
+            default='present'
+        ),
+        enabled=dict(type='bool', default=True),
+        enforcement_mode=dict(
+            type='str',
+            choices=['idle', 'visibility_only', 'selective', 'full'],
+            default='idle'
+        ),
+        enforcement_mode_lock=dict(type='bool', default=True),
+        visibility_level=dict(
+            type='str',
+            choices=['flow_summary', 'flow_drops', 'flow_off', 'enhanced_data_collection'],
+            default='flow_summary'
+        ),
+        visibility_level_lock=dict(type='bool', default=True),
+        allowed_uses_per_key=dict(type='str', default='unlimited', no_log=False),
+        key_lifespan=dict(type='str', default='unlimited', no_log=False),
+        ven_version=dict(type='str'),
+        labels=labels,
+        create_missing_labels=dict(type='bool', default=False),
+        role_label_lock=dict(type='bool', default=True),
+        app_label_lock=dict(type='bool', default=True),
+        env_label_lock=dict(type='bool', default=True),
+        loc_label_lock=dict(type='bool', default=True),
+        external_data_set=dict(type='str'),
+        external_data_reference=dict(type='str')
+    )
+
+
+def container_cluster_spec() -> dict:
+    """Returns the specification for a container cluster, as used by the container_cluster module."""
+    return dict(
+        href=dict(type='str'),
+        name=dict(type='str'),
+        description=dict(type='str', default=''),
+        state=dict(
+            type='str',
+            choices=['present', 'absent'],
+            default='present'
+        )
+    )
@@ -175,7 +175,9 @@ import sys
 import traceback
 
 from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+from ansible_collections.illumio.core.plugins.module_utils.fingerprint import CONTAINER_CLUSTER_FINGERPRINT  # type: ignore
 from ansible_collections.illumio.core.plugins.module_utils.pce import PceObjectApi, pce_connection_spec  # type: ignore
+from ansible_collections.illumio.core.plugins.module_utils.specs import container_cluster_spec  # type: ignore
 
 IMPORT_ERROR_TRACEBACK = ''
 
@@ -188,26 +190,15 @@ except ImportError:
 
 
 class ContainerClusterApi(PceObjectApi):
+    fingerprint = CONTAINER_CLUSTER_FINGERPRINT
+
     def __init__(self, module: AnsibleModule) -> None:
         super().__init__(module)
         self._api = self._pce.container_clusters
 
-    def params_match(self, o):
-        return self._module.params.get('name') == getattr(o, 'name', None) \
-            and self._module.params.get('description') == getattr(o, 'description', None)
-
 
 def spec():
-    return dict(
-        href=dict(type='str'),
-        name=dict(type='str'),
-        description=dict(type='str', default=''),
-        state=dict(
-            type='str',
-            choices=['present', 'absent'],
-            default='present'
-        )
-    )
+    return container_cluster_spec()
 
 
 def main():
@@ -258,8 +249,7 @@ def main():
             cluster = container_cluster_api.create(new_cluster)
             changed = True
         else:
-            changed = container_cluster_api.update(existing_cluster, new_cluster)
-            cluster = container_cluster_api.get_by_href(existing_cluster.href) if changed else existing_cluster
+            changed, cluster = container_cluster_api.update_and_get(existing_cluster, new_cluster)
     elif state == 'absent':
         if module.check_mode:
             module.exit_json(changed=True, container_cluster={})
@@ -0,0 +1,397 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright 2023 Illumio, Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: enforcement_rollout
+short_description: Move Illumio PCE managed workloads to an enforcement mode in waves
+description:
+  - This module allows you to move a selected population of managed workloads on the Illumio PCE
+    to a target enforcement mode in waves of a fixed size.
+  - Workloads are selected with a single label-filtered query, sorted by HREF, and split into waves.
+    Each wave is applied using the workload C(bulk_update) endpoint before the next wave starts.
+  - Workloads that are already in the target enforcement mode are skipped, so the rollout can be
+    run again to resume after an interruption. If C(state_file) is set, the wave plan is also saved
+    and the rollout resumes from the last completed wave.
+  - The rollout stops at the first wave with a failed update.
+  - Supports check mode.
+
+author:
+  - Duncan Sommerville (@dsommerville-illumio)
+requirements:
+  - "python>=3.8"
+  - "illumio>=1.1.3"
+version_added: "0.3.0"
+
+options:
+  match_labels:
+    description:
+      - Labels used to select workloads.
+      - Only managed workloads that carry all of these labels are changed.
+    type: list
+    elements: dict
+    required: true
+    suboptions:
+      href:
+        description:
+          - Label HREF.
+          - Mutually exclusive with C(key) and C(value).
+        type: str
+      key:
+        description:
+          - Label key.
+          - Must be set together with C(value).
+        type: str
+      value:
+        description:
+          - Label value.
+          - Must be set together with C(key).
+        type: str
+  enforcement_mode:
+    description: Target enforcement mode.
+    type: str
+    choices: ['idle', 'visibility_only', 'selective', 'full']
+    required: true
+  from_enforcement_mode:
+    description:
+      - If set, only workloads currently in this enforcement mode are changed.
+    type: str
+    choices: ['idle', 'visibility_only', 'selective', 'full']
+  wave_size:
+    description: Number of workloads in each wave.
+    type: int
+    default: 100
+  wave_delay:
+    description:
+      - Seconds to wait after each wave before starting the next.
+      - Not applied in check mode.
+    type: int
+    default: 0
+  max_waves:
+    description:
+      - Maximum number of waves to apply in this task.
+      - Use to run one or more waves at a time and check the health of the
+        changed workloads between tasks. If not set, all remaining waves are applied.
+    type: int
+  state_file:
+    description:
+      - Path of a JSON file used to save the wave plan and the number of completed waves.
+      - If the file exists and was written for the same C(match_labels) and C(enforcement_mode),
+        the rollout resumes after the last completed wave. Otherwise a new plan is written.
+      - The file is written on the host running the module, normally the Ansible controller.
+    type: path
+  batch_size:
+    description:
+      - Maximum number of workloads to send in each bulk request.
+      - The PCE rejects bulk requests with more than 1000 workloads.
+    type: int
+    default: 1000
+  max_workers:
+    description:
+      - Maximum number of bulk requests for a wave to send to the PCE concurrently.
+    type: int
+    default: 4
+
+extends_documentation_fragment:
+  - illumio.core.pce
+'''
+
+EXAMPLES = r'''
+- name: "Move web workloads from visibility_only to full enforcement, 200 at a time"
+  illumio.core.enforcement_rollout:
+    match_labels:
+      - key: app
+        value: A-WEB
+    from_enforcement_mode: visibility_only
+    enforcement_mode: full
+    wave_size: 200
+    wave_delay: 300
+    state_file: /var/lib/illumio/web-rollout.json
+
+- name: "Apply one wave at a time, checking application health in between"
+  block:
+    - name: "Apply the next wave"
+      illumio.core.enforcement_rollout:
+        match_labels:
+          - key: env
+            value: E-PROD
+        enforcement_mode: selective
+        wave_size: 500
+        max_waves: 1
+        state_file: /var/lib/illumio/prod-rollout.json
+      register: rollout
+
+    - name: "Check application health"
+      ansible.builtin.uri:
+        url: https://monitoring.company.com/health
+      when: rollout is changed
+'''
+
+RETURN = r'''
+total_waves:
+  description: Number of waves in the rollout plan.
+  type: int
+  returned: success
+completed_waves:
+  description: Number of waves completed, including those completed by earlier runs of a saved plan.
+  type: int
+  returned: success
+remaining_workloads:
+  description: Number of selected workloads that are not yet in the target enforcement mode.
+  type: int
+  returned: success
+waves:
+  description: Results for each wave applied in this task.
+  type: list
+  elements: dict
+  returned: success
+  contains:
+    wave:
+      description: The wave number, starting from 1.
+      type: int
+      returned: always
+    workloads:
+      description: Number of workloads updated in the wave.
+      type: int
+      returned: always
+    failed:
+      description: Number of workloads that failed to update.
+      type: int
+      returned: always
+failed_workloads:
+  description: Workloads that failed to update.
+  type: list
+  elements: dict
+  returned: success
+  contains:
+    href:
+      description: The workload HREF.
+      type: str
+      returned: always
+    msg:
+      description: Error message returned by the PCE.
+      type: str
+      returned: always
+
+  sample:
+    total_waves: 5
+    completed_waves: 2
+    remaining_workloads: 600
+    waves:
+      - wave: 2
+        workloads: 200
+        failed: 0
+    failed_workloads: []
+'''
+
+import json
+import os
+import sys
+import tempfile
+import time
+import traceback
+
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+from ansible_collections.illumio.core.plugins.module_utils.fingerprint import WORKLOAD_FINGERPRINT  # type: ignore
+from ansible_collections.illumio.core.plugins.module_utils.pce import (  # type: ignore
+    BULK_CHANGE_LIMIT, PceObjectApi, bulk_change, iter_collection, label_ref_spec, pce_connection_spec
+)
+
+IMPORT_ERROR_TRACEBACK = ''
+
+try:
+    from illumio import IllumioApiException
+except ImportError:
+    IllumioApiException = None
+    # replicate the traceback formatting from AnsibleModule.fail_json
+    IMPORT_ERROR_TRACEBACK = ''.join(traceback.format_tb(sys.exc_info()[2]))
+
+ENFORCEMENT_MODES = ['idle', 'visibility_only', 'selective', 'full']
+
+
+class EnforcementRolloutApi(PceObjectApi):
+    fingerprint = WORKLOAD_FINGERPRINT
+
+    def __init__(self, module: AnsibleModule) -> None:
+        super().__init__(module)
+        self._api = self._pce.workloads
+
+    def pending(self, match_labels, enforcement_mode, from_enforcement_mode=None):
+        """Returns the sorted HREFs of the selected managed workloads that
+        aren't in the target enforcement mode, from a single query."""
+        # the labels filter takes a list of label HREF groups, and matches workloads with all labels in any group
+        params = {'managed': 'true', 'labels': json.dumps([match_labels])}
+        if from_enforcement_mode:
+            params['enforcement_mode'] = from_enforcement_mode
+        try:
+            workloads = iter_collection(self._pce, '/workloads', params)
+            return sorted(
+                o['href'] for o in workloads
+                if not self.fingerprint.matches({'enforcement_mode': enforcement_mode}, o)
+            )
+        except IllumioApiException as e:
+            self._module.fail_json(msg="Failed to get workloads: %s" % (str(e)))
+
+    def apply_wave(self, hrefs, enforcement_mode, batch_size, max_workers):
+        """Updates the enforcement mode of each workload in the wave,
+        returning the failed workloads."""
+        objects = [{'href': href, 'enforcement_mode': enforcement_mode} for href in hrefs]
+        pairs = bulk_change(self._pce, '/workloads/bulk_update', objects, 'updated', batch_size, max_workers)
+        return [dict(href=href, msg=msg) for href, (_, msg) in zip(hrefs, pairs) if msg]
+
+
+def plan_waves(pending, wave_size, saved=None):
+    """Splits the pending workloads into waves.
+
+    If a saved plan is given, its waves are kept in order, and workloads
+    that are no longer pending are dropped from the waves still to run.
+    Newly pending workloads, including any that were changed back after
+    their wave completed, are added in extra waves at the end.
+
+    Returns:
+        the list of waves and the number of completed waves.
+    """
+    if not saved:
+        return [pending[i:i + wave_size] for i in range(0, len(pending), wave_size)], 0
+
+    completed = saved['completed']
+    remaining = set(pending)
+    waves = saved['waves'][:completed]
+    for wave in saved['waves'][completed:]:
+        waves.append([href for href in wave if href in remaining])
+        remaining.difference_update(wave)
+    new = sorted(remaining)
+    waves.extend(new[i:i + wave_size] for i in range(0, len(new), wave_size))
+    return waves, completed
+
+
+def load_state(path, plan_id):
+    """Returns the saved plan in the state file if it was written for the same rollout."""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        state = json.load(f)
+    return state if state.get('plan_id') == plan_id else None
+
+
+def save_state(path, plan_id, waves, completed):
+    # write to a temporary file first so an interruption never leaves a partial plan
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.rollout-')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(dict(plan_id=plan_id, waves=waves, completed=completed), f)
+    os.replace(tmp_path, path)
+
+
+def spec():
+    return dict(
+        match_labels=label_ref_spec(required=True),
+        enforcement_mode=dict(type='str', choices=ENFORCEMENT_MODES, required=True),
+        from_enforcement_mode=dict(type='str', choices=ENFORCEMENT_MODES),
+        wave_size=dict(type='int', default=100),
+        wave_delay=dict(type='int', default=0),
+        max_waves=dict(type='int'),
+        state_file=dict(type='path'),
+        batch_size=dict(type='int', default=1000),
+        max_workers=dict(type='int', default=4)
+    )
+
+
+def main():
+    argument_spec = pce_connection_spec()
+    argument_spec.update(spec())
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True
+    )
+
+    if not IllumioApiException:
+        module.fail_json(
+            msg=missing_required_lib('illumio', url='https://pypi.org/project/illumio/'),
+            exception=IMPORT_ERROR_TRACEBACK
+        )
+
+    enforcement_mode = module.params.get('enforcement_mode')
+    from_enforcement_mode = module.params.get('from_enforcement_mode')
+    wave_size = module.params.get('wave_size')
+    wave_delay = module.params.get('wave_delay')
+    max_waves = module.params.get('max_waves')
+    state_file = module.params.get('state_file')
+    batch_size = module.params.get('batch_size')
+    max_workers = module.params.get('max_workers')
+
+    if wave_size < 1:
+        module.fail_json(msg="wave_size must be at least 1")
+    if max_waves is not None and max_waves < 1:
+        module.fail_json(msg="max_waves must be at least 1")
+    if not 0 < batch_size <= BULK_CHANGE_LIMIT:
+        module.fail_json(msg="batch_size must be between 1 and %d" % (BULK_CHANGE_LIMIT))
+    if not module.params.get('match_labels'):
+        module.fail_json(msg="match_labels must contain at least one label")
+
+    rollout_api = EnforcementRolloutApi(module)
+    (match_labels,), _ = rollout_api.resolve_label_refs(module.params.get('match_labels'))
+    match_labels = sorted(href for href, _ in match_labels)
+    pending = rollout_api.pending(match_labels, enforcement_mode, from_enforcement_mode)
+
+    plan_id = json.dumps([match_labels, from_enforcement_mode, enforcement_mode])
+    try:
+        saved = load_state(state_file, plan_id)
+    except (OSError, ValueError) as e:
+        module.fail_json(msg="Failed to read state file %s: %s" % (state_file, e))
+    waves, completed = plan_waves(pending, wave_size, saved)
+
+    # waves left empty by workloads changed outside of the rollout count as complete
+    while completed < len(waves) and not waves[completed]:
+        completed += 1
+
+    results = []
+    failed_workloads = []
+    to_run = len(waves) - completed if max_waves is None else min(max_waves, len(waves) - completed)
+    for n in range(completed, completed + to_run):
+        wave = waves[n]
+        if not wave:
+            completed = n + 1
+            continue
+        if results and wave_delay and not module.check_mode:
+            time.sleep(wave_delay)
+        failed = [] if module.check_mode else rollout_api.apply_wave(wave, enforcement_mode, batch_size, max_workers)
+        results.append(dict(wave=n + 1, workloads=len(wave), failed=len(failed)))
+        failed_workloads.extend(failed)
+        if failed:
+            break
+        completed = n + 1
+
+    if state_file and not module.check_mode:
+        try:
+            save_state(state_file, plan_id, waves, completed)
+        except OSError as e:
+            module.fail_json(msg="Failed to write state file %s: %s" % (state_file, e))
+
+    updated = sum(r['workloads'] - r['failed'] for r in results)
+    remaining = sum(len(wave) for wave in waves[completed:])
+    output = dict(
+        changed=updated > 0,
+        total_waves=len(waves),
+        completed_waves=completed,
+        remaining_workloads=remaining,
+        waves=results,
+        failed_workloads=failed_workloads
+    )
+    if failed_workloads:
+        module.fail_json(
+            msg="Failed to update %d workload(s) in wave %d: %s" % (
+                len(failed_workloads), results[-1]['wave'], failed_workloads[0]['msg']
+            ),
+            **output
+        )
+    module.exit_json(**output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright 2023 Illumio, Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: ip_list
+short_description: Create/update/delete Illumio PCE IP lists
+description:
+  - This module allows you to create and manipulate draft IP list objects on the Illumio PCE.
+  - IP ranges are compared as sets of addresses. Ranges are merged into sorted, non-overlapping intervals before
+    being compared, so overlapping, adjacent or reordered ranges covering the same addresses don't cause an update.
+  - When the IP list is updated, the merged ranges are sent to the PCE, and the ranges added and removed
+    are returned in C(ip_ranges_diff) rather than the full list.
+  - Per-range descriptions are not managed, and are replaced when the ranges of an existing IP list are updated.
+  - Changes are only made to the draft policy version. Changed IP lists are recorded on the controller,
+    and are provisioned together with all other recorded draft changes by the M(illumio.core.provision) module.
+  - Supports check mode.
+
+author:
+  - Duncan Sommerville (@dsommerville-illumio)
+requirements:
+  - "python>=3.8"
+  - "illumio>=1.1.3"
+version_added: "0.3.0"
+
+options:
+  href:
+    description: HREF of an existing IP list.
+    type: str
+  name:
+    description:
+      - IP list name.
+      - Required for creating an IP list or when C(href) is not specified.
+      - IP lists are looked up by exact name.
+    type: str
+  description:
+    description: IP list description.
+    type: str
+    default: ''
+  ip_ranges:
+    description:
+      - IP ranges in the list.
+      - Each range is a single IPv4 or IPv6 address, a CIDR block, or a hyphenated address range such as C(10.0.0.1-10.0.0.20).
+      - Prefix a range with C(!) to exclude it from the list.
+      - If not set, the ranges of an existing IP list are left unchanged.
+    type: list
+    elements: str
+  fqdns:
+    description:
+      - Fully-qualified domain names in the list.
+      - If not set, the FQDNs of an existing IP list are left unchanged.
+    type: list
+    elements: str
+  external_data_set:
+    description:
+      - External data set identifier.
+      - Must be set if using C(external_data_reference).
+    type: str
+  external_data_reference:
+    description:
+      - External data reference identifier.
+      - Must be set if using C(external_data_set).
+    type: str
+  state:
+    description:
+      - Desired IP list state.
+      - If C(present), the IP list will be created if it does not exist, or updated to match the provided parameters if it does.
+      - If C(absent), the IP list will be removed if it exists.
+    type: str
+    choices: ['present', 'absent']
+    default: 'present'
+
+extends_documentation_fragment:
+  - illumio.core.pce
+'''
+
+EXAMPLES = r'''
+- name: "Create IP list"
+  illumio.core.ip_list:
+    name: IPL-INTERNAL
+    description: Internal networks
+    ip_ranges:
+      - 10.0.0.0/8
+      - 172.16.0.0/12
+      - 192.168.0.0/16
+      - "!192.168.100.0/24"
+    state: present
+
+- name: "Sync IP list from a threat feed"
+  illumio.core.ip_list:
+    name: IPL-BLOCKLIST
+    ip_ranges: "{{ lookup('file', 'blocklist.txt').splitlines() }}"
+  register: ip_list_result
+
+- name: "Remove IP list"
+  illumio.core.ip_list:
+    name: IPL-INTERNAL
+    state: absent
+'''
+
+RETURN = r'''
+ip_list:
+  description:
+    - Information about the IP list that was created or updated.
+    - The list's IP ranges are not included. See C(ip_ranges_diff) for the ranges that were changed.
+  type: complex
+  returned: success
+  contains:
+    href:
+      description: The IP list's HREF.
+      type: str
+      returned: always
+    name:
+      description: The IP list's name.
+      type: str
+      returned: always
+    description:
+      description: A description of the IP list.
+      type: str
+      returned: always
+    fqdns:
+      description: FQDNs in the IP list.
+      type: list
+      elements: dict
+      returned: always
+    external_data_set:
+      description: The IP list's external data set identifier.
+      type: str
+      returned: always
+    external_data_reference:
+      description: The IP list's external data reference identifier.
+      type: str
+      returned: always
+
+  sample:
+    ip_list:
+      href: /orgs/1/sec_policy/draft/ip_lists/22
+      name: IPL-INTERNAL
+      description: Internal networks
+      fqdns: []
+      external_data_set: null
+      external_data_reference: null
+ip_ranges_diff:
+  description:
+    - The merged IP ranges added to and removed from the IP list.
+    - Ranges are returned as single addresses, CIDR blocks, or hyphenated address ranges, with exclusions prefixed with C(!).
+  type: complex
+  returned: when state is present and ip_ranges is set
+  contains:
+    added:
+      description: Ranges of addresses added to the IP list.
+      type: list
+      elements: str
+      returned: always
+    removed:
+      description: Ranges of addresses removed from the IP list.
+      type: list
+      elements: str
+      returned: always
+
+  sample:
+    ip_ranges_diff:
+      added:
+        - 10.0.2.0/23
+        - "!192.168.100.0/24"
+      removed:
+        - 10.0.1.128-10.0.1.200
+'''
+
+import sys
+import traceback
+
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+from ansible_collections.illumio.core.plugins.module_utils.fingerprint import IP_LIST_FINGERPRINT  # type: ignore
+from ansible_collections.illumio.core.plugins.module_utils.ip_ranges import (  # type: ignore
+    normalize, subtract, to_ip_ranges, to_strings
+)
+from ansible_collections.illumio.core.plugins.module_utils.pce import PceObjectApi, pce_connection_spec  # type: ignore
+
+IMPORT_ERROR_TRACEBACK = ''
+
+try:
+    from illumio import FQDN, IPList, IPRange
+except ImportError:
+    IPList = None
+    # replicate the traceback formatting from AnsibleModule.fail_json
+    IMPORT_ERROR_TRACEBACK = ''.join(traceback.format_tb(sys.exc_info()[2]))
+
+
+class IPListApi(PceObjectApi):
+    fingerprint = IP_LIST_FINGERPRINT
+
+    def __init__(self, module: AnsibleModule) -> None:
+        super().__init__(module)
+        self._api = self._pce.ip_lists
+
+    def get_by_name(self, name: str):
+        # the name filter matches on substrings, so find the exact match
+        for o in self.get_all({'name': name}):
+            if o.name == name:
+                return o
+        return None
+
+    def ip_ranges_diff(self, o, included, excluded):
+        """Returns the merged ranges added and removed by replacing the
+        remote object's ranges, with a single pass over each sorted list."""
+        remote_included, remote_excluded = normalize(self.json_output(o).get('ip_ranges') if o else [])
+        return dict(
+            added=to_strings(subtract(included, remote_included), subtract(excluded, remote_excluded)),
+            removed=to_strings(subtract(remote_included, included), subtract(remote_excluded, excluded))
+        )
+
+    def output(self, o):
+        ip_list = self.json_output(o)
+        ip_list.pop('ip_ranges', None)
+        return ip_list
+
+
+def spec():
+    return dict(
+        href=dict(type='str'),
+        name=dict(type='str'),
+        description=dict(type='str', default=''),
+        ip_ranges=dict(type='list', elements='str'),
+        fqdns=dict(type='list', elements='str'),
+        external_data_set=dict(type='str'),
+        external_data_reference=dict(type='str'),
+        state=dict(
+            type='str',
+            choices=['present', 'absent'],
+            default='present'
+        )
+    )
+
+
+def main():
+    argument_spec = pce_connection_spec()
+    argument_spec.update(spec())
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        required_one_of=[['name', 'href']],
+        required_together=[['external_data_set', 'external_data_reference']],
+        supports_check_mode=True
+    )
+
+    if not IPList:
+        module.fail_json(
+            msg=missing_required_lib('illumio', url='https://pypi.org/project/illumio/'),
+            exception=IMPORT_ERROR_TRACEBACK
+        )
+
+    ip_list_api = IPListApi(module)
+
+    href = module.params.get('href')
+    name = module.params.get('name')
+    description = module.params.get('description')
+    ip_ranges = module.params.get('ip_ranges')
+    fqdns = module.params.get('fqdns')
+    state = module.params.get('state')
+    external_data_set = module.params.get('external_data_set')
+    external_data_reference = module.params.get('external_data_reference')
+
+    if href:
+        existing_ip_list = ip_list_api.get_by_href(href)
+        if not existing_ip_list:
+            module.fail_json("No IP list found with HREF %s" % (href))
+    elif name:
+        existing_ip_list = ip_list_api.get_by_name(name)
+
+    if state == 'present':
+        if not name and not existing_ip_list:
+            module.fail_json(msg="name is required to create an IP list")
+
+        diff = {}
+        new_ip_list = IPList(
+            name=name,
+            description=description,
+            fqdns=[FQDN(fqdn=fqdn) for fqdn in fqdns] if fqdns is not None else None,
+            external_data_set=external_data_set,
+            external_data_reference=external_data_reference
+        )
+        if ip_ranges is not None:
+            try:
+                included, excluded = normalize(ip_ranges)
+            except ValueError as e:
+                module.fail_json(msg="Invalid IP range: %s" % (e))
+            new_ip_list.ip_ranges = [IPRange.from_json(r) for r in to_ip_ranges(included, excluded)]
+            diff = dict(ip_ranges_diff=ip_list_api.ip_ranges_diff(existing_ip_list, included, excluded))
+
+        if module.check_mode:
+            if not existing_ip_list:
+                module.exit_json(changed=True, ip_list=ip_list_api.output(new_ip_list), **diff)
+            module.exit_json(
+                changed=not ip_list_api.params_match(existing_ip_list),
+                ip_list=ip_list_api.output(new_ip_list),
+                **diff
+            )
+
+        if not existing_ip_list:
+            ip_list = ip_list_api.create(new_ip_list)
+            changed = True
+        else:
+            changed, ip_list = ip_list_api.update_and_get(existing_ip_list, new_ip_list)
+        module.exit_json(changed=changed, ip_list=ip_list_api.output(ip_list), **diff)
+    elif state == 'absent':
+        if module.check_mode:
+            module.exit_json(changed=True, ip_list={})
+
+        changed = ip_list_api.delete(existing_ip_list)
+        module.exit_json(changed=changed, ip_list={})
+
+
+if __name__ == '__main__':
+    main()
@@ -147,7 +147,9 @@ import sys
 import traceback
 
 from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+from ansible_collections.illumio.core.plugins.module_utils.fingerprint import LABEL_FINGERPRINT  # type: ignore
 from ansible_collections.illumio.core.plugins.module_utils.pce import PceObjectApi, pce_connection_spec  # type: ignore
+from ansible_collections.illumio.core.plugins.module_utils.specs import label_spec  # type: ignore
 
 IMPORT_ERROR_TRACEBACK = ''
 
@@ -160,34 +162,15 @@ except ImportError:
 
 
 class LabelApi(PceObjectApi):
+    fingerprint = LABEL_FINGERPRINT
+
     def __init__(self, module: AnsibleModule) -> None:
         super().__init__(module)
         self._api = self._pce.labels
 
-    def params_match(self, o):
-        ignore_params = ['href', 'state']
-        params = [k for k in spec().keys() if k not in ignore_params]
-        for k in params:
-            if self._module.params.get(k) != getattr(o, k, None):
-                return False
-        return True
-
 
 def spec():
-    return dict(
-        href=dict(type='str'),
-        # explicitly set no_log to false to avoid ansible-lint false positive
-        # see https://docs.ansible.com/ansible-core/devel/dev_guide/testing/sanity/validate-modules.html
-        key=dict(type='str', no_log=False),
-        value=dict(type='str'),
-        state=dict(
-            type='str',
-            choices=['present', 'absent'],
-            default='present'
-        ),
-        external_data_set=dict(type='str'),
-        external_data_reference=dict(type='str')
-    )
+    return label_spec()
 
 
 def main():
@@ -252,8 +235,7 @@ def main():
             if new_label.key != existing_label.key:
                 module.fail_json("Unable to update key of existing label")
             new_label.key = None  # null the key so it isn't passed in the request
-            changed = label_api.update(existing_label, new_label)
-            label = label_api.get_by_href(existing_label.href) if changed else existing_label
+            changed, label = label_api.update_and_get(existing_label, new_label)
     elif state == 'absent':
         if module.check_mode:
             module.exit_json(changed=True, label={})
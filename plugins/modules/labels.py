@@ -0,0 +1,367 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright 2023 Illumio, Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: labels
+short_description: Create/update/delete Illumio PCE labels in bulk
+description:
+  - This module allows you to manage a list of label objects on the Illumio PCE in a single task.
+  - The existing label catalog is fetched once and compared against the given labels by key and value,
+    and only the required creates, updates and deletes are sent to the PCE.
+  - If C(reconcile_external_data_set) is set, the labels on the PCE with that external data set are made
+    to match the given labels exactly.
+  - Supports check mode.
+
+author:
+  - Duncan Sommerville (@dsommerville-illumio)
+requirements:
+  - "python>=3.8"
+  - "illumio>=1.1.3"
+version_added: "0.3.0"
+
+options:
+  labels:
+    description:
+      - List of labels to manage.
+      - Each key/value pair may only appear once in the list.
+    type: list
+    elements: dict
+    required: true
+    suboptions:
+      key:
+        description: Label dimension key.
+        type: str
+        required: true
+      value:
+        description: Label name in the PCE.
+        type: str
+        required: true
+      state:
+        description:
+          - Desired label state.
+          - If C(present), the label will be created if it does not exist, or updated to match the provided parameters if it does.
+          - If C(absent), the label will be removed if it exists.
+        type: str
+        choices: ['present', 'absent']
+        default: 'present'
+      external_data_set:
+        description:
+          - External data set identifier.
+          - Must be set if using C(external_data_reference).
+          - If not set, the external data values of an existing label are left unchanged.
+        type: str
+      external_data_reference:
+        description:
+          - External data reference identifier.
+          - Must be set if using C(external_data_set).
+        type: str
+  reconcile_external_data_set:
+    description:
+      - External data set identifier of the labels managed exclusively by this task.
+      - Labels on the PCE with this C(external_data_set) that are not in C(labels) are deleted.
+      - Labels that are still in use by other PCE objects are not deleted and are reported with the C(skipped) action.
+      - Every label in C(labels) with C(state=present) must set C(external_data_set) to this value.
+    type: str
+  max_workers:
+    description:
+      - Maximum number of create, update and delete requests to send to the PCE concurrently.
+    type: int
+    default: 4
+
+extends_documentation_fragment:
+  - illumio.core.pce
+'''
+
+EXAMPLES = r'''
+- name: "Create application labels"
+  illumio.core.labels:
+    labels:
+      - key: app
+        value: A-WEB
+      - key: app
+        value: A-DB
+        external_data_set: cmdb
+        external_data_reference: app-0042
+
+- name: "Sync labels from CMDB data"
+  illumio.core.labels:
+    labels: "{{ cmdb_labels }}"
+  register: labels_result
+
+- name: "Make the labels from the CMDB data set match the CMDB exactly"
+  illumio.core.labels:
+    labels: "{{ cmdb_labels }}"
+    reconcile_external_data_set: cmdb
+
+- name: "Remove labels"
+  illumio.core.labels:
+    labels:
+      - key: env
+        value: Test
+        state: absent
+'''
+
+RETURN = r'''
+labels:
+  description:
+    - Per-label results, in the same order as the C(labels) option.
+    - If C(reconcile_external_data_set) is set, results for labels removed from the external data set follow.
+  type: list
+  elements: dict
+  returned: success
+  contains:
+    key:
+      description: The label key.
+      type: str
+      returned: always
+    value:
+      description: The label value.
+      type: str
+      returned: always
+    action:
+      description: The change made for this label.
+      type: str
+      returned: always
+      choices: ['created', 'updated', 'deleted', 'skipped', 'unchanged']
+    changed:
+      description: Flag denoting whether the label was changed.
+      type: bool
+      returned: always
+    label:
+      description:
+        - The label object after the change was applied.
+        - Empty if the label was deleted or does not exist.
+      type: dict
+      returned: always
+    msg:
+      description: Error message returned by the PCE if the change failed.
+      type: str
+      returned: on failure
+
+  sample:
+    labels:
+      - key: app
+        value: A-WEB
+        action: created
+        changed: true
+        label:
+          href: /orgs/1/labels/1500
+          key: app
+          value: A-WEB
+'''
+
+import sys
+import traceback
+
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+from ansible_collections.illumio.core.plugins.module_utils.fingerprint import LABEL_FINGERPRINT  # type: ignore
+from ansible_collections.illumio.core.plugins.module_utils.pce import (  # type: ignore
+    PceObjectApi, iter_collection, pce_connection_spec, run_concurrently
+)
+
+IMPORT_ERROR_TRACEBACK = ''
+
+try:
+    from illumio import Label, IllumioApiException
+except ImportError:
+    Label = None
+    # replicate the traceback formatting from AnsibleModule.fail_json
+    IMPORT_ERROR_TRACEBACK = ''.join(traceback.format_tb(sys.exc_info()[2]))
+
+EXTERNAL_DATA_PARAMS = ['external_data_set', 'external_data_reference']
+
+
+class LabelsApi(PceObjectApi):
+    fingerprint = LABEL_FINGERPRINT
+
+    def __init__(self, module: AnsibleModule) -> None:
+        super().__init__(module)
+        self._api = self._pce.labels
+
+    def params_match(self, o, label=None):
+        # external data values that aren't explicitly set are null in the
+        # desired state, so the fingerprint leaves them unmanaged
+        return self.fingerprint.matches(label, self.json_output(o))
+
+    def plan(self, labels, reconcile_external_data_set=None):
+        """Builds a (label, existing_label, action) list for the given labels
+        from a single fetch of the label catalog.
+
+        If reconcile_external_data_set is set, labels in that external data
+        set that aren't in the given labels are also planned for deletion,
+        unless they are still in use.
+        """
+        catalog = {}
+        usage = {}
+        # usage flags are only needed to check labels before reconcile deletes
+        params = {'usage': 'true'} if reconcile_external_data_set else {}
+        try:
+            # decode labels here rather than with get_all, as the SDK drops
+            # the usage flags it doesn't know about, such as workload
+            for o in iter_collection(self._pce, '/labels', params):
+                label = Label.from_json(o)
+                catalog[(label.key, label.value)] = label
+                usage[label.href] = o.get('usage')
+        except IllumioApiException as e:
+            self._module.fail_json(msg="Failed to get PCE objects: %s" % (e))
+
+        changes = []
+        for label in labels:
+            existing_label = catalog.get((label['key'], label['value']))
+            if label['state'] == 'present':
+                if not existing_label:
+                    action = 'created'
+                elif not self.params_match(existing_label, label):
+                    action = 'updated'
+                else:
+                    action = 'unchanged'
+            else:
+                action = 'deleted' if existing_label else 'unchanged'
+            changes.append((label, existing_label, action))
+
+        if reconcile_external_data_set:
+            desired = {(label['key'], label['value']) for label in labels}
+            for (key, value), o in catalog.items():
+                if o.external_data_set != reconcile_external_data_set or (key, value) in desired:
+                    continue
+                label = dict(key=key, value=value, state='absent', external_data_set=None, external_data_reference=None)
+                # labels without usage flags are treated as in use rather than risk a failed delete
+                in_use = usage.get(o.href) is None or any(usage[o.href].values())
+                changes.append((label, o, 'skipped' if in_use else 'deleted'))
+        return changes
+
+    def apply(self, change):
+        label, existing_label, action = change
+        check_mode = self._module.check_mode
+        try:
+            if action == 'created':
+                existing_label = Label(
+                    key=label['key'],
+                    value=label['value'],
+                    external_data_set=label['external_data_set'],
+                    external_data_reference=label['external_data_reference']
+                )
+                if not check_mode:
+                    existing_label = self._api.create(existing_label)
+            elif action == 'updated':
+                update = Label(**{k: label[k] for k in EXTERNAL_DATA_PARAMS})
+                if not check_mode:
+                    self._api.update(existing_label.href, update)
+                existing_label = self.merge(existing_label, update)
+            elif action == 'deleted':
+                if not check_mode:
+                    self._api.delete(existing_label.href)
+                existing_label = None
+        except IllumioApiException as e:
+            return self.result(label, existing_label, action, msg=str(e))
+        return self.result(label, existing_label, action)
+
+    def result(self, label, o, action, msg=None):
+        result = dict(
+            key=label['key'],
+            value=label['value'],
+            action=action,
+            changed=action not in ('unchanged', 'skipped') and msg is None,
+            label=self.json_output(o) if o else {}
+        )
+        if msg is not None:
+            result['msg'] = msg
+        return result
+
+
+def spec():
+    return dict(
+        labels=dict(
+            type='list',
+            elements='dict',
+            required=True,
+            options=dict(
+                # explicitly set no_log to false to avoid ansible-lint false positive
+                # see https://docs.ansible.com/ansible-core/devel/dev_guide/testing/sanity/validate-modules.html
+                key=dict(type='str', required=True, no_log=False),
+                value=dict(type='str', required=True),
+                state=dict(
+                    type='str',
+                    choices=['present', 'absent'],
+                    default='present'
+                ),
+                external_data_set=dict(type='str'),
+                external_data_reference=dict(type='str')
+            ),
+            required_together=[['external_data_set', 'external_data_reference']]
+        ),
+        reconcile_external_data_set=dict(type='str'),
+        max_workers=dict(type='int', default=4)
+    )
+
+
+def main():
+    argument_spec = pce_connection_spec()
+    argument_spec.update(spec())
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True
+    )
+
+    if not Label:
+        module.fail_json(
+            msg=missing_required_lib('illumio', url='https://pypi.org/project/illumio/'),
+            exception=IMPORT_ERROR_TRACEBACK
+        )
+
+    labels = module.params.get('labels')
+    reconcile_external_data_set = module.params.get('reconcile_external_data_set')
+    max_workers = module.params.get('max_workers')
+
+    seen = set()
+    for label in labels:
+        label_id = (label['key'], label['value'])
+        if label_id in seen:
+            module.fail_json(msg="Duplicate label in labels: %s=%s" % label_id)
+        seen.add(label_id)
+
+    if reconcile_external_data_set:
+        unscoped = [
+            "%s=%s" % (label['key'], label['value']) for label in labels
+            if label['state'] == 'present' and label['external_data_set'] != reconcile_external_data_set
+        ]
+        if unscoped:
+            module.fail_json(msg="Labels must set external_data_set to %s when reconciling: %s" % (
+                reconcile_external_data_set, ', '.join(unscoped)
+            ))
+
+    labels_api = LabelsApi(module)
+    changes = labels_api.plan(labels, reconcile_external_data_set)
+
+    # in check mode, apply builds the expected results without sending any requests
+    results = run_concurrently(labels_api.apply, changes, max_workers=max_workers)
+    if not module.check_mode and any(action != 'unchanged' for _, _, action in changes):
+        labels_api.invalidate_cache()
+
+    skipped = [result for result in results if result['action'] == 'skipped']
+    if skipped:
+        module.warn("Skipped deleting %d label(s) that are still in use: %s" % (
+            len(skipped), ', '.join("%s=%s" % (result['key'], result['value']) for result in skipped)
+        ))
+
+    changed = any(result['changed'] for result in results)
+    failed = [result for result in results if 'msg' in result]
+    if failed:
+        module.fail_json(
+            msg="Failed to apply changes for %d label(s): %s" % (len(failed), failed[0]['msg']),
+            changed=changed,
+            labels=results
+        )
+
+    module.exit_json(changed=changed, labels=results)
+
+
+if __name__ == '__main__':
+    main()
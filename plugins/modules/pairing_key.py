@@ -13,6 +13,9 @@ module: pairing_key
 short_description: Generate pairing key from an Illumio PCE pairing profile
 description:
   - This module allows you to generate pairing keys on the Illumio PCE that can be used to pair Illumio VEN agents
+  - Multiple keys can be generated in a single task using C(count) or C(hosts), so a whole group of hosts
+    can be paired with keys from one C(run_once) task.
+  - Set C(pool_size) to hand out multi-use keys from a pool kept on the controller instead of generating a key for each host.
   - Supports check mode.
 
 author:
@@ -29,6 +32,48 @@ options:
   pairing_profile_href:
     description: HREF of an existing pairing profile.
     type: str
+  count:
+    description:
+      - Number of pairing keys to generate.
+      - If neither C(count) nor C(hosts) is set, a single key is generated.
+      - Mutually exclusive with C(hosts).
+    type: int
+  hosts:
+    description:
+      - List of hosts to generate pairing keys for.
+      - One key is generated for each host, and keys are returned in C(pairing_keys_by_host).
+      - Mutually exclusive with C(count).
+    type: list
+    elements: str
+  max_workers:
+    description:
+      - Maximum number of pairing keys to generate concurrently.
+    type: int
+    default: 4
+  pool_size:
+    description:
+      - Number of multi-use pairing keys to keep in the controller's key pool for the pairing profile.
+      - If set, keys are handed out from the pool round-robin, rather than a new key being generated for each host.
+        New keys are only generated to replace keys that have been handed out as many times as the profile's
+        C(allowed_uses_per_key) allows, or that are close to the end of the profile's C(key_lifespan).
+        Keys stop being handed out five minutes, or half their lifespan if shorter, before they expire.
+      - If the pairing profile's C(allowed_uses_per_key) is lower than the number of hosts divided by C(pool_size),
+        more than C(pool_size) keys are generated to cover the hosts in the task and a warning is returned,
+        unless C(update_pairing_profile) is set.
+      - Hosts in C(hosts) that were already given a key from the pool get the same key again until it expires.
+      - The pool is kept in the C(pce_cache_dir) directory for each PCE, org and pairing profile,
+        and is shared by all tasks using the profile, so it can be used from tasks that run on every host.
+      - The task only reports a change if keys were generated or the pairing profile was updated.
+    type: int
+  update_pairing_profile:
+    description:
+      - If set, the pairing profile's C(allowed_uses_per_key) is raised to the number of hosts divided by C(pool_size)
+        before any keys are generated, so the pool can cover the hosts in the task without growing.
+      - Leave unset if the pairing profile is managed with M(illumio.core.pairing_profile),
+        as the two tasks would otherwise keep changing the profile back and forth.
+      - Only used if C(pool_size) is set.
+    type: bool
+    default: false
 
 extends_documentation_fragment:
   - illumio.core.pce
@@ -44,20 +89,81 @@ EXAMPLES = r'''
   illumio.core.pairing_key:
     pairing_profile_href: /orgs/1/pairing_profiles/1
   register: pairing_key_result
+
+- name: "Generate pairing keys for all hosts in the play"
+  illumio.core.pairing_key:
+    pairing_profile_name: Default
+    hosts: "{{ ansible_play_batch }}"
+  run_once: true
+  delegate_to: localhost
+  register: pairing_key_result
+
+- name: "Set pairing key for each host"
+  ansible.builtin.set_fact:
+    pairing_key: "{{ pairing_key_result.pairing_keys_by_host[inventory_hostname] }}"
+
+- name: "Pair hosts in waves with keys from a pool of 4 multi-use keys"
+  illumio.core.pairing_key:
+    pairing_profile_name: Default
+    hosts: "{{ ansible_play_batch }}"
+    pool_size: 4
+    update_pairing_profile: true
+  run_once: true
+  delegate_to: localhost
+  register: pairing_key_result
 '''
 
 RETURN = r'''
 pairing_key:
-    description: The generated pairing key.
+    description:
+      - The generated pairing key.
+      - If multiple keys are generated, this is the first key in C(pairing_keys).
     type: str
     returned: success
+pairing_keys:
+    description: List of all generated pairing keys.
+    type: list
+    elements: str
+    returned: success
+pairing_keys_by_host:
+    description: Mapping of each host in C(hosts) to its generated pairing key.
+    type: dict
+    returned: when C(hosts) is set
+    sample:
+      web01: 6d9e2b8e0d2ab3b6f8a0bd9b5e0a7a6e3b4c7c1e9f8e7d6c5b4a39281706f5e4
+key_pool:
+    description: Information about the key pool that the keys were handed out from.
+    type: complex
+    returned: when C(pool_size) is set
+    contains:
+      generated:
+        description: Number of new keys generated for the pool.
+        type: int
+        returned: always
+      allowed_uses_per_key:
+        description: The number of times each new key can be used, or C(unlimited).
+        type: str
+        returned: always
+      profile_updated:
+        description:
+          - Flag denoting whether the pairing profile's C(allowed_uses_per_key) was raised to cover the hosts.
+          - Only ever set if C(update_pairing_profile) is set.
+        type: bool
+        returned: always
+    sample:
+      key_pool:
+        generated: 1
+        allowed_uses_per_key: "250"
+        profile_updated: false
 '''
 
 import sys
 import traceback
 
 from ansible.module_utils.basic import AnsibleModule, missing_required_lib
-from ansible_collections.illumio.core.plugins.module_utils.pce import PceApiBase, pce_connection_spec  # type: ignore
+from ansible_collections.illumio.core.plugins.module_utils.pce import (  # type: ignore
+    PairingKeyPool, PceApiBase, pce_cache_dir, pce_connection_spec, run_concurrently
+)
 
 IMPORT_ERROR_TRACEBACK = ''
 
@@ -70,26 +176,128 @@ except ImportError:
 
 
 class PairingKeyApi(PceApiBase):
-    def get_by_profile_href(self, profile_href):
+    def get_by_profile_href(self, profile_href, count=1, max_workers=1):
+        def generate(_):
+            try:
+                return self._pce.generate_pairing_key(profile_href), None
+            except IllumioApiException as e:
+                return None, e
+
+        results = run_concurrently(generate, list(range(count)), max_workers=max_workers)
+        errors = [e for _, e in results if e]
+        if errors:
+            self._module.fail_json(
+                "Failed to generate %d of %d pairing key(s) for profile with HREF '%s': %s" % (
+                    len(errors), count, profile_href, errors[0]
+                )
+            )
+        return [pairing_key for pairing_key, _ in results]
+
+    def get_by_profile_name(self, profile_name, count=1, max_workers=1):
+        profile_href = self._resolve_profile_href(profile_name)
+        cache = self.href_cache('pairing_profiles')
+        if cache is not None:
+            try:
+                pairing_key = self._pce.generate_pairing_key(profile_href)
+                return [pairing_key] + self.get_by_profile_href(profile_href, count - 1, max_workers)
+            except IllumioApiException:
+                # the cached profile may have been removed outside of this collection
+                cache.invalidate()
+                profile_href = self._resolve_profile_href(profile_name)
+        return self.get_by_profile_href(profile_href, count, max_workers)
+
+    def get_from_pool(self, hosts, pool_size, max_workers=1, profile_href=None, profile_name=None, update_profile=False):
+        """Hands out a key for each host from the controller's key pool for
+        the profile, generating keys only to refill the pool.
+
+        Returns:
+            Tuple[List[str], dict]: the key for each host, and the pool information.
+        """
+        if profile_href:
+            profile = self._get_profile(profile_href)
+        else:
+            profile = self._get_profile(self._resolve_profile_href(profile_name), profile_name)
+        profile_href = profile['href']
+        allowed_uses = _as_int(profile.get('allowed_uses_per_key'))
+        lifespan = _as_int(profile.get('key_lifespan'))
+
+        # size each key's uses to the wave, so the pool covers it without growing
+        wave_uses = -(-len(hosts) // pool_size)
+        profile_updated = False
+        if allowed_uses is not None and allowed_uses < wave_uses:
+            if not update_profile:
+                # the profile may be managed elsewhere, so it's only changed on request
+                self._module.warn(
+                    "Pairing profile with HREF '%s' allows %d use(s) per key, so more than %d key(s) are needed "
+                    "for %d host(s); set allowed_uses_per_key to at least %d or set update_pairing_profile" % (
+                        profile_href, allowed_uses, pool_size, len(hosts), wave_uses
+                    )
+                )
+            else:
+                try:
+                    self._pce.put(profile_href, json={'allowed_uses_per_key': wave_uses}, include_org=False)
+                except IllumioApiException as e:
+                    self._module.fail_json(msg="Failed to update pairing profile with HREF '%s': %s" % (profile_href, e))
+                allowed_uses = wave_uses
+                profile_updated = True
+
+        pool = PairingKeyPool(pce_cache_dir(self._module), self._connection_id(), profile_href)
+        try:
+            pairing_keys, generated = pool.checkout(
+                hosts, pool_size, lambda count: self.get_by_profile_href(profile_href, count, max_workers),
+                allowed_uses, lifespan
+            )
+        except ValueError as e:
+            self._module.fail_json(msg="Failed to hand out pairing keys for profile with HREF '%s': %s" % (profile_href, e))
+        return pairing_keys, dict(
+            generated=generated,
+            allowed_uses_per_key=str(allowed_uses) if allowed_uses is not None else 'unlimited',
+            profile_updated=profile_updated
+        )
+
+    def _get_profile(self, profile_href, profile_name=None):
         try:
-            return self._pce.generate_pairing_key(profile_href)
+            return self._pce.get(profile_href, include_org=False).json()
         except IllumioApiException as e:
-            self._module.fail_json("Failed to generate pairing key for profile with HREF '%s': %s" % (profile_href, e))
+            cache = self.href_cache('pairing_profiles')
+            if profile_name and cache is not None:
+                # the cached profile may have been removed outside of this collection
+                cache.invalidate()
+                return self._get_profile(self._resolve_profile_href(profile_name))
+            self._module.fail_json(msg="Failed to get pairing profile with HREF '%s': %s" % (profile_href, e))
 
-    def get_by_profile_name(self, profile_name):
+    def _resolve_profile_href(self, profile_name):
+        profile_href = self.cached_href(
+            'pairing_profiles',
+            {'name': profile_name},
+            lambda: self._get_profile_href(profile_name)
+        )
+        if not profile_href:
+            self._module.fail_json("No pairing profile found with name '%s'" % profile_name)
+        return profile_href
+
+    def _get_profile_href(self, profile_name):
         try:
             profiles = self._pce.pairing_profiles.get(params={'name': profile_name, 'max_results': 1})
-            if not profiles:
-                self._module.fail_json("No pairing profile found with name '%s'" % profile_name)
-            return self.get_by_profile_href(profiles[0].href)
+            return profiles[0].href if profiles else None
         except IllumioApiException as e:
             self._module.fail_json(msg="Failed to get pairing profile with name '%s': %s" % (profile_name, e))
 
 
+def _as_int(value):
+    # allowed_uses_per_key and key_lifespan are integers, or 'unlimited'
+    return int(value) if str(value).isnumeric() else None
+
+
 def spec():
     return dict(
         pairing_profile_name=dict(type='str'),
-        pairing_profile_href=dict(type='str')
+        pairing_profile_href=dict(type='str'),
+        count=dict(type='int'),
+        hosts=dict(type='list', elements='str'),
+        max_workers=dict(type='int', default=4),
+        pool_size=dict(type='int'),
+        update_pairing_profile=dict(type='bool', default=False)
     )
 
 
@@ -100,6 +308,7 @@ def main():
     module = AnsibleModule(
         argument_spec=argument_spec,
         required_one_of=[['pairing_profile_name', 'pairing_profile_href']],
+        mutually_exclusive=[['count', 'hosts']],
         supports_check_mode=True
     )
 
@@ -109,22 +318,61 @@ def main():
             exception=IMPORT_ERROR_TRACEBACK
         )
 
+    hosts = module.params.get('hosts')
+    count = module.params.get('count')
+    max_workers = module.params.get('max_workers')
+    pool_size = module.params.get('pool_size')
+
+    if pool_size is not None and pool_size < 1:
+        module.fail_json("pool_size must be greater than 0")
+
+    if hosts is not None:
+        hosts = list(dict.fromkeys(hosts))  # remove duplicates, preserving order
+        count = len(hosts)
+    elif count is None:
+        count = 1
+    elif count < 1:
+        module.fail_json("count must be greater than 0")
+
     if module.check_mode:
-        module.exit_json(changed=True, pairing_key='')
+        result = dict(changed=True, pairing_key='', pairing_keys=[])
+        if hosts is not None:
+            result['pairing_keys_by_host'] = {}
+        module.exit_json(**result)
 
     pairing_key_api = PairingKeyApi(module)
 
     profile_name = module.params.get('pairing_profile_name')
     profile_href = module.params.get('pairing_profile_href')
 
-    if profile_href:
-        pairing_key = pairing_key_api.get_by_profile_href(profile_href)
+    key_pool = None
+    if pool_size:
+        pairing_keys, key_pool = pairing_key_api.get_from_pool(
+            hosts if hosts is not None else [None] * count, pool_size, max_workers,
+            profile_href=profile_href, profile_name=profile_name,
+            update_profile=module.params.get('update_pairing_profile')
+        )
+    elif not count:
+        pairing_keys = []
+    elif profile_href:
+        pairing_keys = pairing_key_api.get_by_profile_href(profile_href, count, max_workers)
     elif profile_name:
-        pairing_key = pairing_key_api.get_by_profile_name(profile_name)
+        pairing_keys = pairing_key_api.get_by_profile_name(profile_name, count, max_workers)
     else:
         module.fail_json("A valid value for one of pairing_profile_name or pairing_profile_href must be provided")
 
-    module.exit_json(changed=True, pairing_key=pairing_key)
+    result = dict(
+        changed=bool(pairing_keys),
+        pairing_key=pairing_keys[0] if pairing_keys else '',
+        pairing_keys=pairing_keys
+    )
+    if hosts is not None:
+        result['pairing_keys_by_host'] = dict(zip(hosts, pairing_keys))
+    if key_pool is not None:
+        result['changed'] = bool(key_pool['generated'] or key_pool['profile_updated'])
+        result['key_pool'] = key_pool
+
+    module.exit_json(**result)
 
 
 if __name__ == '__main__':
@@ -95,15 +95,32 @@ options:
   labels:
     description:
       - List of default labels to apply to workloads paired using this profile.
-      - Labels can only be referenced by HREF, and only one Label of each type can be specified.
+      - Labels can be referenced by HREF, or by key and value. Only one label of each type can be specified.
+      - Labels referenced by key and value are resolved with a single query of the PCE label catalog.
     type: list
     elements: dict
     default: []
     suboptions:
       href:
-        description: Label HREF.
+        description:
+          - Label HREF.
+          - Mutually exclusive with C(key) and C(value).
         type: str
-        required: true
+      key:
+        description:
+          - Label key.
+          - Must be set together with C(value) if C(href) is not set.
+        type: str
+      value:
+        description: Label value.
+        type: str
+  create_missing_labels:
+    description:
+      - If C(true), labels referenced by key and value that don't exist on the PCE are created.
+      - If C(false), the module fails if any referenced label doesn't exist.
+    type: bool
+    default: false
+    version_added: "0.3.0"
   role_label_lock:
     description: If set to C(false), allows the role label to be overridden when pairing.
     type: bool
@@ -145,6 +162,17 @@ EXAMPLES = r'''
       - href: /orgs/1/labels/1
       - href: /orgs/1/labels/2
 
+- name: "Create profile with labels referenced by key and value"
+  illumio.core.pairing_profile:
+    name: PP-WEB
+    state: present
+    labels:
+      - key: role
+        value: R-WEB
+      - key: env
+        value: E-PROD
+    create_missing_labels: true
+
 - name: "Create profile with pairing key uses and lifespan limitations"
   illumio.core.pairing_profile:
     name: PP-AUTOMATION
@@ -306,16 +334,22 @@ pairing_profile:
         - generate_pairing_key
 '''
 
-import re
 import sys
 import traceback
 
 from ansible.module_utils.basic import AnsibleModule, missing_required_lib
-from ansible_collections.illumio.core.plugins.module_utils.pce import PceObjectApi, pce_connection_spec  # type: ignore
+from ansible_collections.illumio.core.plugins.module_utils.fingerprint import (  # type: ignore
+    PAIRING_PROFILE_FINGERPRINT, ven_version_matches
+)
+from ansible_collections.illumio.core.plugins.module_utils.pce import (  # type: ignore
+    PceObjectApi, iter_collection, pce_connection_spec, run_concurrently
+)
+from ansible_collections.illumio.core.plugins.module_utils.specs import pairing_profile_spec  # type: ignore
 
 IMPORT_ERROR_TRACEBACK = ''
 
 try:
+    from illumio import Label, IllumioApiException
     from illumio.workloads import PairingProfile
 except ImportError:
     PairingProfile = None
@@ -323,84 +357,88 @@ except ImportError:
     IMPORT_ERROR_TRACEBACK = ''.join(traceback.format_tb(sys.exc_info()[2]))
 
 
+# concurrent requests used to create missing labels
+LABEL_CREATE_WORKERS = 4
+
+
 class PairingProfileApi(PceObjectApi):
+    fingerprint = PAIRING_PROFILE_FINGERPRINT
+
     def __init__(self, module: AnsibleModule) -> None:
         super().__init__(module)
         self._api = self._pce.pairing_profiles
+        self._labels = module.params.get('labels')
+
+    def resolve_labels(self, create_missing=False):
+        """Resolves labels referenced by key and value to HREFs with a
+        single label catalog query, creating any missing labels if
+        create_missing is set. Returns the list of labels to set on the
+        profile, and whether any labels were created."""
+        refs = [label for label in self._labels if not label.get('href')]
+        if not refs:
+            return self._labels, False
+
+        # narrow the query when all labels share a key
+        keys = {label['key'] for label in refs}
+        params = {'key': keys.pop()} if len(keys) == 1 else {}
+        wanted = {(label['key'], label['value']) for label in refs}
+        try:
+            catalog = {
+                (o['key'], o['value']): o['href'] for o in iter_collection(self._pce, '/labels', params)
+                if (o['key'], o['value']) in wanted
+            }
+        except IllumioApiException as e:
+            self._module.fail_json(msg="Failed to get labels: %s" % (str(e)))
+
+        missing = sorted(wanted - set(catalog))
+        if missing and not create_missing:
+            self._module.fail_json(
+                msg="Labels not found: %s" % (', '.join('%s=%s' % (k, v) for k, v in missing))
+            )
+        if missing and not self._module.check_mode:
+            errors = []
+            for (k, v), (href, error) in zip(missing, run_concurrently(self._create_label, missing, LABEL_CREATE_WORKERS)):
+                if error:
+                    errors.append("%s=%s: %s" % (k, v, error))
+                catalog[(k, v)] = href
+            if errors:
+                self._module.fail_json(msg="Failed to create labels: %s" % ('; '.join(errors)))
+
+        resolved = []
+        for label in self._labels:
+            if label.get('href'):
+                resolved.append({'href': label['href']})
+            elif (label['key'], label['value']) in catalog:
+                resolved.append({'href': catalog[(label['key'], label['value'])]})
+            else:
+                # labels that would be created in check mode have no HREF yet
+                resolved.append({'key': label['key'], 'value': label['value']})
+        self._labels = resolved
+        return resolved, bool(missing)
+
+    def _create_label(self, key_value):
+        # runs in a worker thread, so errors are returned rather than failing the module
+        key, value = key_value
+        try:
+            return self._pce.labels.create(Label(key=key, value=value)).href, None
+        except IllumioApiException as e:
+            return None, str(e)
+
+    def desired_state(self):
+        # compare the resolved label references rather than the module input
+        return dict(super().desired_state(), labels=self._labels)
 
     def params_match(self, o):
-        ignore_params = ['href', 'state', 'labels', 'ven_version']
-        params = [k for k in spec().keys() if k not in ignore_params]
-        for k in params:
-            if self._module.params.get(k) != getattr(o, k, None):
-                return False
-        return self._compare_labels(o) and self._compare_ven_version(o)
-
-    def _compare_labels(self, profile):
-        remote_labels = [label.href for label in getattr(profile, 'labels', [])]
-        new_labels = [label['href'] for label in self._module.params.get('labels')]
-        return remote_labels == new_labels
+        # the fingerprint compares labels as a set of HREFs, and numeric
+        # allowed_uses_per_key and key_lifespan strings as the PCE's integers
+        return super().params_match(o) and self._compare_ven_version(o)
 
     def _compare_ven_version(self, profile):
-        new_ven_version = self._module.params.get('ven_version')
-        if not new_ven_version:  # if no version is specified in the module, skip
-            return True
-        remote_ven_version = getattr(profile, 'agent_software_release', '')
-        match = re.match('^(?:Default \\()?([a-zA-Z0-9\\.-]+)\\)?$', remote_ven_version)
-        # if a version is specified in the module, check if it matches the remote
-        if match and match.group(1) != new_ven_version:
-            return False
-        return True
+        return ven_version_matches(self._module.params.get('ven_version'), getattr(profile, 'agent_software_release', ''))
 
 
 def spec():
-    return dict(
-        href=dict(type='str'),
-        name=dict(type='str'),
-        # if no description is provided when creating a profile, the PCE will
-        # set the description to an empty string rather than a null value.
-        # defaulting to an empty string ensures that comparisons behave as
-        # expected when determining whether an update is needed.
-        description=dict(type='str', default=''),
-        state=dict(
-            type='str',
-            choices=['present', 'absent'],
-            default='present'
-        ),
-        enabled=dict(type='bool', default=True),
-        enforcement_mode=dict(
-            type='str',
-            choices=['idle', 'visibility_only', 'selective', 'full'],
-            default='idle'
-        ),
-        enforcement_mode_lock=dict(type='bool', default=True),
-        visibility_level=dict(
-            type='str',
-            choices=['flow_summary', 'flow_drops', 'flow_off', 'enhanced_data_collection'],
-            default='flow_summary'
-        ),
-        visibility_level_lock=dict(type='bool', default=True),
-        allowed_uses_per_key=dict(type='str', default='unlimited', no_log=False),
-        key_lifespan=dict(type='str', default='unlimited', no_log=False),
-        ven_version=dict(type='str'),
-        labels=dict(
-            type='list',
-            default=[],
-            elements='dict',
-            options=dict(
-                href=dict(
-                    type='str',
-                    required=True
-                )
-            )
-        ),
-        role_label_lock=dict(type='bool', default=True),
-        app_label_lock=dict(type='bool', default=True),
-        env_label_lock=dict(type='bool', default=True),
-        loc_label_lock=dict(type='bool', default=True),
-        external_data_set=dict(type='str'),
-        external_data_reference=dict(type='str')
-    )
+    return pairing_profile_spec()
 
 
 def main():
@@ -431,7 +469,6 @@ def main():
     enforcement_mode_lock = module.params.get('enforcement_mode_lock')
     allowed_uses_per_key = module.params.get('allowed_uses_per_key')
     key_lifespan = module.params.get('key_lifespan')
-    labels = module.params.get('labels')
     role_label_lock = module.params.get('role_label_lock')
     app_label_lock = module.params.get('app_label_lock')
     env_label_lock = module.params.get('env_label_lock')
@@ -456,6 +493,7 @@ def main():
         existing_profile = pairing_profile_api.get_by_name(name)
 
     if state == 'present':
+        labels, labels_created = pairing_profile_api.resolve_labels(module.params.get('create_missing_labels'))
         new_profile = PairingProfile(
             name=name,
             description=description,
@@ -480,7 +518,7 @@ def main():
             if not existing_profile:
                 module.exit_json(changed=True, pairing_profile=pairing_profile_api.json_output(new_profile))
             module.exit_json(
-                changed=not pairing_profile_api.params_match(existing_profile),
+                changed=labels_created or not pairing_profile_api.params_match(existing_profile),
                 pairing_profile=pairing_profile_api.json_output(new_profile)
             )
 
@@ -488,8 +526,14 @@ def main():
             profile = pairing_profile_api.create(new_profile)
             changed = True
         else:
-            changed = pairing_profile_api.update(existing_profile, new_profile)
-            profile = pairing_profile_api.get_by_href(existing_profile.href) if changed else existing_profile
+            # the PCE resolves the VEN version to a release name, so
+            # only refetch the updated profile if the version changed
+            changed, profile = pairing_profile_api.update_and_get(
+                existing_profile,
+                new_profile,
+                refetch=not pairing_profile_api._compare_ven_version(existing_profile)
+            )
+            changed = changed or labels_created
     elif state == 'absent':
         if module.check_mode:
             module.exit_json(changed=True, pairing_profile={})
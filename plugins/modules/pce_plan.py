@@ -0,0 +1,494 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright 2023 Illumio, Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: pce_plan
+short_description: Plan and apply a desired state for Illumio PCE labels, pairing profiles and container clusters
+description:
+  - This module takes a desired-state document describing labels, pairing profiles and container clusters,
+    and makes the changes needed for the PCE to match it in a single task.
+  - The collection for each object type in the document is fetched concurrently, and a plan of the objects to create,
+    update and delete is computed from them without any further lookups.
+  - The plan is applied in dependency order. Labels are created and updated first, followed by pairing profiles
+    and container clusters. Objects to be removed are then deleted in the reverse order, so that pairing profiles
+    are removed before the labels they use. The changes in each step are sent concurrently, up to C(max_workers) at a time.
+    If any change in a step fails, the later steps are not applied.
+  - Objects that aren't in the document are left unchanged. Set C(state=absent) on an object to remove it.
+  - In check mode, the plan is returned without making any changes.
+
+author:
+  - Duncan Sommerville (@dsommerville-illumio)
+requirements:
+  - "python>=3.8"
+  - "illumio>=1.1.3"
+  - "PyYAML, if C(document) is given as a string"
+version_added: "0.3.0"
+
+options:
+  document:
+    description:
+      - The desired-state document, as a dictionary or as a YAML or JSON string.
+      - The C(labels) key holds a list of labels, using the options of the M(illumio.core.label) module.
+      - The C(pairing_profiles) key holds a list of pairing profiles, using the options of the M(illumio.core.pairing_profile) module.
+        Labels can be referenced by key and value, including labels created by the same document.
+      - The C(container_clusters) key holds a list of container clusters, using the options of the M(illumio.core.container_cluster) module.
+      - Options that aren't set use the same defaults as the single-object modules.
+    type: raw
+    required: true
+  max_workers:
+    description:
+      - Maximum number of requests to send to the PCE concurrently in each step of the plan.
+    type: int
+    default: 4
+
+extends_documentation_fragment:
+  - illumio.core.pce
+'''
+
+EXAMPLES = r'''
+- name: "Apply the PCE desired state"
+  illumio.core.pce_plan:
+    document: "{{ lookup('file', 'pce_state.yml') }}"
+  register: plan_result
+
+- name: "Show the plan without applying it"
+  illumio.core.pce_plan:
+    document:
+      labels:
+        - key: env
+          value: E-PROD
+        - key: env
+          value: E-STAGING
+          state: absent
+      pairing_profiles:
+        - name: PP-PROD
+          enforcement_mode: visibility_only
+          labels:
+            - key: env
+              value: E-PROD
+      container_clusters:
+        - name: CC-KUBE
+          description: Production Kubernetes cluster
+  check_mode: yes
+'''
+
+RETURN = r'''
+plan:
+  description: The change planned for each object in the document, in the order the changes are applied.
+  type: list
+  elements: dict
+  returned: success
+  contains:
+    type:
+      description: The object type.
+      type: str
+      returned: always
+      choices: ['label', 'pairing_profile', 'container_cluster']
+    key:
+      description: The object's name, or key and value for labels.
+      type: str
+      returned: always
+    action:
+      description: The change made for this object.
+      type: str
+      returned: always
+      choices: ['created', 'updated', 'deleted', 'unchanged']
+    changed:
+      description: Flag denoting whether the object was changed, or would be changed in check mode.
+      type: bool
+      returned: always
+    href:
+      description:
+        - The object HREF.
+        - Null if the object does not exist, or would be created in check mode.
+      type: str
+      returned: always
+    fields:
+      description: The fields that differ from the document, for updated objects.
+      type: list
+      elements: str
+      returned: always
+    container_cluster_token:
+      description:
+        - The pairing token for a created container cluster.
+        - This token is only returned once when the cluster is created.
+      type: str
+      returned: when a container cluster is created
+    msg:
+      description: Error message if the change failed or was not applied.
+      type: str
+      returned: on failure
+
+  sample:
+    plan:
+      - type: label
+        key: env=E-PROD
+        action: created
+        changed: true
+        href: /orgs/1/labels/20
+        fields: []
+      - type: pairing_profile
+        key: PP-PROD
+        action: updated
+        changed: true
+        href: /orgs/1/pairing_profiles/3
+        fields: ['enforcement_mode', 'labels']
+summary:
+  description: The number of objects for each planned action.
+  type: dict
+  returned: success
+  sample:
+    summary:
+      created: 1
+      updated: 1
+      deleted: 0
+      unchanged: 12
+'''
+
+import json
+import sys
+import traceback
+
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+from ansible.module_utils.common.arg_spec import ArgumentSpecValidator
+from ansible_collections.illumio.core.plugins.module_utils.fingerprint import (  # type: ignore
+    CONTAINER_CLUSTER_FINGERPRINT, LABEL_FINGERPRINT, PAIRING_PROFILE_FINGERPRINT, ven_version_matches
+)
+from ansible_collections.illumio.core.plugins.module_utils.pce import (  # type: ignore
+    PceApiBase, iter_collection, pce_connection_spec, run_concurrently
+)
+from ansible_collections.illumio.core.plugins.module_utils.specs import (  # type: ignore
+    container_cluster_spec, label_spec, pairing_profile_spec
+)
+
+IMPORT_ERROR_TRACEBACK = ''
+
+try:
+    from illumio import IllumioApiException
+except ImportError:
+    IllumioApiException = None
+    # replicate the traceback formatting from AnsibleModule.fail_json
+    IMPORT_ERROR_TRACEBACK = ''.join(traceback.format_tb(sys.exc_info()[2]))
+
+YAML_IMPORT_ERROR_TRACEBACK = ''
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+    YAML_IMPORT_ERROR_TRACEBACK = ''.join(traceback.format_tb(sys.exc_info()[2]))
+
+# document sections in the order they are created, with the specification and
+# constraints of the module that manages a single object of each type
+OBJECT_TYPES = [
+    ('labels', 'label', label_spec, dict(
+        required_one_of=[['key', 'href']],
+        required_together=[['key', 'value'], ['external_data_set', 'external_data_reference']]
+    )),
+    ('pairing_profiles', 'pairing_profile', pairing_profile_spec, dict(
+        required_one_of=[['name', 'href']],
+        required_together=[['external_data_set', 'external_data_reference']]
+    )),
+    ('container_clusters', 'container_cluster', container_cluster_spec, dict(
+        required_one_of=[['name', 'href']]
+    )),
+]
+
+# the steps of the plan, each a list of (object type, action) pairs applied concurrently
+APPLY_STEPS = [
+    [('label', 'created'), ('label', 'updated')],
+    [('pairing_profile', 'created'), ('pairing_profile', 'updated'),
+     ('container_cluster', 'created'), ('container_cluster', 'updated')],
+    [('pairing_profile', 'deleted'), ('container_cluster', 'deleted')],
+    [('label', 'deleted')],
+]
+
+
+class Change(object):
+    """A planned change to a single PCE object."""
+
+    def __init__(self, object_type, key, action, existing=None, body=None, fields=None):
+        self.object_type = object_type
+        self.key = key
+        self.action = action
+        self.existing = existing
+        self.body = body
+        self.fields = fields or []
+        self.href = existing['href'] if existing else None
+        self.token = None
+        self.msg = None
+
+    def result(self):
+        result = dict(
+            type=self.object_type,
+            key=self.key,
+            action=self.action,
+            changed=self.action != 'unchanged' and self.msg is None,
+            href=None if self.action == 'deleted' and self.msg is None else self.href,
+            fields=self.fields
+        )
+        if self.token:
+            result['container_cluster_token'] = self.token
+        if self.msg is not None:
+            result['msg'] = self.msg
+        return result
+
+
+class PcePlanApi(PceApiBase):
+
+    def __init__(self, module: AnsibleModule) -> None:
+        super().__init__(module)
+        self._changes = []
+        # planned labels by key and value, used to resolve pairing profile labels
+        self._labels = {}
+
+    def fetch(self, collections):
+        """Fetches the given collections concurrently, returning each as a list of decoded JSON objects."""
+        def fetch_collection(collection):
+            try:
+                return list(iter_collection(self._pce, '/%s' % (collection))), None
+            except IllumioApiException as e:
+                return None, str(e)
+
+        results = run_concurrently(fetch_collection, collections, max_workers=len(collections))
+        errors = ["%s: %s" % (collection, error) for collection, (_, error) in zip(collections, results) if error]
+        if errors:
+            self._module.fail_json(msg="Failed to get PCE objects: %s" % ('; '.join(errors)))
+        return {collection: objects for collection, (objects, _) in zip(collections, results)}
+
+    def plan(self, document):
+        collections = [collection for collection, _, _, _ in OBJECT_TYPES if document.get(collection)]
+        if document.get('pairing_profiles') and 'labels' not in collections:
+            # pairing profile labels are resolved against the label catalog
+            collections.insert(0, 'labels')
+        if not collections:
+            return []
+        remote = self.fetch(collections)
+
+        self._labels = {(o['key'], o['value']): o for o in remote.get('labels', [])}
+        self._plan_labels(document.get('labels') or [], remote.get('labels', []))
+        for o in document.get('pairing_profiles') or []:
+            self._plan_named('pairing_profile', o, remote['pairing_profiles'], self._pairing_profile)
+        for o in document.get('container_clusters') or []:
+            self._plan_named('container_cluster', o, remote['container_clusters'], self._container_cluster)
+
+        order = [pair for step in APPLY_STEPS for pair in step]
+        return sorted(self._changes, key=lambda c: order.index((c.object_type, c.action)) if c.action != 'unchanged' else -1)
+
+    def _plan_labels(self, labels, catalog):
+        by_href = {o['href']: o for o in catalog}
+        for label in labels:
+            if label['href']:
+                existing = by_href.get(label['href'])
+                if not existing:
+                    self._module.fail_json(msg="No label found with HREF %s" % (label['href']))
+            else:
+                existing = self._labels.get((label['key'], label['value']))
+            key = '%s=%s' % (label['key'], label['value']) if label['key'] else label['href']
+
+            if label['state'] == 'absent':
+                self._changes.append(Change('label', key, 'deleted' if existing else 'unchanged', existing))
+                continue
+            desired = {k: label[k] for k in LABEL_FINGERPRINT.fields}
+            if not existing:
+                change = Change('label', key, 'created', body=_without_nulls(desired))
+                self._labels[(label['key'], label['value'])] = change
+                self._changes.append(change)
+                continue
+            fields = LABEL_FINGERPRINT.diff(desired, existing)
+            if 'key' in fields:
+                self._module.fail_json(msg="Unable to update key of existing label %s" % (existing['href']))
+            self._changes.append(Change(
+                'label', key, 'updated' if fields else 'unchanged', existing,
+                body={k: desired[k] for k in fields}, fields=fields
+            ))
+
+    def _plan_named(self, object_type, o, catalog, build):
+        if o['href']:
+            existing = next((remote for remote in catalog if remote['href'] == o['href']), None)
+            if not existing:
+                self._module.fail_json(msg="No %s found with HREF %s" % (object_type.replace('_', ' '), o['href']))
+        else:
+            existing = next((remote for remote in catalog if remote.get('name') == o['name']), None)
+        key = o['name'] or o['href']
+
+        if o['state'] == 'absent':
+            self._changes.append(Change(object_type, key, 'deleted' if existing else 'unchanged', existing))
+            return
+        desired, fingerprint, extra_fields = build(o, existing)
+        if not existing:
+            self._changes.append(Change(object_type, key, 'created', body=_without_nulls(desired)))
+            return
+        fields = fingerprint.diff(desired, existing) + extra_fields
+        self._changes.append(Change(
+            object_type, key, 'updated' if fields else 'unchanged', existing,
+            body={k: desired[k] for k in fields}, fields=fields
+        ))
+
+    def _pairing_profile(self, o, existing):
+        desired = {k: o.get(k) for k in PAIRING_PROFILE_FINGERPRINT.fields}
+        for k in ('allowed_uses_per_key', 'key_lifespan'):
+            if desired[k].isnumeric():
+                desired[k] = int(desired[k])
+        desired['labels'] = [self._label_ref(label, o['create_missing_labels']) for label in o['labels']]
+        extra_fields = []
+        if o['ven_version']:
+            desired['agent_software_release'] = o['ven_version']
+            if existing and not ven_version_matches(o['ven_version'], existing.get('agent_software_release')):
+                extra_fields.append('agent_software_release')
+        return desired, PAIRING_PROFILE_FINGERPRINT, extra_fields
+
+    def _container_cluster(self, o, existing):
+        return {k: o.get(k) for k in CONTAINER_CLUSTER_FINGERPRINT.fields}, CONTAINER_CLUSTER_FINGERPRINT, []
+
+    def _label_ref(self, label, create_missing):
+        if label.get('href'):
+            return {'href': label['href']}
+        key_value = (label['key'], label['value'])
+        planned = self._labels.get(key_value)
+        if planned is None:
+            if not create_missing:
+                self._module.fail_json(msg="Labels not found: %s=%s" % key_value)
+            planned = Change('label', '%s=%s' % key_value, 'created', body={'key': label['key'], 'value': label['value']})
+            self._labels[key_value] = planned
+            self._changes.append(planned)
+        if isinstance(planned, Change):
+            # labels created by the plan have no HREF until they are applied
+            return {'key': label['key'], 'value': label['value']}
+        return {'href': planned['href']}
+
+    def apply(self, changes, max_workers):
+        """Applies the changes in dependency order, stopping after any step with a failed change."""
+        steps = [[change for change in changes if (change.object_type, change.action) in step] for step in APPLY_STEPS]
+        for i, batch in enumerate(steps):
+            for change in batch:
+                if change.object_type == 'pairing_profile' and 'labels' in (change.body or {}):
+                    change.body['labels'] = [self._resolve_planned_label(ref) for ref in change.body['labels']]
+            run_concurrently(self._apply_change, batch, max_workers)
+            if any(change.msg for change in batch):
+                for change in [change for later in steps[i + 1:] for change in later]:
+                    change.msg = "Not applied, as an earlier change failed"
+                break
+        for api_name in {change.object_type + 's' for change in changes if change.action != 'unchanged'}:
+            cache = self.href_cache(api_name)
+            if cache is not None:
+                cache.invalidate()
+
+    def _resolve_planned_label(self, ref):
+        if ref.get('href'):
+            return ref
+        planned = self._labels[(ref['key'], ref['value'])]
+        return {'href': planned.href} if planned.href else ref
+
+    def _apply_change(self, change):
+        # runs in a worker thread, so errors are recorded rather than failing the module
+        collection = '/%ss' % (change.object_type)
+        try:
+            if change.action == 'created':
+                o = self._pce.post(collection, json=change.body).json()
+                change.href = o['href']
+                change.token = o.get('container_cluster_token')
+            elif change.action == 'updated':
+                self._pce.put(change.href, json=change.body, include_org=False)
+            elif change.action == 'deleted':
+                self._pce.delete(change.href, include_org=False)
+        except (IllumioApiException, ValueError, KeyError) as e:
+            change.msg = str(e)
+
+
+def _without_nulls(o):
+    return {k: v for k, v in o.items() if v is not None}
+
+
+def load_document(module, document):
+    """Parses and validates the desired-state document, returning each
+    section as a list of objects with defaults applied."""
+    if isinstance(document, str):
+        if not yaml:
+            module.fail_json(
+                msg=missing_required_lib('PyYAML', reason='to parse document as a string', url='https://pypi.org/project/PyYAML/'),
+                exception=YAML_IMPORT_ERROR_TRACEBACK
+            )
+        try:
+            document = yaml.safe_load(document) or {}
+        except yaml.YAMLError as e:
+            module.fail_json(msg="Failed to parse document: %s" % (e))
+    if not isinstance(document, dict):
+        module.fail_json(msg="document must be a dictionary")
+    unsupported = sorted(set(document) - {collection for collection, _, _, _ in OBJECT_TYPES})
+    if unsupported:
+        module.fail_json(msg="Unsupported document sections: %s" % (', '.join(unsupported)))
+
+    loaded, errors = {}, []
+    for collection, object_type, object_spec, constraints in OBJECT_TYPES:
+        validator = ArgumentSpecValidator(object_spec(), **constraints)
+        objects, seen = [], set()
+        for i, o in enumerate(document.get(collection) or []):
+            result = validator.validate(o if isinstance(o, dict) else {})
+            if result.error_messages or not isinstance(o, dict):
+                errors.extend("%s[%d]: %s" % (collection, i, msg) for msg in result.error_messages or ['must be a dictionary'])
+                continue
+            o = result.validated_parameters
+            identity = o.get('href') or json.dumps([o.get(k) for k in ('key', 'value', 'name')])
+            if identity in seen:
+                errors.append("%s[%d]: duplicate %s" % (collection, i, object_type.replace('_', ' ')))
+            seen.add(identity)
+            objects.append(o)
+        loaded[collection] = objects
+    if errors:
+        module.fail_json(msg="Invalid document: %s" % ('; '.join(errors)))
+    return loaded
+
+
+def spec():
+    return dict(
+        document=dict(type='raw', required=True),
+        max_workers=dict(type='int', default=4)
+    )
+
+
+def main():
+    argument_spec = pce_connection_spec()
+    argument_spec.update(spec())
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True
+    )
+
+    if not IllumioApiException:
+        module.fail_json(
+            msg=missing_required_lib('illumio', url='https://pypi.org/project/illumio/'),
+            exception=IMPORT_ERROR_TRACEBACK
+        )
+
+    document = load_document(module, module.params.get('document'))
+
+    plan_api = PcePlanApi(module)
+    changes = plan_api.plan(document)
+    if not module.check_mode:
+        plan_api.apply(changes, module.params.get('max_workers'))
+
+    results = [change.result() for change in changes]
+    summary = {action: sum(1 for c in changes if c.action == action) for action in ('created', 'updated', 'deleted', 'unchanged')}
+    changed = any(result['changed'] for result in results)
+    failed = [result for result in results if 'msg' in result]
+    if failed:
+        module.fail_json(
+            msg="Failed to apply changes for %d object(s): %s" % (len(failed), failed[0]['msg']),
+            changed=changed,
+            plan=results,
+            summary=summary
+        )
+
+    module.exit_json(changed=changed, plan=results, summary=summary)
+
+
+if __name__ == '__main__':
+    main()
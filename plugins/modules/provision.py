@@ -0,0 +1,268 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright 2023 Illumio, Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: provision
+short_description: Provision Illumio PCE draft policy changes
+description:
+  - This module provisions draft policy changes on the Illumio PCE as a single policy version.
+  - Modules that write draft policy, such as M(illumio.core.ruleset), M(illumio.core.rule) and M(illumio.core.ip_list),
+    record the HREFs of the objects they change on the controller. This module provisions every recorded change,
+    along with any C(hrefs) given, in one request, so a change to hundreds of rules causes a single policy computation.
+  - Before provisioning, the changes are checked for dependencies on other unprovisioned draft objects.
+    By default the module fails if any are found. Set C(include_dependencies) to provision them as well.
+  - Recorded changes are kept in the C(pce_cache_dir) directory for each PCE and org, and are removed once provisioned.
+    Run this module once per play, such as from a handler notified by the tasks that change policy.
+  - Changes are recorded for the C(ansible-playbook) run that made them. Changes left over from an earlier run,
+    such as a play that failed before provisioning, aren't provisioned, and are discarded when a change is recorded
+    in a new run. Set the C(ILLUMIO_PCE_RUN_ID) environment variable on the controller to share recorded changes
+    between runs instead.
+  - Supports check mode.
+
+author:
+  - Duncan Sommerville (@dsommerville-illumio)
+requirements:
+  - "python>=3.8"
+  - "illumio>=1.1.3"
+version_added: "0.3.0"
+
+options:
+  change_description:
+    description: Description of the policy change.
+    type: str
+    default: Provisioned by Ansible
+  hrefs:
+    description:
+      - HREFs of draft policy objects to provision in addition to the recorded changes.
+    type: list
+    elements: str
+    default: []
+  include_recorded_changes:
+    description:
+      - Flag denoting whether to provision the draft changes recorded by other modules.
+      - If false, only the objects in C(hrefs) are provisioned.
+    type: bool
+    default: true
+  include_dependencies:
+    description:
+      - Flag denoting whether to provision unprovisioned draft objects that the changes depend on.
+      - If false, the module fails if any dependencies are found.
+    type: bool
+    default: false
+
+extends_documentation_fragment:
+  - illumio.core.pce
+'''
+
+EXAMPLES = r'''
+- name: "Update web application policy"
+  hosts: localhost
+  tasks:
+    - name: "Create rule set"
+      illumio.core.ruleset:
+        name: RS-WEB
+      notify: provision policy
+
+    - name: "Create rules"
+      illumio.core.rule:
+        ruleset: RS-WEB
+        providers: "{{ item.providers }}"
+        consumers: "{{ item.consumers }}"
+        ingress_services: "{{ item.services }}"
+      loop: "{{ web_rules }}"
+      notify: provision policy
+
+  handlers:
+    - name: provision policy
+      illumio.core.provision:
+        change_description: Web application policy update
+
+- name: "Provision a specific IP list"
+  illumio.core.provision:
+    hrefs:
+      - /orgs/1/sec_policy/draft/ip_lists/22
+    include_recorded_changes: false
+'''
+
+RETURN = r'''
+provisioned:
+  description: HREFs of the draft objects that were provisioned, or would be provisioned in check mode.
+  type: list
+  elements: str
+  returned: success
+  sample:
+    - /orgs/1/sec_policy/draft/rule_sets/12
+    - /orgs/1/sec_policy/draft/ip_lists/22
+dependencies:
+  description: HREFs of unprovisioned draft objects that the changes depend on.
+  type: list
+  elements: str
+  returned: always
+policy_version:
+  description: Information about the policy version created by provisioning the changes.
+  type: complex
+  returned: when changes are provisioned
+  contains:
+    href:
+      description: The policy version's HREF.
+      type: str
+      returned: always
+    version:
+      description: The policy version number.
+      type: int
+      returned: always
+    commit_message:
+      description: The change description.
+      type: str
+      returned: always
+    workloads_affected:
+      description: The number of workloads affected by the policy change.
+      type: int
+      returned: always
+
+  sample:
+    policy_version:
+      href: /orgs/1/sec_policy/110
+      version: 110
+      commit_message: Web application policy update
+      workloads_affected: 12
+'''
+
+import sys
+import traceback
+
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+from ansible_collections.illumio.core.plugins.module_utils.pce import PceApiBase, draft_policy_href, pce_connection_spec  # type: ignore
+
+IMPORT_ERROR_TRACEBACK = ''
+
+try:
+    from illumio import IllumioApiException, PolicyChangeset
+except ImportError:
+    PolicyChangeset = None
+    # replicate the traceback formatting from AnsibleModule.fail_json
+    IMPORT_ERROR_TRACEBACK = ''.join(traceback.format_tb(sys.exc_info()[2]))
+
+
+class ProvisionApi(PceApiBase):
+
+    def dependencies(self, hrefs):
+        """Returns the HREFs of unprovisioned draft objects that the given
+        changes depend on, and that aren't part of the changes themselves,
+        mapped to the HREFs of the changes that require them."""
+        body = {
+            'change_subset': PolicyChangeset.build(hrefs).to_json(),
+            'operation': 'commit'
+        }
+        try:
+            response = self._pce.post('/sec_policy/draft/dependencies', json=body).json()
+        except IllumioApiException as e:
+            self._module.fail_json(msg="Failed to check policy dependencies: %s" % (e))
+        hrefs = set(hrefs)
+        dependencies = {}
+        for dependency in response or []:
+            required = draft_policy_href(_object_href(dependency.get('new_required_object')))
+            if required and required not in hrefs:
+                dependent = draft_policy_href(_object_href(dependency.get('new_dependent_object')))
+                required_by = dependencies.setdefault(required, [])
+                if dependent and dependent not in required_by:
+                    required_by.append(dependent)
+        return dependencies
+
+    def provision(self, change_description, hrefs):
+        try:
+            return self._pce.provision_policy_changes(change_description=change_description, hrefs=hrefs)
+        except IllumioApiException as e:
+            self._module.fail_json(msg="Failed to provision policy changes: %s" % (e))
+
+    def json_output(self, o):
+        return {k: getattr(o, k, None) for k in ('href', 'version', 'commit_message', 'workloads_affected')}
+
+
+def _object_href(o):
+    # dependency objects are keyed by their type, e.g. {"ip_list": {"href": ...}}
+    for v in (o or {}).values():
+        if isinstance(v, dict) and isinstance(v.get('href'), str):
+            return v['href']
+    return None
+
+
+def spec():
+    return dict(
+        change_description=dict(type='str', default='Provisioned by Ansible'),
+        hrefs=dict(type='list', elements='str', default=[]),
+        include_recorded_changes=dict(type='bool', default=True),
+        include_dependencies=dict(type='bool', default=False)
+    )
+
+
+def main():
+    argument_spec = pce_connection_spec()
+    argument_spec.update(spec())
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True
+    )
+
+    if not PolicyChangeset:
+        module.fail_json(
+            msg=missing_required_lib('illumio', url='https://pypi.org/project/illumio/'),
+            exception=IMPORT_ERROR_TRACEBACK
+        )
+
+    provision_api = ProvisionApi(module)
+    changeset = provision_api.draft_changeset()
+
+    hrefs = []
+    for href in module.params.get('hrefs'):
+        draft_href = draft_policy_href(href)
+        if not draft_href:
+            module.fail_json(msg="Not a draft policy object HREF: %s" % (href))
+        if draft_href not in hrefs:
+            hrefs.append(draft_href)
+    recorded = changeset.hrefs() if module.params.get('include_recorded_changes') else []
+    hrefs.extend(href for href in recorded if href not in hrefs)
+
+    if not hrefs:
+        module.exit_json(changed=False, provisioned=[], dependencies=[])
+
+    required = provision_api.dependencies(hrefs)
+    if required and not module.params.get('include_dependencies'):
+        module.fail_json(
+            msg="Draft changes depend on unprovisioned objects: %s" % (', '.join(
+                '%s (required by %s)' % (href, ', '.join(required_by)) if required_by else href
+                for href, required_by in required.items()
+            )),
+            provisioned=[],
+            dependencies=list(required)
+        )
+    dependencies = []
+    while required:
+        # dependencies can have unprovisioned dependencies of their own
+        dependencies.extend(required)
+        hrefs.extend(required)
+        required = provision_api.dependencies(hrefs)
+
+    if module.check_mode:
+        module.exit_json(changed=True, provisioned=hrefs, dependencies=dependencies)
+
+    policy_version = provision_api.provision(module.params.get('change_description'), hrefs)
+    changeset.remove(hrefs)
+
+    module.exit_json(
+        changed=True,
+        provisioned=hrefs,
+        dependencies=dependencies,
+        policy_version=provision_api.json_output(policy_version)
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,511 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright 2023 Illumio, Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: rule
+short_description: Create/update/delete Illumio PCE security rules
+description:
+  - This module allows you to create and manipulate draft security rules in an Illumio PCE rule set.
+  - Rules are matched by C(href), by C(external_data_set) and C(external_data_reference) if they are set,
+    or otherwise by their providers, consumers and ingress services. Rules matched by their providers,
+    consumers and services can't change them, as a rule with different values is a different rule.
+  - The rule set and its rules are fetched with a single request.
+  - Changes are only made to the draft policy version. The rule set of each changed rule is recorded on the controller,
+    and is provisioned together with all other recorded draft changes by the M(illumio.core.provision) module.
+  - Supports check mode.
+
+author:
+  - Duncan Sommerville (@dsommerville-illumio)
+requirements:
+  - "python>=3.8"
+  - "illumio>=1.1.3"
+version_added: "0.3.0"
+
+options:
+  ruleset:
+    description:
+      - Name of the rule set containing the rule.
+      - Mutually exclusive with C(ruleset_href).
+    type: str
+  ruleset_href:
+    description:
+      - HREF of the rule set containing the rule.
+      - Mutually exclusive with C(ruleset).
+    type: str
+  href:
+    description: HREF of an existing rule.
+    type: str
+  providers:
+    description:
+      - Providers of the services allowed by the rule.
+      - Required unless C(href) or C(external_data_reference) is set for an existing rule.
+    type: list
+    elements: dict
+    suboptions:
+      actors:
+        description: Set to C(ams) to match all workloads.
+        type: str
+        choices: ['ams']
+      label:
+        description: Label matched by the rule, by key and value.
+        type: dict
+        suboptions:
+          key:
+            description: Label key.
+            type: str
+            required: true
+          value:
+            description: Label value.
+            type: str
+            required: true
+      ip_list:
+        description: Name of a draft IP list matched by the rule.
+        type: str
+      href:
+        description: HREF of a label, label group, IP list, workload or virtual service matched by the rule.
+        type: str
+  consumers:
+    description:
+      - Consumers allowed to connect to the providers.
+      - Required unless C(href) or C(external_data_reference) is set for an existing rule.
+    type: list
+    elements: dict
+    suboptions:
+      actors:
+        description: Set to C(ams) to match all workloads.
+        type: str
+        choices: ['ams']
+      label:
+        description: Label matched by the rule, by key and value.
+        type: dict
+        suboptions:
+          key:
+            description: Label key.
+            type: str
+            required: true
+          value:
+            description: Label value.
+            type: str
+            required: true
+      ip_list:
+        description: Name of a draft IP list matched by the rule.
+        type: str
+      href:
+        description: HREF of a label, label group, IP list, workload or virtual service matched by the rule.
+        type: str
+  ingress_services:
+    description:
+      - Services allowed by the rule, by HREF or by port and protocol.
+      - Required unless C(href) or C(external_data_reference) is set for an existing rule.
+    type: list
+    elements: dict
+    suboptions:
+      href:
+        description: Service HREF.
+        type: str
+      port:
+        description: Port number, or the first port in a range.
+        type: int
+      to_port:
+        description: The last port in a range.
+        type: int
+      proto:
+        description: Protocol name, such as C(tcp) or C(udp), or IANA protocol number.
+        type: str
+  resolve_providers_as:
+    description: Object types that provider labels are resolved to.
+    type: list
+    elements: str
+    choices: ['workloads', 'virtual_services']
+    default: ['workloads']
+  resolve_consumers_as:
+    description: Object types that consumer labels are resolved to.
+    type: list
+    elements: str
+    choices: ['workloads', 'virtual_services']
+    default: ['workloads']
+  unscoped_consumers:
+    description:
+      - If true, consumers are not limited to the scopes of the rule set, creating an extra-scope rule.
+    type: bool
+    default: false
+  enabled:
+    description: Flag denoting whether the rule is enabled.
+    type: bool
+    default: true
+  description:
+    description: Rule description.
+    type: str
+    default: ''
+  external_data_set:
+    description:
+      - External data set identifier.
+      - Must be set if using C(external_data_reference).
+    type: str
+  external_data_reference:
+    description:
+      - External data reference identifier.
+      - Must be set if using C(external_data_set).
+    type: str
+  state:
+    description:
+      - Desired rule state.
+      - If C(present), the rule will be created if it does not exist, or updated to match the provided parameters if it does.
+      - If C(absent), the rule will be removed if it exists.
+    type: str
+    choices: ['present', 'absent']
+    default: 'present'
+
+extends_documentation_fragment:
+  - illumio.core.pce
+'''
+
+EXAMPLES = r'''
+- name: "Allow HTTPS from the internal networks to the web tier"
+  illumio.core.rule:
+    ruleset: RS-WEB
+    providers:
+      - label:
+          key: role
+          value: R-WEB
+    consumers:
+      - ip_list: IPL-INTERNAL
+    ingress_services:
+      - port: 443
+        proto: tcp
+    unscoped_consumers: true
+  notify: provision policy
+
+- name: "Manage rules from a policy repository"
+  illumio.core.rule:
+    ruleset: RS-WEB
+    providers: "{{ item.providers }}"
+    consumers: "{{ item.consumers }}"
+    ingress_services: "{{ item.services }}"
+    external_data_set: policy-repo
+    external_data_reference: "{{ item.id }}"
+  loop: "{{ web_rules }}"
+  notify: provision policy
+'''
+
+RETURN = r'''
+rule:
+  description: Information about the rule that was created or updated.
+  type: complex
+  returned: success
+  contains:
+    href:
+      description: The rule's HREF.
+      type: str
+      returned: always
+    providers:
+      description: Rule providers.
+      type: list
+      elements: dict
+      returned: always
+    consumers:
+      description: Rule consumers.
+      type: list
+      elements: dict
+      returned: always
+    ingress_services:
+      description: Services allowed by the rule.
+      type: list
+      elements: dict
+      returned: always
+    resolve_labels_as:
+      description: Object types that provider and consumer labels are resolved to.
+      type: dict
+      returned: always
+    unscoped_consumers:
+      description: Flag denoting whether the rule is an extra-scope rule.
+      type: bool
+      returned: always
+    enabled:
+      description: Flag denoting whether the rule is enabled.
+      type: bool
+      returned: always
+
+  sample:
+    rule:
+      href: /orgs/1/sec_policy/draft/rule_sets/12/sec_rules/40
+      providers:
+        - label:
+            href: /orgs/1/labels/5
+      consumers:
+        - ip_list:
+            href: /orgs/1/sec_policy/draft/ip_lists/22
+      ingress_services:
+        - port: 443
+          proto: 6
+      resolve_labels_as:
+        providers: ['workloads']
+        consumers: ['workloads']
+      unscoped_consumers: true
+      enabled: true
+'''
+
+import sys
+import traceback
+
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+from ansible_collections.illumio.core.plugins.module_utils.fingerprint import (  # type: ignore
+    RULE_FINGERPRINT, RULE_IDENTITY_FIELDS
+)
+from ansible_collections.illumio.core.plugins.module_utils.pce import PceObjectApi, pce_connection_spec  # type: ignore
+
+IMPORT_ERROR_TRACEBACK = ''
+
+try:
+    from illumio import IllumioApiException, Rule
+except ImportError:
+    Rule = None
+    # replicate the traceback formatting from AnsibleModule.fail_json
+    IMPORT_ERROR_TRACEBACK = ''.join(traceback.format_tb(sys.exc_info()[2]))
+
+PROTOCOLS = {'icmp': 1, 'tcp': 6, 'udp': 17, 'icmpv6': 58}
+
+
+class RuleApi(PceObjectApi):
+    fingerprint = RULE_FINGERPRINT
+
+    def __init__(self, module: AnsibleModule) -> None:
+        super().__init__(module)
+        self._api = self._pce.rules
+        self._desired = {}
+
+    def get_ruleset(self, href, name):
+        """Returns the draft rule set as decoded JSON, including its rules."""
+        try:
+            if href:
+                return self._pce.get(href, include_org=False).json()
+            for o in self._pce.get('/sec_policy/draft/rule_sets', params={'name': name}).json():
+                if o.get('name') == name:
+                    return o
+        except IllumioApiException as e:
+            self._module.fail_json(msg="Failed to get rule set: %s" % (e))
+        self._module.fail_json(msg="No rule set found with name %s" % (name))
+
+    def resolve_actors(self, *actor_lists):
+        """Converts provider and consumer options to rule actors, resolving
+        labels with a single label query and IP lists by name."""
+        labels = [actor['label'] for actors in actor_lists for actor in actors or [] if actor.get('label')]
+        label_hrefs = {}
+        if labels:
+            (label_refs,), _ = self.resolve_label_refs(labels)
+            label_hrefs = {(label['key'], label['value']): href for label, (href, _) in zip(labels, label_refs)}
+
+        ip_list_hrefs = {}
+        resolved = []
+        for actors in actor_lists:
+            if actors is None:
+                resolved.append(None)
+                continue
+            result = []
+            for actor in actors:
+                if actor.get('actors'):
+                    result.append({'actors': actor['actors']})
+                elif actor.get('label'):
+                    result.append({'label': {'href': label_hrefs[(actor['label']['key'], actor['label']['value'])]}})
+                elif actor.get('ip_list'):
+                    name = actor['ip_list']
+                    if name not in ip_list_hrefs:
+                        ip_list_hrefs[name] = self._ip_list_href(name)
+                    result.append({'ip_list': {'href': ip_list_hrefs[name]}})
+                else:
+                    result.append(actor_from_href(actor['href']))
+            resolved.append(result)
+        return resolved
+
+    def _ip_list_href(self, name):
+        try:
+            ip_list = self._pce.ip_lists.get_by_name(name)
+        except IllumioApiException as e:
+            self._module.fail_json(msg="Failed to get IP list %s: %s" % (name, e))
+        if not ip_list:
+            self._module.fail_json(msg="No IP list found with name %s" % (name))
+        return ip_list.href
+
+    def find(self, ruleset, desired, href, external_data_set, external_data_reference):
+        """Finds the rule in the rule set's rules by HREF, external data
+        reference or providers, consumers and services."""
+        for o in ruleset.get('rules') or []:
+            if href:
+                if o['href'] == href:
+                    return o
+            elif external_data_reference:
+                if (o.get('external_data_set'), o.get('external_data_reference')) == (external_data_set, external_data_reference):
+                    return o
+            elif self.fingerprint.digest(o, RULE_IDENTITY_FIELDS) == self.fingerprint.digest(desired, RULE_IDENTITY_FIELDS):
+                return o
+        if href:
+            self._module.fail_json(msg="No rule found with HREF %s in rule set %s" % (href, ruleset['href']))
+        return None
+
+    def set_desired_state(self, desired):
+        self._desired = desired
+
+    def desired_state(self) -> dict:
+        return self._desired
+
+
+def actor_from_href(href):
+    """Builds a rule actor from an object HREF, keyed by the singular object type."""
+    object_type = href.rstrip('/').split('/')[-2]
+    return {object_type[:-1]: {'href': href}}
+
+
+def service(service):
+    if service.get('href'):
+        return {'href': service['href']}
+    proto = service.get('proto')
+    proto = PROTOCOLS.get(proto.lower(), int(proto) if proto.isdigit() else proto) if proto else None
+    return {k: v for k, v in (('port', service.get('port')), ('to_port', service.get('to_port')), ('proto', proto)) if v is not None}
+
+
+def actor_spec():
+    return dict(
+        type='list',
+        elements='dict',
+        options=dict(
+            actors=dict(type='str', choices=['ams']),
+            label=dict(
+                type='dict',
+                options=dict(
+                    # explicitly set no_log to false to avoid ansible-lint false positive
+                    # see https://docs.ansible.com/ansible-core/devel/dev_guide/testing/sanity/validate-modules.html
+                    key=dict(type='str', required=True, no_log=False),
+                    value=dict(type='str', required=True)
+                )
+            ),
+            ip_list=dict(type='str'),
+            href=dict(type='str')
+        ),
+        required_one_of=[['actors', 'label', 'ip_list', 'href']],
+        mutually_exclusive=[['actors', 'label', 'ip_list', 'href']]
+    )
+
+
+def spec():
+    return dict(
+        ruleset=dict(type='str'),
+        ruleset_href=dict(type='str'),
+        href=dict(type='str'),
+        providers=actor_spec(),
+        consumers=actor_spec(),
+        ingress_services=dict(
+            type='list',
+            elements='dict',
+            options=dict(
+                href=dict(type='str'),
+                port=dict(type='int'),
+                to_port=dict(type='int'),
+                proto=dict(type='str')
+            ),
+            required_one_of=[['href', 'proto']],
+            mutually_exclusive=[['href', 'port'], ['href', 'proto']]
+        ),
+        resolve_providers_as=dict(type='list', elements='str', choices=['workloads', 'virtual_services'], default=['workloads']),
+        resolve_consumers_as=dict(type='list', elements='str', choices=['workloads', 'virtual_services'], default=['workloads']),
+        unscoped_consumers=dict(type='bool', default=False),
+        enabled=dict(type='bool', default=True),
+        description=dict(type='str', default=''),
+        external_data_set=dict(type='str'),
+        external_data_reference=dict(type='str'),
+        state=dict(
+            type='str',
+            choices=['present', 'absent'],
+            default='present'
+        )
+    )
+
+
+def main():
+    argument_spec = pce_connection_spec()
+    argument_spec.update(spec())
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        required_one_of=[['ruleset', 'ruleset_href']],
+        mutually_exclusive=[['ruleset', 'ruleset_href']],
+        required_together=[['external_data_set', 'external_data_reference']],
+        supports_check_mode=True
+    )
+
+    if not Rule:
+        module.fail_json(
+            msg=missing_required_lib('illumio', url='https://pypi.org/project/illumio/'),
+            exception=IMPORT_ERROR_TRACEBACK
+        )
+
+    href = module.params.get('href')
+    state = module.params.get('state')
+    external_data_set = module.params.get('external_data_set')
+    external_data_reference = module.params.get('external_data_reference')
+    ingress_services = module.params.get('ingress_services')
+    identity = [module.params.get(k) for k in RULE_IDENTITY_FIELDS]
+
+    if not href and not external_data_reference and any(v is None for v in identity):
+        module.fail_json(msg="providers, consumers and ingress_services are required to match a rule without href or external_data_reference")
+
+    rule_api = RuleApi(module)
+    ruleset = rule_api.get_ruleset(module.params.get('ruleset_href'), module.params.get('ruleset'))
+
+    providers, consumers = rule_api.resolve_actors(module.params.get('providers'), module.params.get('consumers'))
+    desired = dict(
+        providers=providers,
+        consumers=consumers,
+        ingress_services=[service(s) for s in ingress_services] if ingress_services is not None else None,
+        resolve_labels_as=dict(
+            providers=module.params.get('resolve_providers_as'),
+            consumers=module.params.get('resolve_consumers_as')
+        ),
+        unscoped_consumers=module.params.get('unscoped_consumers'),
+        enabled=module.params.get('enabled'),
+        description=module.params.get('description'),
+        external_data_set=external_data_set,
+        external_data_reference=external_data_reference
+    )
+    rule_api.set_desired_state(desired)
+
+    existing_rule = rule_api.find(ruleset, desired, href, external_data_set, external_data_reference)
+    if existing_rule:
+        existing_rule = Rule.from_json(existing_rule)
+
+    if state == 'present':
+        if not existing_rule and any(v is None for v in (providers, consumers, desired['ingress_services'])):
+            module.fail_json(msg="providers, consumers and ingress_services are required to create a rule")
+
+        new_rule = Rule.from_json(desired)
+
+        if module.check_mode:
+            if not existing_rule:
+                module.exit_json(changed=True, rule=rule_api.json_output(new_rule))
+            module.exit_json(
+                changed=not rule_api.params_match(existing_rule),
+                rule=rule_api.json_output(new_rule)
+            )
+
+        if not existing_rule:
+            rule = rule_api.create(new_rule, parent=ruleset['href'])
+            changed = True
+        else:
+            changed, rule = rule_api.update_and_get(existing_rule, new_rule)
+    elif state == 'absent':
+        if module.check_mode:
+            module.exit_json(changed=existing_rule is not None, rule={})
+
+        changed = rule_api.delete(existing_rule)
+        rule = {}
+
+    module.exit_json(changed=changed, rule=rule_api.json_output(rule))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright 2023 Illumio, Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: ruleset
+short_description: Create/update/delete Illumio PCE rule sets
+description:
+  - This module allows you to create and manipulate draft rule set objects on the Illumio PCE.
+  - Changes are only made to the draft policy version. Changed rule sets are recorded on the controller,
+    and are provisioned together with all other recorded draft changes by the M(illumio.core.provision) module.
+  - Supports check mode.
+
+author:
+  - Duncan Sommerville (@dsommerville-illumio)
+requirements:
+  - "python>=3.8"
+  - "illumio>=1.1.3"
+version_added: "0.3.0"
+
+options:
+  href:
+    description: HREF of an existing rule set.
+    type: str
+  name:
+    description:
+      - Rule set name.
+      - Required for creating a rule set or when C(href) is not specified.
+      - Rule sets are looked up by exact name.
+    type: str
+  description:
+    description: Rule set description.
+    type: str
+    default: ''
+  enabled:
+    description: Flag denoting whether the rule set is enabled.
+    type: bool
+    default: true
+  scopes:
+    description:
+      - Scopes of the rule set.
+      - Each scope is a set of labels, and rules in the rule set apply to workloads that match all labels in any scope.
+      - A scope with no labels applies to all workloads.
+      - If not set, new rule sets are created with a single scope that applies to all workloads,
+        and the scopes of existing rule sets are left unchanged.
+      - Scope order and the order of labels within each scope are not significant.
+    type: list
+    elements: dict
+    suboptions:
+      labels:
+        description: Labels in the scope.
+        type: list
+        elements: dict
+        default: []
+        suboptions:
+          href:
+            description:
+              - Label HREF.
+              - Mutually exclusive with C(key) and C(value).
+            type: str
+          key:
+            description:
+              - Label key.
+              - Must be set together with C(value).
+            type: str
+          value:
+            description:
+              - Label value.
+              - Must be set together with C(key).
+            type: str
+  external_data_set:
+    description:
+      - External data set identifier.
+      - Must be set if using C(external_data_reference).
+    type: str
+  external_data_reference:
+    description:
+      - External data reference identifier.
+      - Must be set if using C(external_data_set).
+    type: str
+  state:
+    description:
+      - Desired rule set state.
+      - If C(present), the rule set will be created if it does not exist, or updated to match the provided parameters if it does.
+      - If C(absent), the rule set will be removed if it exists.
+    type: str
+    choices: ['present', 'absent']
+    default: 'present'
+
+extends_documentation_fragment:
+  - illumio.core.pce
+'''
+
+EXAMPLES = r'''
+- name: "Create rule set for the web application"
+  illumio.core.ruleset:
+    name: RS-WEB
+    description: Web application ringfence
+    scopes:
+      - labels:
+          - key: app
+            value: A-WEB
+          - key: env
+            value: E-PROD
+  notify: provision policy
+
+- name: "Remove rule set"
+  illumio.core.ruleset:
+    name: RS-WEB
+    state: absent
+  notify: provision policy
+'''
+
+RETURN = r'''
+ruleset:
+  description: Information about the rule set that was created or updated.
+  type: complex
+  returned: success
+  contains:
+    href:
+      description: The rule set's HREF.
+      type: str
+      returned: always
+    name:
+      description: The rule set's name.
+      type: str
+      returned: always
+    description:
+      description: A description of the rule set.
+      type: str
+      returned: always
+    enabled:
+      description: Flag denoting whether the rule set is enabled.
+      type: bool
+      returned: always
+    scopes:
+      description: Rule set scopes, each a list of label references.
+      type: list
+      elements: list
+      returned: always
+    rules:
+      description: Rules in the rule set.
+      type: list
+      elements: dict
+      returned: always
+    external_data_set:
+      description: The rule set's external data set identifier.
+      type: str
+      returned: always
+    external_data_reference:
+      description: The rule set's external data reference identifier.
+      type: str
+      returned: always
+
+  sample:
+    ruleset:
+      href: /orgs/1/sec_policy/draft/rule_sets/12
+      name: RS-WEB
+      description: Web application ringfence
+      enabled: true
+      scopes:
+        - - label:
+              href: /orgs/1/labels/3
+          - label:
+              href: /orgs/1/labels/7
+      rules: []
+      external_data_set: null
+      external_data_reference: null
+'''
+
+import sys
+import traceback
+
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+from ansible_collections.illumio.core.plugins.module_utils.fingerprint import RULE_SET_FINGERPRINT  # type: ignore
+from ansible_collections.illumio.core.plugins.module_utils.pce import PceObjectApi, label_ref_spec, pce_connection_spec  # type: ignore
+
+IMPORT_ERROR_TRACEBACK = ''
+
+try:
+    from illumio import RuleSet
+except ImportError:
+    RuleSet = None
+    # replicate the traceback formatting from AnsibleModule.fail_json
+    IMPORT_ERROR_TRACEBACK = ''.join(traceback.format_tb(sys.exc_info()[2]))
+
+
+class RuleSetApi(PceObjectApi):
+    fingerprint = RULE_SET_FINGERPRINT
+
+    def __init__(self, module: AnsibleModule) -> None:
+        super().__init__(module)
+        self._api = self._pce.rule_sets
+        self._scopes = None
+
+    def resolve_scopes(self, scopes):
+        """Resolves scope labels to label references with a single label query."""
+        resolved, _ = self.resolve_label_refs(*[scope['labels'] for scope in scopes])
+        self._scopes = [[{'label': {'href': href}} for href, _ in labels] for labels in resolved]
+        return self._scopes
+
+    def desired_state(self) -> dict:
+        return {**super().desired_state(), 'scopes': self._scopes}
+
+    def get_by_name(self, name: str):
+        # the name filter matches on substrings, so find the exact match
+        for o in self.get_all({'name': name}):
+            if o.name == name:
+                return o
+        return None
+
+
+def spec():
+    scope_labels = label_ref_spec()
+    scope_labels['default'] = []
+    return dict(
+        href=dict(type='str'),
+        name=dict(type='str'),
+        description=dict(type='str', default=''),
+        enabled=dict(type='bool', default=True),
+        scopes=dict(
+            type='list',
+            elements='dict',
+            options=dict(
+                labels=scope_labels
+            )
+        ),
+        external_data_set=dict(type='str'),
+        external_data_reference=dict(type='str'),
+        state=dict(
+            type='str',
+            choices=['present', 'absent'],
+            default='present'
+        )
+    )
+
+
+def main():
+    argument_spec = pce_connection_spec()
+    argument_spec.update(spec())
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        required_one_of=[['name', 'href']],
+        required_together=[['external_data_set', 'external_data_reference']],
+        supports_check_mode=True
+    )
+
+    if not RuleSet:
+        module.fail_json(
+            msg=missing_required_lib('illumio', url='https://pypi.org/project/illumio/'),
+            exception=IMPORT_ERROR_TRACEBACK
+        )
+
+    ruleset_api = RuleSetApi(module)
+
+    href = module.params.get('href')
+    name = module.params.get('name')
+    description = module.params.get('description')
+    enabled = module.params.get('enabled')
+    scopes = module.params.get('scopes')
+    state = module.params.get('state')
+    external_data_set = module.params.get('external_data_set')
+    external_data_reference = module.params.get('external_data_reference')
+
+    if href:
+        existing_ruleset = ruleset_api.get_by_href(href)
+        if not existing_ruleset:
+            module.fail_json("No rule set found with HREF %s" % (href))
+    elif name:
+        existing_ruleset = ruleset_api.get_by_name(name)
+
+    if state == 'present':
+        if scopes is not None:
+            scopes = ruleset_api.resolve_scopes(scopes)
+        elif not existing_ruleset:
+            # the PCE requires at least one scope, and an empty scope applies to all workloads
+            scopes = [[]]
+
+        new_ruleset = RuleSet.from_json(dict(
+            name=name,
+            description=description,
+            enabled=enabled,
+            scopes=scopes,
+            external_data_set=external_data_set,
+            external_data_reference=external_data_reference
+        ))
+
+        if module.check_mode:
+            if not existing_ruleset:
+                module.exit_json(changed=True, ruleset=ruleset_api.json_output(new_ruleset))
+            module.exit_json(
+                changed=not ruleset_api.params_match(existing_ruleset),
+                ruleset=ruleset_api.json_output(new_ruleset)
+            )
+
+        if not existing_ruleset:
+            ruleset = ruleset_api.create(new_ruleset)
+            changed = True
+        else:
+            changed, ruleset = ruleset_api.update_and_get(existing_ruleset, new_ruleset)
+    elif state == 'absent':
+        if module.check_mode:
+            module.exit_json(changed=True, ruleset={})
+
+        changed = ruleset_api.delete(existing_ruleset)
+        ruleset = {}
+
+    module.exit_json(changed=changed, ruleset=ruleset_api.json_output(ruleset))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,384 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright 2023 Illumio, Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: unmanaged_workloads
+short_description: Create/update/delete Illumio PCE unmanaged workloads in bulk
+description:
+  - This module allows you to manage a list of unmanaged workload objects on the Illumio PCE in a single task.
+  - The existing unmanaged workloads are fetched once and compared against the given workloads,
+    and only the required changes are sent to the PCE using the workload C(bulk_create), C(bulk_update)
+    and C(bulk_delete) endpoints.
+  - Bulk requests are split into batches of at most C(batch_size) workloads, and batches are sent concurrently.
+  - Supports check mode.
+
+author:
+  - Duncan Sommerville (@dsommerville-illumio)
+requirements:
+  - "python>=3.8"
+  - "illumio>=1.1.3"
+version_added: "0.3.0"
+
+options:
+  workloads:
+    description:
+      - List of unmanaged workloads to manage.
+      - Workloads are matched to existing unmanaged workloads on the PCE by the field given in C(match_by),
+        which must be set and unique for each workload in the list.
+      - Fields that are not set are left unchanged on existing workloads.
+    type: list
+    elements: dict
+    required: true
+    suboptions:
+      name:
+        description: Workload name.
+        type: str
+      hostname:
+        description: Workload hostname.
+        type: str
+      description:
+        description: Workload description.
+        type: str
+      public_ip:
+        description: The public IP address of the workload.
+        type: str
+      interfaces:
+        description: Network interfaces of the workload.
+        type: list
+        elements: dict
+        suboptions:
+          name:
+            description: Interface name.
+            type: str
+            required: true
+          address:
+            description: Interface IP address.
+            type: str
+            required: true
+      labels:
+        description:
+          - Labels to apply to the workload.
+          - Label order is not significant.
+        type: list
+        elements: dict
+        suboptions:
+          href:
+            description: Label HREF.
+            type: str
+            required: true
+      external_data_set:
+        description:
+          - External data set identifier.
+          - Must be set if using C(external_data_reference).
+        type: str
+      external_data_reference:
+        description:
+          - External data reference identifier.
+          - Must be set if using C(external_data_set).
+        type: str
+      state:
+        description:
+          - Desired workload state.
+          - If C(present), the workload will be created if it does not exist, or updated to match the provided parameters if it does.
+          - If C(absent), the workload will be removed if it exists.
+        type: str
+        choices: ['present', 'absent']
+        default: 'present'
+  match_by:
+    description:
+      - Workload field used to match workloads in the list to existing unmanaged workloads.
+    type: str
+    choices: ['name', 'hostname', 'external_data_reference']
+    default: 'name'
+  batch_size:
+    description:
+      - Maximum number of workloads to send in each bulk request.
+      - The PCE rejects bulk requests with more than 1000 workloads.
+    type: int
+    default: 1000
+  max_workers:
+    description:
+      - Maximum number of bulk requests to send to the PCE concurrently.
+    type: int
+    default: 4
+
+extends_documentation_fragment:
+  - illumio.core.pce
+'''
+
+EXAMPLES = r'''
+- name: "Register unmanaged workloads"
+  illumio.core.unmanaged_workloads:
+    workloads:
+      - name: LB-WEB-01
+        hostname: lb-web-01.lab.company.com
+        interfaces:
+          - name: eth0
+            address: 10.0.8.10
+        labels:
+          - href: /orgs/1/labels/1
+          - href: /orgs/1/labels/2
+
+- name: "Sync appliances from CMDB data"
+  illumio.core.unmanaged_workloads:
+    workloads: "{{ cmdb_appliances }}"
+    match_by: external_data_reference
+    max_workers: 8
+  register: workloads_result
+
+- name: "Remove unmanaged workloads"
+  illumio.core.unmanaged_workloads:
+    workloads:
+      - name: LB-WEB-01
+        state: absent
+'''
+
+RETURN = r'''
+workloads:
+  description: Per-workload results, in the same order as the C(workloads) option.
+  type: list
+  elements: dict
+  returned: success
+  contains:
+    key:
+      description: The value of the C(match_by) field for the workload.
+      type: str
+      returned: always
+    action:
+      description: The change made for this workload.
+      type: str
+      returned: always
+      choices: ['created', 'updated', 'deleted', 'unchanged']
+    changed:
+      description: Flag denoting whether the workload was changed.
+      type: bool
+      returned: always
+    href:
+      description:
+        - The workload HREF.
+        - Null if the workload does not exist, or would be created in check mode.
+      type: str
+      returned: always
+    msg:
+      description: Error message returned by the PCE if the change failed.
+      type: str
+      returned: on failure
+
+  sample:
+    workloads:
+      - key: LB-WEB-01
+        action: created
+        changed: true
+        href: /orgs/1/workloads/4a0b1a8e-4c47-4b1a-9d5f-8e1a7b4a6d3e
+'''
+
+import sys
+import traceback
+
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+from ansible_collections.illumio.core.plugins.module_utils.fingerprint import WORKLOAD_FINGERPRINT  # type: ignore
+from ansible_collections.illumio.core.plugins.module_utils.pce import (  # type: ignore
+    BULK_CHANGE_LIMIT, PceObjectApi, bulk_change, iter_collection, pce_connection_spec
+)
+
+IMPORT_ERROR_TRACEBACK = ''
+
+try:
+    from illumio import IllumioApiException
+except ImportError:
+    IllumioApiException = None
+    # replicate the traceback formatting from AnsibleModule.fail_json
+    IMPORT_ERROR_TRACEBACK = ''.join(traceback.format_tb(sys.exc_info()[2]))
+
+# bulk endpoint and the per-item status it returns on success
+BULK_METHODS = {
+    'created': ('bulk_create', 'created'),
+    'updated': ('bulk_update', 'updated'),
+    'deleted': ('bulk_delete', None),
+}
+
+
+class UnmanagedWorkloadsApi(PceObjectApi):
+    fingerprint = WORKLOAD_FINGERPRINT
+
+    def __init__(self, module: AnsibleModule) -> None:
+        super().__init__(module)
+        self._api = self._pce.workloads
+
+    def plan(self, workloads, match_by):
+        """Builds a (workload, existing_workload, action) list for the given
+        workloads from a single fetch of the unmanaged workloads.
+
+        Existing workloads are kept as decoded JSON rather than SDK objects,
+        as only their HREFs and fingerprints are needed.
+        """
+        try:
+            catalog = {
+                o[match_by]: o for o in iter_collection(self._pce, '/workloads', {'managed': 'false'})
+                if o.get(match_by)
+            }
+        except IllumioApiException as e:
+            self._module.fail_json(msg="Failed to get PCE objects: %s" % (e))
+
+        changes = []
+        for workload in workloads:
+            existing_workload = catalog.get(workload[match_by])
+            if workload['state'] == 'present':
+                if not existing_workload:
+                    action = 'created'
+                elif not self.fingerprint.matches(workload, existing_workload):
+                    action = 'updated'
+                else:
+                    action = 'unchanged'
+            else:
+                action = 'deleted' if existing_workload else 'unchanged'
+            changes.append((workload, existing_workload, action))
+        return changes
+
+    def body(self, workload, existing_workload, action):
+        if action == 'deleted':
+            return {'href': existing_workload['href']}
+        body = {k: workload[k] for k in self.fingerprint.fields if workload.get(k) is not None}
+        if action == 'updated':
+            body['href'] = existing_workload['href']
+        return body
+
+    def apply(self, changes, batch_size, max_workers):
+        """Sends the planned changes to the bulk endpoints, returning an
+        (href, error) pair for each change."""
+        outcomes = [(None, None)] * len(changes)
+        for action, (method, success_status) in BULK_METHODS.items():
+            indices = [i for i, (_, _, a) in enumerate(changes) if a == action]
+            if not indices:
+                continue
+            objects = [self.body(*changes[i]) for i in indices]
+            pairs = bulk_change(self._pce, '/workloads/%s' % (method), objects, success_status, batch_size, max_workers)
+            for i, pair in zip(indices, pairs):
+                outcomes[i] = pair
+        return outcomes
+
+    def result(self, workload, existing_workload, action, match_by, href=None, msg=None):
+        if href is None and existing_workload and action != 'deleted':
+            href = existing_workload['href']
+        result = dict(
+            key=workload[match_by],
+            action=action,
+            changed=action != 'unchanged' and msg is None,
+            href=href
+        )
+        if msg is not None:
+            result['msg'] = msg
+        return result
+
+
+def spec():
+    return dict(
+        workloads=dict(
+            type='list',
+            elements='dict',
+            required=True,
+            options=dict(
+                name=dict(type='str'),
+                hostname=dict(type='str'),
+                description=dict(type='str'),
+                public_ip=dict(type='str'),
+                interfaces=dict(
+                    type='list',
+                    elements='dict',
+                    options=dict(
+                        name=dict(type='str', required=True),
+                        address=dict(type='str', required=True)
+                    )
+                ),
+                labels=dict(
+                    type='list',
+                    elements='dict',
+                    options=dict(
+                        href=dict(type='str', required=True)
+                    )
+                ),
+                external_data_set=dict(type='str'),
+                external_data_reference=dict(type='str'),
+                state=dict(
+                    type='str',
+                    choices=['present', 'absent'],
+                    default='present'
+                )
+            ),
+            required_together=[['external_data_set', 'external_data_reference']]
+        ),
+        match_by=dict(
+            type='str',
+            choices=['name', 'hostname', 'external_data_reference'],
+            default='name'
+        ),
+        batch_size=dict(type='int', default=1000),
+        max_workers=dict(type='int', default=4)
+    )
+
+
+def main():
+    argument_spec = pce_connection_spec()
+    argument_spec.update(spec())
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True
+    )
+
+    if not IllumioApiException:
+        module.fail_json(
+            msg=missing_required_lib('illumio', url='https://pypi.org/project/illumio/'),
+            exception=IMPORT_ERROR_TRACEBACK
+        )
+
+    workloads = module.params.get('workloads')
+    match_by = module.params.get('match_by')
+    batch_size = module.params.get('batch_size')
+    max_workers = module.params.get('max_workers')
+
+    if not 0 < batch_size <= BULK_CHANGE_LIMIT:
+        module.fail_json(msg="batch_size must be between 1 and %d" % (BULK_CHANGE_LIMIT))
+
+    seen = set()
+    for workload in workloads:
+        key = workload.get(match_by)
+        if not key:
+            module.fail_json(msg="All workloads must set %s to be matched by it" % (match_by))
+        if key in seen:
+            module.fail_json(msg="Duplicate workload in workloads: %s=%s" % (match_by, key))
+        seen.add(key)
+
+    workloads_api = UnmanagedWorkloadsApi(module)
+    changes = workloads_api.plan(workloads, match_by)
+
+    if module.check_mode:
+        outcomes = [(None, None)] * len(changes)
+    else:
+        outcomes = workloads_api.apply(changes, batch_size, max_workers)
+
+    results = [
+        workloads_api.result(workload, existing_workload, action, match_by, href, msg)
+        for (workload, existing_workload, action), (href, msg) in zip(changes, outcomes)
+    ]
+
+    changed = any(result['changed'] for result in results)
+    failed = [result for result in results if 'msg' in result]
+    if failed:
+        module.fail_json(
+            msg="Failed to apply changes for %d workload(s): %s" % (len(failed), failed[0]['msg']),
+            changed=changed,
+            workloads=results
+        )
+
+    module.exit_json(changed=changed, workloads=results)
+
+
+if __name__ == '__main__':
+    main()
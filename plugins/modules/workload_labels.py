@@ -0,0 +1,310 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright 2023 Illumio, Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: workload_labels
+short_description: Assign labels to Illumio PCE workloads in bulk
+description:
+  - This module allows you to relabel every workload on the Illumio PCE that carries a given set of labels in a single task.
+  - Matching workloads are fetched with a single label-filtered query, and the new label set for each workload
+    is computed locally. Only workloads whose labels change are sent to the PCE, using the workload
+    C(bulk_update) endpoint.
+  - For each label in C(labels), any existing label with the same key is replaced. Labels with other keys are left unchanged.
+  - Supports check mode.
+
+author:
+  - Duncan Sommerville (@dsommerville-illumio)
+requirements:
+  - "python>=3.8"
+  - "illumio>=1.1.3"
+version_added: "0.3.0"
+
+options:
+  match_labels:
+    description:
+      - Labels used to select workloads.
+      - Only workloads that carry all of these labels are changed.
+    type: list
+    elements: dict
+    required: true
+    suboptions:
+      href:
+        description:
+          - Label HREF.
+          - Mutually exclusive with C(key) and C(value).
+        type: str
+      key:
+        description:
+          - Label key.
+          - Must be set together with C(value).
+        type: str
+      value:
+        description:
+          - Label value.
+          - Must be set together with C(key).
+        type: str
+  labels:
+    description:
+      - Labels to assign to the selected workloads.
+      - Each label key may only appear once in the list.
+    type: list
+    elements: dict
+    required: true
+    suboptions:
+      href:
+        description:
+          - Label HREF.
+          - Mutually exclusive with C(key) and C(value).
+        type: str
+      key:
+        description:
+          - Label key.
+          - Must be set together with C(value).
+        type: str
+      value:
+        description:
+          - Label value.
+          - Must be set together with C(key).
+        type: str
+  batch_size:
+    description:
+      - Maximum number of workloads to send in each bulk request.
+      - The PCE rejects bulk requests with more than 1000 workloads.
+    type: int
+    default: 1000
+  max_workers:
+    description:
+      - Maximum number of bulk requests to send to the PCE concurrently.
+    type: int
+    default: 4
+
+extends_documentation_fragment:
+  - illumio.core.pce
+'''
+
+EXAMPLES = r'''
+- name: "Move the web application from staging to production"
+  illumio.core.workload_labels:
+    match_labels:
+      - key: app
+        value: A-WEB
+      - key: env
+        value: E-STAGING
+    labels:
+      - key: env
+        value: E-PROD
+
+- name: "Relabel workloads using label HREFs"
+  illumio.core.workload_labels:
+    match_labels:
+      - href: /orgs/1/labels/12
+    labels:
+      - href: /orgs/1/labels/20
+      - href: /orgs/1/labels/21
+    batch_size: 500
+  register: relabel_result
+'''
+
+RETURN = r'''
+workloads:
+  description: Per-workload results for each workload matching C(match_labels).
+  type: list
+  elements: dict
+  returned: success
+  contains:
+    href:
+      description: The workload HREF.
+      type: str
+      returned: always
+    name:
+      description: The workload name.
+      type: str
+      returned: always
+    hostname:
+      description: The workload hostname.
+      type: str
+      returned: always
+    action:
+      description: The change made for this workload.
+      type: str
+      returned: always
+      choices: ['updated', 'unchanged']
+    changed:
+      description: Flag denoting whether the workload was changed.
+      type: bool
+      returned: always
+    labels:
+      description: HREFs of the workload's labels after the change.
+      type: list
+      elements: str
+      returned: always
+    msg:
+      description: Error message returned by the PCE if the change failed.
+      type: str
+      returned: on failure
+
+  sample:
+    workloads:
+      - href: /orgs/1/workloads/4a0b1a8e-4c47-4b1a-9d5f-8e1a7b4a6d3e
+        name: web01
+        hostname: web01.lab.company.com
+        action: updated
+        changed: true
+        labels:
+          - /orgs/1/labels/11
+          - /orgs/1/labels/20
+'''
+
+import json
+import sys
+import traceback
+
+from ansible.module_utils.basic import AnsibleModule, missing_required_lib
+from ansible_collections.illumio.core.plugins.module_utils.fingerprint import WORKLOAD_FINGERPRINT  # type: ignore
+from ansible_collections.illumio.core.plugins.module_utils.pce import (  # type: ignore
+    BULK_CHANGE_LIMIT, PceObjectApi, bulk_change, iter_collection, label_ref_spec, pce_connection_spec
+)
+
+IMPORT_ERROR_TRACEBACK = ''
+
+try:
+    from illumio import IllumioApiException
+except ImportError:
+    IllumioApiException = None
+    # replicate the traceback formatting from AnsibleModule.fail_json
+    IMPORT_ERROR_TRACEBACK = ''.join(traceback.format_tb(sys.exc_info()[2]))
+
+
+class WorkloadLabelsApi(PceObjectApi):
+    fingerprint = WORKLOAD_FINGERPRINT
+
+    def __init__(self, module: AnsibleModule) -> None:
+        super().__init__(module)
+        self._api = self._pce.workloads
+        self._label_keys = {}
+
+    def resolve_labels(self, match_labels, labels):
+        (match_labels, labels), self._label_keys = self.resolve_label_refs(match_labels, labels)
+        return match_labels, labels
+
+    def plan(self, match_labels, labels):
+        """Builds a (workload, new_label_hrefs, action) list for the
+        workloads carrying all of match_labels from a single query."""
+        # the labels filter takes a list of label HREF groups, and matches workloads with all labels in any group
+        params = {'labels': json.dumps([sorted(href for href, _ in match_labels)])}
+        try:
+            workloads = list(iter_collection(self._pce, '/workloads', params))
+        except IllumioApiException as e:
+            self._module.fail_json(msg="Failed to get workloads: %s" % (str(e)))
+
+        keys = {key for _, key in labels}
+        changes = []
+        for o in workloads:
+            current = [ref['href'] for ref in o.get('labels') or []]
+            # labels not in the catalog have no known key, so they are kept
+            new = [href for href in current if self._label_keys.get(href) not in keys] + [href for href, _ in labels]
+            if self.fingerprint.matches({'labels': [{'href': href} for href in new]}, o):
+                changes.append((o, current, 'unchanged'))
+            else:
+                changes.append((o, new, 'updated'))
+        return changes
+
+    def apply(self, changes, batch_size, max_workers):
+        """Sends the label changes to the bulk update endpoint, returning
+        an (href, error) pair for each change."""
+        indices = [i for i, (_, _, action) in enumerate(changes) if action == 'updated']
+        objects = [
+            {'href': changes[i][0]['href'], 'labels': [{'href': href} for href in changes[i][1]]}
+            for i in indices
+        ]
+        outcomes = [(None, None)] * len(changes)
+        pairs = bulk_change(self._pce, '/workloads/bulk_update', objects, 'updated', batch_size, max_workers)
+        for i, pair in zip(indices, pairs):
+            outcomes[i] = pair
+        return outcomes
+
+    def result(self, o, labels, action, msg=None):
+        result = dict(
+            href=o['href'],
+            name=o.get('name'),
+            hostname=o.get('hostname'),
+            action=action,
+            changed=action != 'unchanged' and msg is None,
+            labels=labels
+        )
+        if msg is not None:
+            result['msg'] = msg
+        return result
+
+
+def spec():
+    return dict(
+        match_labels=label_ref_spec(required=True),
+        labels=label_ref_spec(required=True),
+        batch_size=dict(type='int', default=1000),
+        max_workers=dict(type='int', default=4)
+    )
+
+
+def main():
+    argument_spec = pce_connection_spec()
+    argument_spec.update(spec())
+
+    module = AnsibleModule(
+        argument_spec=argument_spec,
+        supports_check_mode=True
+    )
+
+    if not IllumioApiException:
+        module.fail_json(
+            msg=missing_required_lib('illumio', url='https://pypi.org/project/illumio/'),
+            exception=IMPORT_ERROR_TRACEBACK
+        )
+
+    batch_size = module.params.get('batch_size')
+    max_workers = module.params.get('max_workers')
+
+    if not 0 < batch_size <= BULK_CHANGE_LIMIT:
+        module.fail_json(msg="batch_size must be between 1 and %d" % (BULK_CHANGE_LIMIT))
+    if not module.params.get('match_labels'):
+        module.fail_json(msg="match_labels must contain at least one label")
+
+    workload_labels_api = WorkloadLabelsApi(module)
+    match_labels, labels = workload_labels_api.resolve_labels(module.params.get('match_labels'), module.params.get('labels'))
+
+    keys = [key for _, key in labels]
+    duplicates = sorted({key for key in keys if keys.count(key) > 1})
+    if duplicates:
+        module.fail_json(msg="Multiple labels with the same key in labels: %s" % (', '.join(duplicates)))
+
+    changes = workload_labels_api.plan(match_labels, labels)
+    if module.check_mode:
+        outcomes = [(None, None)] * len(changes)
+    else:
+        outcomes = workload_labels_api.apply(changes, batch_size, max_workers)
+
+    results = [
+        workload_labels_api.result(o, new_labels, action, msg)
+        for (o, new_labels, action), (_, msg) in zip(changes, outcomes)
+    ]
+
+    changed = any(result['changed'] for result in results)
+    failed = [result for result in results if 'msg' in result]
+    if failed:
+        module.fail_json(
+            msg="Failed to apply changes for %d workload(s): %s" % (len(failed), failed[0]['msg']),
+            changed=changed,
+            workloads=results
+        )
+
+    module.exit_json(changed=changed, workloads=results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+# Copyright 2023 Illumio, Inc. All Rights Reserved.
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import io
+import json
+import os
+from contextlib import contextmanager, redirect_stdout
+
+from ansible.module_utils import basic
+from ansible.module_utils.common import warnings
+from ansible.module_utils.common.text.converters import to_bytes, to_native
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.plugins.action.normal import ActionModule as NormalActionModule
+from ansible.utils.display import Display
+from ansible.vars.clean import remove_internal_keys
+
+# importing module_utils here loads the illumio SDK once in the controller,
+# before workers are forked, rather than in every module run
+from ansible_collections.illumio.core.plugins.module_utils import pce as pce_utils  # type: ignore
+
+display = Display()
+
+
+class PceActionBase(NormalActionModule):
+    """Optionally runs PCE modules in the controller worker process.
+
+    PCE modules only make API calls, so when the illumio_pce_in_process
+    variable is true and the module would run on the controller anyway,
+    the module's main() is called directly instead of building an AnsiballZ
+    payload and starting a new interpreter for it. Verified PCE sessions
+    are reused by later runs in the same process, such as each item of a
+    loop.
+
+    In-process execution sets the module args through private globals in
+    ansible.module_utils.basic, so it is off by default. Modules run
+    normally unless it is enabled, and also for remote hosts, become, async
+    tasks, when the illumio SDK can't be imported on the controller, or when
+    the running ansible-core doesn't have the globals it relies on.
+
+    Subclasses set MODULE to the module they run.
+    """
+
+    MODULE = None
+
+    def run(self, tmp=None, task_vars=None):
+        if task_vars is None:
+            task_vars = dict()
+
+        # workers are forked from the ansible-playbook process, so its PID
+        # identifies the run that draft changes are recorded for, and modules
+        # run on the controller inherit it from the worker's environment
+        os.environ.setdefault(pce_utils.DRAFT_RUN_ID_ENV, str(os.getppid()))
+
+        if not self._in_process_eligible(task_vars):
+            return super(PceActionBase, self).run(tmp, task_vars)
+
+        # skip NormalActionModule.run and only apply the base task checks
+        result = super(NormalActionModule, self).run(tmp, task_vars)
+        del tmp  # tmp no longer has any effect
+
+        result.update(self._run_in_process(task_vars))
+        return result
+
+    def _in_process_eligible(self, task_vars):
+        host = task_vars.get('inventory_hostname')
+        enabled = boolean(self._templar.template(task_vars.get('illumio_pce_in_process', False)), strict=False)
+        local = self._connection.transport in ('local', 'ansible.builtin.local') or getattr(self._connection, 'socket_path', None)
+        if not enabled:
+            reason = 'illumio_pce_in_process is not enabled'
+        elif not hasattr(basic, '_ANSIBLE_ARGS'):
+            reason = 'not supported by this version of ansible-core'
+        elif not local:
+            reason = 'module runs on a remote host'
+        elif self._task.async_val:
+            reason = 'task uses async'
+        elif self._play_context.become:
+            reason = 'task uses become'
+        elif not pce_utils.PolicyComputeEngine:
+            reason = 'illumio library is not installed on the controller'
+        else:
+            display.vvvv('Running %s in-process' % (self._task.action), host=host)
+            return True
+        display.vvvv('Not running %s in-process: %s' % (self._task.action, reason), host=host)
+        return False
+
+    def _run_in_process(self, task_vars):
+        module_args = dict(self._task.args)
+        self._update_module_args(self._task.action, module_args, task_vars)
+
+        stdout = io.StringIO()
+        stderr = ''
+        try:
+            with _module_params(module_args), _task_environment(self._environment()), redirect_stdout(stdout):
+                self.MODULE.main()
+        except SystemExit:
+            # modules exit after writing their result
+            pass
+        except Exception as e:
+            stderr = to_native(e)
+
+        data = self._parse_returned_data(dict(rc=0, stdout=stdout.getvalue(), stderr=stderr), *_RESULT_PROFILE)
+        remove_internal_keys(data)
+        return data
+
+    def _environment(self):
+        """Returns the environment variables set for the task with the environment keyword."""
+        environment = {}
+        for e in self._task.environment or []:
+            e = self._templar.template(e)
+            if isinstance(e, dict):
+                environment.update((k, to_native(v)) for k, v in e.items())
+        return environment
+
+
+# ansible-core 2.19 serializes module args and results with a named profile
+_RESULT_PROFILE = ('legacy',) if hasattr(basic, '_ANSIBLE_PROFILE') else ()
+
+
+@contextmanager
+def _module_params(module_args):
+    """Sets the params AnsibleModule loads, and clears warnings and
+    deprecations left over from earlier runs in this process."""
+    saved = basic._ANSIBLE_ARGS, getattr(basic, '_ANSIBLE_PROFILE', None)
+    basic._ANSIBLE_ARGS = to_bytes(json.dumps({'ANSIBLE_MODULE_ARGS': module_args}))
+    if _RESULT_PROFILE:
+        basic._ANSIBLE_PROFILE = _RESULT_PROFILE[0]
+    _clear_warnings()
+    try:
+        yield
+    finally:
+        basic._ANSIBLE_ARGS = saved[0]
+        if _RESULT_PROFILE:
+            basic._ANSIBLE_PROFILE = saved[1]
+        _clear_warnings()
+
+
+def _clear_warnings():
+    for name in ('_global_warnings', '_global_deprecations'):
+        messages = getattr(warnings, name, None)
+        if messages is not None:
+            messages.clear()
+
+
+@contextmanager
+def _task_environment(environment):
+    saved = {k: os.environ.get(k) for k in environment}
+    os.environ.update(environment)
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
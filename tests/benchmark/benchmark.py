@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2023 Illumio, Inc. All Rights Reserved.
+
+"""End-to-end module benchmarks against the mock PCE.
+
+For each scale, the mock PCE is seeded with that many labels, pairing
+profiles and container clusters. Each module is then run --tasks times
+against randomly chosen existing objects, with --forks tasks in flight at
+once. Modules are run in a subprocess the same way Ansible runs them on a
+local host, so interpreter startup and imports are included in the task
+latency; controller-side overhead such as templating and fork scheduling
+is not.
+
+Reports tasks per second, PCE API calls per task and p50/p99 task latency
+for each module and scale, and optionally writes them to a JSON file.
+
+Usage:
+    python tests/benchmark/benchmark.py --scales 1,100,10000 --tasks 100 --forks 8
+    python tests/benchmark/benchmark.py --latency 20 --rate-limit 125 --output results.json
+    python tests/benchmark/benchmark.py --scales 1 --latency 50 --forks 32 --coalesce
+"""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_pce import make_server  # noqa: E402
+
+COLLECTION_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODULES = ['label', 'pairing_profile', 'pairing_key', 'container_cluster']
+
+LABEL_KEYS = ['role', 'app', 'env', 'loc']
+
+# field values matching the pairing_profile module defaults, so that
+# present-state runs against seeded profiles don't report changes
+PAIRING_PROFILE_DEFAULTS = dict(
+    description='', enabled=True, enforcement_mode='idle', enforcement_mode_lock=True,
+    visibility_level='flow_summary', visibility_level_lock=True, allowed_uses_per_key='unlimited',
+    key_lifespan='unlimited', labels=[], role_label_lock=True, app_label_lock=True,
+    env_label_lock=True, loc_label_lock=True
+)
+
+
+def seed_objects(scale):
+    objects = []
+    for i in range(scale):
+        objects.append(dict(type='labels', key=LABEL_KEYS[i % len(LABEL_KEYS)], value='bench-label-%d' % (i)))
+        objects.append(dict(PAIRING_PROFILE_DEFAULTS, type='pairing_profiles', name='bench-pp-%d' % (i)))
+        objects.append(dict(type='container_clusters', name='bench-cc-%d' % (i), description=''))
+    return objects
+
+
+def module_args(module, i):
+    """Returns arguments for an idempotent module run against the seeded object with index i."""
+    if module == 'label':
+        return dict(key=LABEL_KEYS[i % len(LABEL_KEYS)], value='bench-label-%d' % (i), state='present')
+    if module == 'pairing_profile':
+        return dict(name='bench-pp-%d' % (i), state='present')
+    if module == 'pairing_key':
+        return dict(pairing_profile_name='bench-pp-%d' % (i))
+    return dict(name='bench-cc-%d' % (i), state='present')
+
+
+def collection_path(workdir):
+    """Returns a path from which the collection can be imported as
+    ansible_collections.illumio.core, linking to it from the work
+    directory if the checkout isn't in a collection tree."""
+    parts = COLLECTION_ROOT.split(os.sep)
+    if parts[-3:-1] == ['ansible_collections', 'illumio'] and parts[-1] == 'core':
+        return os.sep.join(parts[:-3])
+    namespace = os.path.join(workdir, 'ansible_collections', 'illumio')
+    os.makedirs(namespace)
+    os.symlink(COLLECTION_ROOT, os.path.join(namespace, 'core'))
+    return workdir
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+class Benchmark(object):
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix='illumio-benchmark-')
+        self.pythonpath = collection_path(self.workdir)
+        self.server = make_server(
+            port=0, latency=args.latency, jitter=args.jitter,
+            rate_limit=args.rate_limit, burst=args.burst, retry_after=args.retry_after
+        )
+        self.port = self.server.server_address[1]
+        self.connection = dict(
+            pce_hostname='http://127.0.0.1',
+            pce_port=self.port,
+            pce_org_id=1,
+            api_key_username='benchmark',
+            api_key_secret='benchmark',
+            pce_cache_dir=os.path.join(self.workdir, 'cache'),
+            pce_rate_limit=args.client_rate_limit,
+            pce_coalesce_requests=args.coalesce,
+            pce_stats=True
+        )
+
+    def _control(self, path, body=None):
+        if path == 'stats':
+            data = None
+        else:
+            data = json.dumps(body).encode('utf-8') if body is not None else b''
+        req = Request('http://127.0.0.1:%d/_mock/%s' % (self.port, path), data=data,
+                      headers={'Content-Type': 'application/json'})
+        with urlopen(req) as response:
+            return json.loads(response.read() or b'{}')
+
+    def run_task(self, module, i):
+        args_path = os.path.join(self.workdir, '%s-%d-%d.json' % (module, i, threading.get_ident()))
+        with open(args_path, 'w') as f:
+            json.dump({'ANSIBLE_MODULE_ARGS': dict(self.connection, **module_args(module, i))}, f)
+
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [self.pythonpath, os.environ.get('PYTHONPATH')])))
+        start = time.monotonic()
+        proc = subprocess.run(
+            [sys.executable, '-m', 'ansible_collections.illumio.core.plugins.modules.%s' % (module), args_path],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, cwd=self.workdir
+        )
+        elapsed = time.monotonic() - start
+        os.remove(args_path)
+
+        try:
+            result = json.loads(proc.stdout)
+        except ValueError:
+            result = dict(failed=True, msg=(proc.stdout + proc.stderr).decode('utf-8', 'replace')[-2000:])
+        return elapsed, result
+
+    def run(self, module, scale):
+        args = self.args
+        self._control('reset')
+        self._control('seed', seed_objects(scale))
+        targets = [random.randrange(scale) for _ in range(args.tasks)]
+
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=args.forks) as executor:
+            results = list(executor.map(lambda i: self.run_task(module, i), targets))
+        wall = time.monotonic() - start
+        server_stats = self._control('stats')
+
+        latencies = [elapsed for elapsed, _ in results]
+        failures = [r for _, r in results if r.get('failed')]
+        api_calls = sum((r.get('pce_stats') or {}).get('requests', 0) for _, r in results)
+        return dict(
+            module=module,
+            scale=scale,
+            tasks=len(results),
+            failed=len(failures),
+            changed=sum(1 for _, r in results if r.get('changed')),
+            tasks_per_sec=round(len(results) / wall, 2),
+            api_calls_per_task=round(api_calls / len(results), 2),
+            server_requests=sum(v for k, v in server_stats.items() if k != '429'),
+            throttled=server_stats.get('429', 0),
+            p50_ms=round(percentile(latencies, 50) * 1000, 1),
+            p99_ms=round(percentile(latencies, 99) * 1000, 1),
+            error=failures[0].get('msg') if failures else None
+        )
+
+    def main(self):
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            rows = []
+            for scale in self.args.scales:
+                for module in self.args.modules:
+                    row = self.run(module, scale)
+                    rows.append(row)
+                    print_row(row, header=len(rows) == 1)
+            return rows
+        finally:
+            self.server.shutdown()
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+COLUMNS = [
+    ('module', '%-18s'), ('scale', '%7s'), ('tasks', '%6s'), ('failed', '%7s'), ('tasks_per_sec', '%14s'),
+    ('api_calls_per_task', '%19s'), ('throttled', '%10s'), ('p50_ms', '%9s'), ('p99_ms', '%9s')
+]
+
+
+def print_row(row, header=False):
+    if header:
+        print('  '.join(fmt % (name) for name, fmt in COLUMNS))
+    print('  '.join(fmt % (row[name]) for name, fmt in COLUMNS))
+    if row['error']:
+        print('    first failure: %s' % (row['error'].strip().splitlines()[-1]))
+    sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', default='1,100,10000',
+                        help='comma-separated number of objects of each type to seed the mock PCE with')
+    parser.add_argument('--modules', default=','.join(MODULES), help='comma-separated modules to benchmark')
+    parser.add_argument('--tasks', type=int, default=50, help='module runs for each module and scale')
+    parser.add_argument('--forks', type=int, default=8, help='module runs in flight at once')
+    parser.add_argument('--latency', type=float, default=0, help='mock PCE latency for each API request, in milliseconds')
+    parser.add_argument('--jitter', type=float, default=0, help='maximum random latency added on top of --latency, in milliseconds')
+    parser.add_argument('--rate-limit', type=float, default=0, help='mock PCE API requests allowed per second, 0 for no limit')
+    parser.add_argument('--burst', type=float, default=None, help='mock PCE rate limit bucket size')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After value for 429 responses, -1 to omit the header')
+    parser.add_argument('--client-rate-limit', type=float, default=0, help='pce_rate_limit value passed to the modules')
+    parser.add_argument('--coalesce', action='store_true', help='set pce_coalesce_requests for the modules')
+    parser.add_argument('--seed', type=int, default=None, help='random seed used to choose target objects')
+    parser.add_argument('--output', help='path of a JSON file to write results to')
+    args = parser.parse_args()
+
+    args.scales = [int(s) for s in args.scales.split(',')]
+    args.modules = args.modules.split(',')
+    unknown = set(args.modules) - set(MODULES)
+    if unknown:
+        parser.error('unknown modules: %s' % (', '.join(sorted(unknown))))
+    random.seed(args.seed)
+
+    rows = Benchmark(args).main()
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(dict(
+                settings={k: v for k, v in vars(args).items() if k != 'output'},
+                results=rows
+            ), f, indent=2)
+    return 1 if any(row['failed'] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,499 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2023 Illumio, Inc. All Rights Reserved.
+
+"""Stand-in PCE HTTP server for local testing and benchmarks.
+
+Implements the subset of the PCE REST API used by this collection: labels,
+pairing profiles, pairing keys, container clusters, workloads, and draft
+IP lists, rule sets and rules, with
+max_results pagination, X-Total-Count headers, async collection jobs and
+workload bulk_create, bulk_update and bulk_delete.
+Draft policy changes are tracked until they are provisioned, and the
+dependency check and provisioning endpoints reject changesets that leave
+out changed IP lists used by the rules of changed rule sets.
+Label usage flags reflect references from pairing profiles and workloads,
+and labels that are in use can't be deleted.
+Request latency and a token bucket rate limit can be configured to model
+a loaded PCE.
+
+Any API key username and secret are accepted. The following endpoints
+control the server and aren't part of the PCE API:
+
+    GET  /_mock/stats     request counts by method and endpoint
+    POST /_mock/reset     remove all objects and reset request counts
+    POST /_mock/seed      add the posted list of objects, each with a
+                          "type" field naming its collection
+    POST /_mock/config    update latency and rate limit settings
+
+Usage:
+    python mock_pce.py --port 8443 --latency 20 --rate-limit 125
+"""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+COLLECTIONS = ['labels', 'pairing_profiles', 'container_clusters', 'workloads', 'ip_lists', 'rule_sets']
+
+# collections of security policy objects, with HREFs under /sec_policy/draft
+SEC_POLICY_COLLECTIONS = ['ip_lists', 'rule_sets']
+
+# the synchronous result cap for collection GETs
+MAX_RESULTS_LIMIT = 500
+
+# the maximum number of objects in a bulk request
+BULK_CHANGE_LIMIT = 1000
+
+ID_SEGMENT = re.compile(r'/(?:\d+|[0-9a-f]{8}-[0-9a-f-]{27}|[0-9a-f]{32})(?=/|$)')
+
+
+class MockPce(object):
+    """Object store and settings shared by all request handler threads."""
+
+    def __init__(self, latency=0.0, jitter=0.0, rate_limit=0.0, burst=None, retry_after=1):
+        self.lock = threading.Lock()
+        self.configure(latency=latency, jitter=jitter, rate_limit=rate_limit, burst=burst, retry_after=retry_after)
+        self.reset()
+
+    def configure(self, latency=None, jitter=None, rate_limit=None, burst=None, retry_after=None, **kwargs):
+        with self.lock:
+            if latency is not None:
+                self.latency = float(latency) / 1000
+            if jitter is not None:
+                self.jitter = float(jitter) / 1000
+            if rate_limit is not None:
+                self.rate_limit = float(rate_limit)
+                self.burst = float(burst or max(self.rate_limit, 1))
+                self.tokens = self.burst
+                self.tokens_updated = time.time()
+            if retry_after is not None:
+                # a negative value omits the Retry-After header from 429 responses
+                self.retry_after = retry_after if retry_after >= 0 else None
+
+    def reset(self):
+        with self.lock:
+            self.objects = {name: {} for name in COLLECTIONS}
+            self.datafiles = {}
+            self.counts = {}
+            self.next_id = 1
+            # HREFs of draft policy objects changed since they were last provisioned
+            self.pending = set()
+            self.policy_version = 0
+
+    def new_id(self):
+        object_id = self.next_id
+        self.next_id += 1
+        return object_id
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def throttle(self):
+        """Takes a token from the rate limit bucket, returning False if the request should be rejected."""
+        with self.lock:
+            if not self.rate_limit:
+                return True
+            now = time.time()
+            self.tokens = min(self.burst, self.tokens + (now - self.tokens_updated) * self.rate_limit)
+            self.tokens_updated = now
+            if self.tokens < 1:
+                self.counts['429'] = self.counts.get('429', 0) + 1
+                return False
+            self.tokens -= 1
+            return True
+
+    def delay(self):
+        latency = self.latency + random.uniform(0, self.jitter)
+        if latency > 0:
+            time.sleep(latency)
+
+    def label_usage(self, href):
+        """Returns usage flags for the label with the given HREF. Called with the lock held."""
+        return {
+            collection[:-1]: any(href in [ref.get('href') for ref in o.get('labels') or []]
+                                 for o in self.objects[collection].values())
+            for collection in ('pairing_profiles', 'workloads')
+        }
+
+    def dependencies(self, hrefs):
+        """Returns the pending IP lists used by rules in the given rule sets
+        that aren't in hrefs. Called with the lock held."""
+        dependencies = []
+        for href in hrefs:
+            rule_set = self.objects['rule_sets'].get(href) or {}
+            required = set()
+            for rule in rule_set.get('rules') or []:
+                for actor in (rule.get('providers') or []) + (rule.get('consumers') or []):
+                    ip_list = (actor.get('ip_list') or {}).get('href')
+                    if ip_list in self.pending and ip_list not in hrefs:
+                        required.add(ip_list)
+            for ip_list in sorted(required):
+                dependencies.append({
+                    'new_dependent_object': {'rule_set': {'href': href}},
+                    'new_required_object': {'ip_list': {'href': ip_list}}
+                })
+        return dependencies
+
+    def seed(self, objects, org_id=1):
+        with self.lock:
+            for o in objects:
+                o = dict(o)
+                collection = o.pop('type')
+                if 'href' not in o:
+                    object_id = str(uuid.uuid4()) if collection == 'container_clusters' else self.new_id()
+                    o['href'] = _href(org_id, collection, object_id)
+                o.setdefault('updated_at', _timestamp())
+                self.objects[collection][o['href']] = o
+
+
+def _href(org_id, collection, object_id):
+    if collection in SEC_POLICY_COLLECTIONS:
+        return '/orgs/%s/sec_policy/draft/%s/%s' % (org_id, collection, object_id)
+    return '/orgs/%s/%s/%s' % (org_id, collection, object_id)
+
+
+def _timestamp():
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime()) + '.%03dZ' % (int(time.time() * 1000) % 1000)
+
+
+def _matches(o, params):
+    for k, v in params.items():
+        if k in ('max_results', 'representation', 'usage'):
+            continue
+        if k == 'labels':
+            # a list of label HREF groups, matching objects with every label in any group
+            hrefs = {ref.get('href') for ref in o.get('labels') or []}
+            if not any(set(group) <= hrefs for group in json.loads(v)):
+                return False
+        elif k.endswith('[gte]'):
+            if str(o.get(k[:-5]) or '') < v:
+                return False
+        elif str(o.get(k)).lower() != v.lower():
+            return False
+    return True
+
+
+class MockPceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    pce = None  # set by make_server
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def _send(self, status, body=None, headers=None):
+        data = b'' if body is None else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, str(v))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status, token, message):
+        return self._send(status, [{'token': token, 'message': message}])
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def _handle(self, method):
+        url = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        # always read the body so keep-alive connections stay in sync
+        body = self._read_body() if method in ('POST', 'PUT') else None
+        pce = self.pce
+
+        if url.path.startswith('/_mock/'):
+            return self._control(method, url.path, body)
+
+        pce.count('%s %s' % (method, ID_SEGMENT.sub('/*', url.path)))
+        if not pce.throttle():
+            headers = {} if pce.retry_after is None else {'Retry-After': pce.retry_after}
+            return self._send(429, [{'token': 'too_many_requests', 'message': 'API rate limit exceeded'}], headers)
+        pce.delay()
+
+        m = re.match(r'^/api/v2(/.*)$', url.path)
+        if not m:
+            return self._error(404, 'not_found', 'Not found')
+        path = m.group(1)
+        if path == '/health':
+            return self._send(200, [{'status': 'normal'}])
+
+        m = re.match(r'^/orgs/(\d+)/(sec_policy/draft/)?(\w+)(?:/([^/]+))?(?:/(\w+))?(?:/([^/]+))?$', path)
+        if not m:
+            return self._error(404, 'not_found', 'Not found')
+        org_id, policy_prefix, collection, object_id, action, child_id = m.groups()
+        if collection == 'sec_policy' and method == 'POST' and not policy_prefix:
+            return self._provision(org_id, body or {})
+        if collection == 'dependencies' and method == 'POST' and policy_prefix:
+            return self._dependencies(body or {})
+        if bool(policy_prefix) != (collection in SEC_POLICY_COLLECTIONS):
+            return self._error(404, 'not_found', 'Not found')
+        if collection == 'settings':
+            return self._send(200, {})
+        if collection == 'jobs' and method == 'GET':
+            return self._job(org_id, object_id)
+        if collection == 'datafiles' and method == 'GET':
+            if object_id not in pce.datafiles:
+                return self._error(404, 'not_found', 'Not found')
+            return self._send(200, pce.datafiles[object_id])
+        if collection not in pce.objects:
+            return self._error(404, 'not_found', 'Not found')
+
+        href = _href(org_id, collection, object_id) if object_id else None
+        if collection == 'rule_sets' and action == 'sec_rules':
+            return self._rule(method, href, child_id, body)
+        if method == 'GET' and not object_id:
+            return self._list(org_id, collection, params)
+        if method == 'GET':
+            return self._get(collection, href)
+        if method == 'POST' and action == 'pairing_key':
+            return self._pairing_key(href)
+        if method == 'PUT' and collection == 'workloads' and object_id in ('bulk_create', 'bulk_update', 'bulk_delete'):
+            return self._bulk(org_id, object_id, body or [])
+        if method == 'POST':
+            return self._create(org_id, collection, body)
+        if method == 'PUT':
+            return self._update(collection, href, body)
+        if method == 'DELETE':
+            return self._delete(collection, href)
+        return self._error(405, 'method_not_allowed', 'Method not allowed')
+
+    def _control(self, method, path, body):
+        pce = self.pce
+        if path == '/_mock/stats':
+            with pce.lock:
+                return self._send(200, dict(pce.counts))
+        if method != 'POST':
+            return self._error(405, 'method_not_allowed', 'Method not allowed')
+        if path == '/_mock/reset':
+            pce.reset()
+        elif path == '/_mock/seed':
+            pce.seed(body or [])
+        elif path == '/_mock/config':
+            pce.configure(**(body or {}))
+        else:
+            return self._error(404, 'not_found', 'Not found')
+        return self._send(200, {})
+
+    def _list(self, org_id, collection, params):
+        pce = self.pce
+        with pce.lock:
+            results = [o for o in pce.objects[collection].values() if _matches(o, params)]
+            if collection == 'labels' and params.get('usage') == 'true':
+                results = [dict(o, usage=pce.label_usage(o['href'])) for o in results]
+
+        if self.headers.get('Prefer') == 'respond-async':
+            job_id = uuid.uuid4().hex
+            with pce.lock:
+                pce.datafiles[job_id] = results
+            return self._send(202, None, {'Location': '/orgs/%s/jobs/%s' % (org_id, job_id), 'Retry-After': 0})
+
+        max_results = int(params.get('max_results', MAX_RESULTS_LIMIT))
+        if max_results > MAX_RESULTS_LIMIT:
+            return self._error(406, 'invalid_max_results', 'max_results may not exceed %d' % (MAX_RESULTS_LIMIT))
+        return self._send(200, results[:max_results], {'X-Total-Count': len(results)})
+
+    def _job(self, org_id, job_id):
+        if job_id not in self.pce.datafiles:
+            return self._error(404, 'not_found', 'Not found')
+        return self._send(200, {
+            'href': '/orgs/%s/jobs/%s' % (org_id, job_id),
+            'status': 'done',
+            'result': {'href': '/orgs/%s/datafiles/%s' % (org_id, job_id)}
+        })
+
+    def _get(self, collection, href):
+        with self.pce.lock:
+            o = self.pce.objects[collection].get(href)
+        if o is None:
+            return self._error(404, 'not_found', 'Not found')
+        return self._send(200, o)
+
+    def _create(self, org_id, collection, body):
+        pce = self.pce
+        body = body or {}
+        with pce.lock:
+            if collection == 'labels':
+                if any(o['key'] == body.get('key') and o['value'] == body.get('value') for o in pce.objects['labels'].values()):
+                    return self._error(406, 'label_not_unique', 'Label key and value must be unique')
+                body.setdefault('deleted', False)
+            object_id = str(uuid.uuid4()) if collection == 'container_clusters' else pce.new_id()
+            o = dict(body, href=_href(org_id, collection, object_id), updated_at=_timestamp())
+            if collection == 'rule_sets':
+                o.setdefault('rules', [])
+            pce.objects[collection][o['href']] = o
+            if collection in SEC_POLICY_COLLECTIONS:
+                pce.pending.add(o['href'])
+        if collection == 'container_clusters':
+            o = dict(o, container_cluster_token=uuid.uuid4().hex)
+        return self._send(201, o)
+
+    def _update(self, collection, href, body):
+        with self.pce.lock:
+            o = self.pce.objects[collection].get(href)
+            if o is None:
+                return self._error(404, 'not_found', 'Not found')
+            o.update(body or {}, updated_at=_timestamp())
+            if collection in SEC_POLICY_COLLECTIONS:
+                self.pce.pending.add(href)
+        return self._send(204)
+
+    def _delete(self, collection, href):
+        with self.pce.lock:
+            if href not in self.pce.objects[collection]:
+                return self._error(404, 'not_found', 'Not found')
+            if collection == 'labels' and any(self.pce.label_usage(href).values()):
+                return self._error(406, 'label_in_use', 'Label is in use and cannot be deleted')
+            del self.pce.objects[collection][href]
+            if collection in SEC_POLICY_COLLECTIONS:
+                self.pce.pending.add(href)
+        return self._send(204)
+
+    def _rule(self, method, rule_set_href, rule_id, body):
+        pce = self.pce
+        with pce.lock:
+            rule_set = pce.objects['rule_sets'].get(rule_set_href)
+            if rule_set is None:
+                return self._error(404, 'not_found', 'Not found')
+            rules = rule_set['rules']
+            if method == 'GET' and not rule_id:
+                return self._send(200, rules)
+            if method == 'POST' and not rule_id:
+                rule = dict(body or {}, href='%s/sec_rules/%s' % (rule_set_href, pce.new_id()), updated_at=_timestamp())
+                rules.append(rule)
+                pce.pending.add(rule_set_href)
+                return self._send(201, rule)
+            href = '%s/sec_rules/%s' % (rule_set_href, rule_id)
+            rule = next((r for r in rules if r['href'] == href), None)
+            if rule is None:
+                return self._error(404, 'not_found', 'Not found')
+            if method == 'GET':
+                return self._send(200, rule)
+            if method == 'PUT':
+                rule.update(body or {}, updated_at=_timestamp())
+            elif method == 'DELETE':
+                rules.remove(rule)
+            else:
+                return self._error(405, 'method_not_allowed', 'Method not allowed')
+            pce.pending.add(rule_set_href)
+        return self._send(204)
+
+    def _change_subset(self, body):
+        return [ref['href'] for refs in (body.get('change_subset') or {}).values() for ref in refs]
+
+    def _dependencies(self, body):
+        hrefs = self._change_subset(body)
+        with self.pce.lock:
+            return self._send(200, self.pce.dependencies(hrefs))
+
+    def _provision(self, org_id, body):
+        pce = self.pce
+        hrefs = self._change_subset(body)
+        with pce.lock:
+            if not any(href in pce.pending for href in hrefs):
+                return self._error(406, 'nothing_to_provision', 'No pending changes to provision')
+            if pce.dependencies(hrefs):
+                return self._error(406, 'provision_dependency_error', 'Changes depend on unprovisioned objects')
+            pce.pending.difference_update(hrefs)
+            pce.policy_version += 1
+            version = pce.policy_version
+        return self._send(201, {
+            'href': '/orgs/%s/sec_policy/%d' % (org_id, version),
+            'version': version,
+            'commit_message': body.get('update_description'),
+            'workloads_affected': 0
+        })
+
+    def _bulk(self, org_id, method, body):
+        if len(body) > BULK_CHANGE_LIMIT:
+            return self._error(406, 'too_many_objects', 'Bulk requests may not exceed %d objects' % (BULK_CHANGE_LIMIT))
+        results = []
+        with self.pce.lock:
+            workloads = self.pce.objects['workloads']
+            for o in body:
+                href = o.get('href')
+                if method == 'bulk_create':
+                    if not o.get('name') and not o.get('hostname'):
+                        results.append({'status': 'validation_failure', 'token': 'name_or_hostname_required',
+                                        'message': 'Workload name or hostname is required'})
+                        continue
+                    href = '/orgs/%s/workloads/%s' % (org_id, uuid.uuid4())
+                    workloads[href] = dict(o, href=href, managed=False, updated_at=_timestamp())
+                    results.append({'href': href, 'status': 'created'})
+                elif href not in workloads:
+                    results.append({'href': href, 'status': 'not_found', 'token': 'not_found', 'message': 'Not found'})
+                elif method == 'bulk_update':
+                    workloads[href].update(o, updated_at=_timestamp())
+                    results.append({'href': href, 'status': 'updated'})
+                else:
+                    del workloads[href]
+        if method == 'bulk_delete':
+            # only workloads that could not be deleted are listed
+            results = [dict(r, errors=[{'token': r['token'], 'message': r['message']}]) for r in results]
+        return self._send(200, results)
+
+    def _pairing_key(self, href):
+        with self.pce.lock:
+            exists = href in self.pce.objects['pairing_profiles']
+        if not exists:
+            return self._error(404, 'not_found', 'Not found')
+        return self._send(200, {'activation_code': uuid.uuid4().hex})
+
+
+def make_server(host='127.0.0.1', port=0, **kwargs):
+    """Creates a mock PCE server. Use port 0 to bind to a free port, and
+    server.server_address to find it."""
+    handler = type('Handler', (MockPceHandler,), {'pce': MockPce(**kwargs)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8443, help='port to listen on')
+    parser.add_argument('--latency', type=float, default=0, help='added latency for each API request, in milliseconds')
+    parser.add_argument('--jitter', type=float, default=0, help='maximum random latency added on top of --latency, in milliseconds')
+    parser.add_argument('--rate-limit', type=float, default=0, help='API requests allowed per second, 0 for no limit')
+    parser.add_argument('--burst', type=float, default=None, help='rate limit bucket size, defaults to --rate-limit')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After value for 429 responses, -1 to omit the header')
+    args = parser.parse_args()
+
+    server = make_server(
+        args.host, args.port, latency=args.latency, jitter=args.jitter,
+        rate_limit=args.rate_limit, burst=args.burst, retry_after=args.retry_after
+    )
+    print('Mock PCE listening on http://%s:%d' % server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
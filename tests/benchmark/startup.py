@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2023 Illumio, Inc. All Rights Reserved.
+
+"""Module startup benchmark with a regression budget.
+
+Builds the AnsiballZ payload for each module by running it once through
+ansible-playbook with in-process execution disabled and remote files kept.
+Then measures:
+
+    payload_bytes    size of the AnsiballZ payload sent to the host
+    cold_start_ms    median wall time to run the payload in a new
+                     interpreter against the mock PCE, including imports
+                     and a no-op API round trip
+    import_ms        time spent importing the illumio SDK, ansible's
+                     module_utils and the collection's own code
+
+Results are compared against startup_budget.json. The script exits with a
+non-zero status if payload_bytes or cold_start_ms exceed the budget by more
+than its tolerance. Use --update to record new budget values after an
+intended change.
+
+Usage:
+    python tests/benchmark/startup.py
+    python tests/benchmark/startup.py --runs 20 --update
+"""
+
+from __future__ import absolute_import, division, print_function
+__metaclass__ = type
+
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.request import Request, urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchmark import MODULES, collection_path, module_args, percentile, seed_objects  # noqa: E402
+from mock_pce import make_server  # noqa: E402
+
+BUDGET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_budget.json')
+
+IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| *(\S+)$')
+
+
+def import_times(stderr):
+    """Sums -X importtime output into SDK, ansible and collection import times in milliseconds."""
+    totals = dict(illumio=0, ansible=0, collection=0)
+    for line in stderr.splitlines():
+        m = IMPORT_TIME.match(line)
+        if not m:
+            continue
+        self_us, cumulative_us, name = int(m.group(1)), int(m.group(2)), m.group(3)
+        if name == 'illumio':
+            totals['illumio'] += cumulative_us
+        elif name == 'ansible.module_utils.basic':
+            totals['ansible'] += cumulative_us
+        elif name.startswith('ansible_collections.illumio.'):
+            # self time only, as the SDK and ansible imports are counted above
+            totals['collection'] += self_us
+    return {k: round(v / 1000, 1) for k, v in totals.items()}
+
+
+class StartupBenchmark(object):
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix='illumio-startup-')
+        self.collections_path = collection_path(self.workdir)
+        self.server = make_server(port=0)
+        self.port = self.server.server_address[1]
+
+    def _seed(self):
+        req = Request(
+            'http://127.0.0.1:%d/_mock/seed' % (self.port),
+            data=json.dumps(seed_objects(1)).encode('utf-8'),
+            headers={'Content-Type': 'application/json'}
+        )
+        urlopen(req).close()
+
+    def build_payload(self, module):
+        """Runs the module once with ansible-playbook, keeping the AnsiballZ payload."""
+        remote_tmp = os.path.join(self.workdir, 'tmp-%s' % (module))
+        task_args = dict(
+            module_args(module, 0),
+            pce_hostname='http://127.0.0.1',
+            pce_port=self.port,
+            api_key_username='benchmark',
+            api_key_secret='benchmark'
+        )
+        playbook = os.path.join(self.workdir, '%s.yml' % (module))
+        with open(playbook, 'w') as f:
+            # JSON is valid YAML
+            json.dump([{
+                'hosts': 'localhost',
+                'gather_facts': False,
+                'vars': {'illumio_pce_in_process': False, 'ansible_python_interpreter': sys.executable},
+                'tasks': [{'illumio.core.%s' % (module): task_args}]
+            }], f)
+
+        env = dict(
+            os.environ,
+            ANSIBLE_COLLECTIONS_PATH=self.collections_path,
+            ANSIBLE_KEEP_REMOTE_FILES='1',
+            ANSIBLE_REMOTE_TMP=remote_tmp,
+            ANSIBLE_LOCALHOST_WARNING='false',
+            ANSIBLE_PIPELINING='false'
+        )
+        proc = subprocess.run(
+            ['ansible-playbook', '-i', 'localhost,', '-c', 'local', playbook],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env, cwd=self.workdir
+        )
+        payloads = glob.glob(os.path.join(remote_tmp, '*', 'AnsiballZ_%s.py' % (module)))
+        if proc.returncode or not payloads:
+            raise RuntimeError('Failed to build %s payload:\n%s' % (module, proc.stdout.decode('utf-8', 'replace')))
+        return payloads[0]
+
+    def run_payload(self, payload, importtime=False):
+        cmd = [sys.executable] + (['-X', 'importtime'] if importtime else []) + [payload]
+        start = time.monotonic()
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=self.workdir)
+        elapsed = time.monotonic() - start
+        result = json.loads(proc.stdout.decode('utf-8').strip().splitlines()[-1])
+        if result.get('failed'):
+            raise RuntimeError('Module run failed: %s' % (result.get('msg')))
+        return elapsed, proc.stderr.decode('utf-8', 'replace')
+
+    def measure(self, module):
+        payload = self.build_payload(module)
+        self.run_payload(payload)  # warm the filesystem cache
+        times = [self.run_payload(payload)[0] for _ in range(self.args.runs)]
+        _, stderr = self.run_payload(payload, importtime=True)
+        return dict(
+            module=module,
+            payload_bytes=os.path.getsize(payload),
+            cold_start_ms=round(percentile(times, 50) * 1000, 1),
+            cold_start_p90_ms=round(percentile(times, 90) * 1000, 1),
+            import_ms=import_times(stderr)
+        )
+
+    def interpreter_ms(self):
+        times = []
+        for _ in range(self.args.runs):
+            start = time.monotonic()
+            subprocess.run([sys.executable, '-c', 'pass'])
+            times.append(time.monotonic() - start)
+        return round(percentile(times, 50) * 1000, 1)
+
+    def main(self):
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            self._seed()
+            return self.interpreter_ms(), [self.measure(m) for m in self.args.modules]
+        finally:
+            self.server.shutdown()
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def check_budget(rows, budget):
+    """Returns a list of budget violations."""
+    tolerance = budget.get('tolerance', 0)
+    violations = []
+    for row in rows:
+        limits = budget.get('modules', {}).get(row['module'])
+        if not limits:
+            violations.append('%s: no budget recorded' % (row['module']))
+            continue
+        for metric in ('payload_bytes', 'cold_start_ms'):
+            limit = limits[metric] * (1 + tolerance)
+            if row[metric] > limit:
+                violations.append('%s: %s %s exceeds budget %s (+%d%%)' % (
+                    row['module'], metric, row[metric], limits[metric], tolerance * 100
+                ))
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modules', default=','.join(MODULES), help='comma-separated modules to measure')
+    parser.add_argument('--runs', type=int, default=10, help='cold start runs for each module')
+    parser.add_argument('--budget', default=BUDGET_PATH, help='path of the budget JSON file')
+    parser.add_argument('--update', action='store_true', help='write measured values to the budget file')
+    parser.add_argument('--output', help='path of a JSON file to write results to')
+    args = parser.parse_args()
+    args.modules = args.modules.split(',')
+
+    interpreter_ms, rows = StartupBenchmark(args).main()
+
+    print('interpreter startup: %.1f ms' % (interpreter_ms))
+    print('%-18s %14s %14s %10s %12s %12s %14s' % (
+        'module', 'payload_bytes', 'cold_start_ms', 'p90_ms', 'illumio_ms', 'ansible_ms', 'collection_ms'
+    ))
+    for row in rows:
+        print('%-18s %14d %14.1f %10.1f %12.1f %12.1f %14.1f' % (
+            row['module'], row['payload_bytes'], row['cold_start_ms'], row['cold_start_p90_ms'],
+            row['import_ms']['illumio'], row['import_ms']['ansible'], row['import_ms']['collection']
+        ))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(dict(interpreter_ms=interpreter_ms, results=rows), f, indent=2)
+
+    if args.update:
+        budget = {}
+        if os.path.exists(args.budget):
+            with open(args.budget) as f:
+                budget = json.load(f)
+        budget.setdefault('tolerance', 0.25)
+        modules = budget.setdefault('modules', {})
+        for row in rows:
+            modules[row['module']] = dict(payload_bytes=row['payload_bytes'], cold_start_ms=row['cold_start_ms'])
+        with open(args.budget, 'w') as f:
+            json.dump(budget, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('Budget written to %s' % (args.budget))
+        return 0
+
+    with open(args.budget) as f:
+        violations = check_budget(rows, json.load(f))
+    for v in violations:
+        print('BUDGET EXCEEDED: %s' % (v))
+    return 1 if violations else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())